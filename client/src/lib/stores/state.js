@@ -31,8 +31,8 @@ export const selected_module = writable(null);
 export const selected_target = writable(null);
 export const selected_match = writable(null);
 export const modules = writable([]);
-export const matches = writable([]);
-export const filteredMatches = derived([matches, selected_target], ([$matches, $selected_target]) => { return $matches.length==0 ? [] : $matches.filter(r => r['?target'] == $selected_target)})
+// matches for the selected target only, paged from /get-target-matches; the full match list stays on the server
+export const filteredMatches = writable([]);
 // export const targets = derived(matches, ($matches) => new Set($matches.map((match) => match['?target'])))
 export const targets = writable([])
 export const diagram = writable({})
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""Scaling of module matching on synthetic buildings (lib.synthetic_building).
+
+For each model size, loads a generated building into the same dataset layout the server uses and times, per logic
+option, find_matches and the SPARQL queries it runs (whichever aggregation it defaults to; recorded through
+lib.instrumentation), then per module match(), the sort + MatchJSONEncoder round trip the /get-module-matches route
+does, target lookup and optionally generate_tidy_tree on a few matches. One JSON line per measurement is appended to
+--out so runs can be compared across commits.
+
+Queries whose rows are folded as they stream (select_rows) count the folding in their time, so postprocess_s is what
+find_matches spends outside the queries.
+
+  python server/benchmarks/bench_matching.py --sizes 1e3 1e4 1e5 1e6 --out bench_matching.jsonl
+  python server/benchmarks/bench_matching.py --sizes 5e6 --modules Econ --feeds-depth 3
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import datetime
+import pandas as pd
+import rdflib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lib.modules as LogicModules
+from helpers import MatchJSONEncoder, match_records
+from lib.diagram_generator import generate_tidy_tree
+from lib.graph_model import init_graph_model, load_building, match_targets
+from lib.instrumentation import request_stages
+from lib.synthetic_building import write_building, params_for_triples
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - start, out)
+
+class Recorder(object):
+    def __init__(self, path:str, run_meta:dict):
+        self.path = path
+        self.run_meta = run_meta
+
+    def __call__(self, **row):
+        row = {**self.run_meta, **row}
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(row, default=str) + "\n")
+        return row
+
+def bench_size(ds, g_ns, target_triples:int, modules:list, building_params:dict, diagrams:int, record:Recorder):
+    params = params_for_triples(target_triples, **building_params)
+
+    # generate to disk and load as N-Triples, same path as an uploaded model minus the HTTP layer
+    with tempfile.NamedTemporaryFile("w", suffix=".nt", delete=False) as f:
+        t_gen, n_triples = timed(lambda: write_building(f, **params))
+    try:
+        t_load, _ = timed(lambda: load_building(ds, f.name, format="nt", g_ns=g_ns))
+    finally:
+        os.remove(f.name)
+
+    print(f"\n== {n_triples:,} triples ({params['n_ahus']} AHUs)  generate {t_gen:.2f} s  load {t_load:.2f} s")
+    record(stage="load", triples=n_triples, params=params, generate_s=t_gen, load_s=t_load)
+
+    for m in modules:
+        # per logic option: find_matches, and the queries it ran (query helpers record them on the current request)
+        for logic_option in m.logic_modules:
+            with request_stages("bench_matching") as req:
+                t_find, (_, df_option) = timed(lambda: logic_option.find_matches(ds))
+            t_sparql, rows = sum(q['seconds'] for q in req.queries), sum(q['rows'] for q in req.queries)
+            print(f"  {logic_option.__name__:>48}: sparql {t_sparql:8.3f} s  queries {len(req.queries):>3}  rows {rows:>9,}  find_matches {t_find:8.3f} s  matches {len(df_option):>7,}")
+            record(stage="logic_option", triples=n_triples, module=m.name, logic=logic_option.__name__, queries=len(req.queries),
+                   sparql_s=t_sparql, rows=rows, find_matches_s=t_find, postprocess_s=t_find - t_sparql, matches=len(df_option))
+
+        # per module: what /get-module-matches does
+        t_match, (_, df_match) = timed(lambda: m.match(ds))
+        def serialize():
+            df_match.sort_values(by=["?target", "?option"], inplace=True)
+            return json.loads(json.dumps(match_records(df_match), cls=MatchJSONEncoder))
+        t_serialize, records = timed(serialize)
+        t_targets, targets = timed(lambda: match_targets(ds, df_match))
+
+        t_diagram = None
+        if diagrams and records:
+            def draw():
+                for match in records[:diagrams]:
+                    generate_tidy_tree(m.get_match_diagram_graph(ds, match).graph, match)
+            t_diagram = timed(draw)[0] / min(diagrams, len(records))
+
+        print(f"  {m.name:>48}: match {t_match:8.3f} s  serialize {t_serialize:8.3f} s  targets {t_targets:8.3f} s ({len(targets):,})"
+              + (f"  diagram {t_diagram:.3f} s/match" if t_diagram is not None else ""))
+        record(stage="module", triples=n_triples, module=m.name, match_s=t_match, serialize_s=t_serialize, targets_s=t_targets,
+               diagram_s=t_diagram, matches=len(records), targets=len(targets),
+               payload_bytes=len(json.dumps({'matches': records, 'targets': targets})))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e3, 1e4, 1e5, 1e6], help="target triple counts")
+    parser.add_argument("--modules", nargs="*", help="substrings of module names to run; all when omitted")
+    parser.add_argument("--vavs-per-ahu", type=int, default=20)
+    parser.add_argument("--feeds-depth", type=int, default=2)
+    parser.add_argument("--dampers-per-vav", type=int, default=1)
+    parser.add_argument("--points-per-equipment", type=int, default=4)
+    parser.add_argument("--valves-per-ahu", type=int, default=2)
+    parser.add_argument("--diagrams", type=int, default=0, help="matches per module to run generate_tidy_tree on")
+    parser.add_argument("--out", help="JSON lines file results are appended to")
+    parser.add_argument("--static-dir", default="./server/static")
+    args = parser.parse_args()
+
+    modules = [getattr(LogicModules, m).MODULE for m in LogicModules.__all__]
+    if args.modules:
+        modules = [m for m in modules if any(s.lower() in m.name.lower() for s in args.modules)]
+
+    building_params = dict(vavs_per_ahu=args.vavs_per_ahu, feeds_depth=args.feeds_depth, dampers_per_vav=args.dampers_per_vav,
+                           points_per_equipment=args.points_per_equipment, valves_per_ahu=args.valves_per_ahu)
+    record = Recorder(args.out, {
+        'run': datetime.datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(), 'rdflib': rdflib.__version__, 'pandas': pd.__version__, 'machine': platform.machine(),
+    })
+
+    t_init, (ds, g_ns) = timed(lambda: init_graph_model(args.static_dir))
+    print(f"ontologies loaded in {t_init:.2f} s")
+    for size in args.sizes:
+        bench_size(ds, g_ns, int(size), modules, building_params, args.diagrams, record)
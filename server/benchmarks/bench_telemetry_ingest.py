@@ -0,0 +1,70 @@
+"""Throughput of the long -> wide telemetry pipeline used by AnalyticsHelper.get_ts_data.
+
+Compares the previous pandas path (to_datetime without format, pivot_table(mean), resample().last()) with
+lib.telemetry_ingest (ingest + to_wide) on synthetic remote store rows, and checks both produce the same frame.
+
+  python server/benchmarks/bench_telemetry_ingest.py --rows 10000000 --sensors 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib.telemetry_ingest import ingest, to_wide
+
+def make_rows(n_rows:int, n_sensors:int, seed:int=0) -> pd.DataFrame:
+    # same shape as the query engine returns: string ids, string local timestamps, string values
+    rng = np.random.default_rng(seed)
+    n_ts = max(n_rows // n_sensors, 1)
+    ts = pd.date_range("2023-01-01", periods=n_ts, freq="1T").strftime("%Y-%m-%dT%H:%M:%S").to_numpy()
+    sensor_ids = np.array([f"op-{i:05d}" for i in range(n_sensors)], dtype=object)
+
+    return pd.DataFrame({
+        'ObjectPropertyId': sensor_ids[rng.integers(0, n_sensors, n_rows)],
+        'TimestampLocal': ts[np.sort(rng.integers(0, n_ts, n_rows))],
+        'Value': np.round(rng.random(n_rows) * 100, 3).astype(str).astype(object),
+    })
+
+def legacy(raw_df:pd.DataFrame, resample:str) -> pd.DataFrame:
+    raw_df = raw_df.copy()
+    raw_df.index = pd.to_datetime(raw_df['TimestampLocal'])
+    raw_df['Value'] = raw_df['Value'].apply(pd.to_numeric)
+    df_pivot = raw_df.drop(['TimestampLocal'], axis=1).pivot_table(columns=['ObjectPropertyId'], values=['Value'], index=raw_df.index, aggfunc='mean')
+    df_pivot.columns = df_pivot.columns.get_level_values(1)
+    return df_pivot.resample(resample).last()
+
+def fast(raw_df:pd.DataFrame, resample:str) -> pd.DataFrame:
+    return to_wide(ingest(raw_df), resample)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--sensors", type=int, default=500)
+    parser.add_argument("--resample", default="15T")
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the new pipeline (legacy needs several GB at 10M rows)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} rows for {args.sensors} sensors...")
+    raw_df = make_rows(args.rows, args.sensors)
+
+    results = {}
+    results['ingest+to_wide'] = timed(fast, raw_df, args.resample)
+    if not args.skip_legacy:
+        results['pivot_table'] = timed(legacy, raw_df, args.resample)
+
+    for name, (_, elapsed) in results.items():
+        print(f"{name:>16}: {elapsed:8.2f} s  {args.rows / elapsed / 1e6:8.2f} M rows/s")
+
+    if 'pivot_table' in results:
+        a, b = results['ingest+to_wide'][0], results['pivot_table'][0]
+        same = a.shape == b.shape and np.allclose(a.to_numpy(), b.to_numpy(), equal_nan=True)
+        print(f"speedup: {results['pivot_table'][1] / results['ingest+to_wide'][1]:.1f}x ; outputs equal: {same}")
@@ -0,0 +1,67 @@
+"""End-to-end throughput of AnalyticsHelper.get_ts_data against the bundled LocalQueryEngine.
+
+Runs the same fetch (fixed clock, seeded synthetic data) through the plain path, compact mode, a cold and warm
+TelemetryCache and rollup-backed resampling, and reports wall time, rows/s and engine round trips for each.
+
+  python server/benchmarks/bench_telemetry_pipeline.py --sensors 200 --ago 7d --interval 1T --latency 0.2
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib.analytics_helper import AnalyticsHelper
+from lib.local_query_engine import LocalQueryEngine, SyntheticTelemetry
+from lib.telemetry_cache import TelemetryCache
+from lib.telemetry_rollups import TelemetryRollups
+
+NOW = "2023-06-01T00:00:00"
+PROFILES = ('DAP', 'DAPSP', 'DAMPER_POS', 'OAT', 'OA_ENTHALPY', 'RA_ENTHALPY', 'MAT', 'DAT')
+
+def run(name, engine, fn):
+    before = dict(engine.stats)
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    rows = engine.stats['rows'] - before['rows']
+    queries = engine.stats['queries'] - before['queries']
+    print(f"{name:>24}: {elapsed:8.3f} s  remote rows {rows:>11,}  queries {queries:>3}  pivot {tuple(out['pivot'].shape)}")
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--ago", default="7d")
+    parser.add_argument("--interval", default="1T", help="synthetic sample density")
+    parser.add_argument("--latency", type=float, default=0.0, help="fixed seconds per engine query")
+    parser.add_argument("--latency-per-1k", type=float, default=0.0, help="seconds per 1000 rows returned")
+    args = parser.parse_args()
+
+    sensor_ids = [f"op-{i:05d}" for i in range(args.sensors)]
+    telemetry = SyntheticTelemetry(profiles={s: PROFILES[i % len(PROFILES)] for i, s in enumerate(sensor_ids)}, interval=args.interval)
+    engine = LocalQueryEngine(telemetry, latency=args.latency, latency_per_1k_rows=args.latency_per_1k, now=NOW)
+    window = dict(startTs=engine.now - pd.Timedelta(args.ago), endTs=engine.now)
+
+    run("get_ts_data", engine, lambda: AnalyticsHelper.get_ts_data(sensor_ids, "local", engine, **window))
+    compact = run("compact, raw dropped", engine, lambda: AnalyticsHelper.get_ts_data(sensor_ids, "local", engine, compact=True, raw_mode="drop", **window))
+    print(f"{'':>24}  memory {compact['memory']}")
+
+    cache_dir = tempfile.mkdtemp(prefix="telemetry_cache_")
+    try:
+        cache = TelemetryCache(cache_dir, now=lambda: engine.now)
+        run("cache cold", engine, lambda: AnalyticsHelper.get_ts_data(sensor_ids, "local", engine, cache=cache, **window))
+        run("cache warm", engine, lambda: AnalyticsHelper.get_ts_data(sensor_ids, "local", engine, cache=cache, **window))
+    finally:
+        shutil.rmtree(cache_dir)
+
+    rollups = TelemetryRollups()
+    ts_data = run("with rollups", engine, lambda: AnalyticsHelper.get_ts_data(sensor_ids, "local", engine, rollups=rollups, **window))
+    for resolution in ("15T", "1H", "1D"):
+        start = time.perf_counter()
+        pivot = AnalyticsHelper.resample_ts_data(ts_data, resolution)['pivot']
+        print(f"{'resample ' + resolution:>24}: {time.perf_counter() - start:8.3f} s  pivot {tuple(pivot.shape)}")
@@ -12,18 +12,30 @@ def msg(msg_type:MsgType, msg:str, **kwargs):
         "meta": kwargs
     }
 
-def data(*args, meta={}, **kwargs):
+def data(*args, meta=None, **kwargs):
+    # fresh meta per response; routes add to it after the fact
+    meta = {} if meta is None else meta
     if len(args)==1:
         return { "data": args[0], "meta": meta }
     elif args: print("Too many args provided. Provide one arg, or a set of kwargs")
     else:
         return { "data": kwargs, "meta": meta }
 
+def match_records(df) -> list:
+    """
+    df.to_dict(orient='records') for a match frame, with float columns holding only whole numbers as ints. A module's
+    NaN fill leaves a column float when none of the frame's rows bind it (e.g. a rematch of a few targets) and object
+    with int 0 when some do, and the result version hashes the JSON, so both have to serialise the same.
+    """
+    ints = {c: df[c].astype('int64') for c in df.select_dtypes('float').columns if df[c].notna().all() and (df[c] % 1 == 0).all()}
+    return df.assign(**ints).to_dict(orient='records')
+
 # Special JSON encoder to handle SET and UUID conversion from Pandas
 class MatchJSONEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, set):
-            return list(obj)
+            # sorted so the same match always serialises the same (result versions / deltas compare the JSON)
+            return sorted(obj, key=str)
         elif isinstance(obj, UUID):
             return str(obj)
         elif math.isnan(obj):
@@ -1,10 +1,17 @@
+import os
+import uuid
 import rdflib
 import pandas as pd
 
+from .telemetry_cache import TelemetryCache
+from .telemetry_rollups import TelemetryRollups
+from .telemetry_ingest import ingest, to_wide
+from .sensor_index import SensorIdIndex, MissingSensorIdsError, HAS_OBJECT_PROPERTY_ID
+
 class AnalyticsHelper(object):
 
     @classmethod
-    def get_switch_sensor_ids(self, g:rdflib.Graph, module_match_record):
+    def get_switch_sensor_ids(self, g:rdflib.Graph, module_match_record, index:SensorIdIndex=None):
 
         # get all variable columns "m_"
         sensor_vars = module_match_record.filter(regex="^m_").fillna("")
@@ -13,59 +20,153 @@ class AnalyticsHelper(object):
         # print(sensor_vars)
 
         # process each sensor to get switch ID
-        data = {}
-        for idx, v in sensor_vars.items():
-            id_res = list(g.objects(rdflib.URIRef(v), rdflib.URIRef("https://switchautomation.com/schemas/BrickExtension#hasObjectPropertyId")))[0].toPython()
-            data[str(idx)] = id_res
-        
-        return data
+        id_map = self.rdfModelQueryFunc(list(sensor_vars.values), graph=g, index=index)
+        return { str(idx): id_map[v] for idx, v in sensor_vars.items() }
     
     # SAME AS get_switch_sensor_ids, just a little better :)
     @staticmethod
     def rdfModelQueryFunc(
         entities:list,
-        graph:rdflib.Graph, 
-        predicate:rdflib.URIRef=rdflib.URIRef("https://switchautomation.com/schemas/BrickExtension#hasObjectPropertyId")
+        graph:rdflib.Graph=None, 
+        predicate:rdflib.URIRef=HAS_OBJECT_PROPERTY_ID,
+        index:SensorIdIndex=None,
+        raise_missing:bool=True
     ):
-        output = {}
-        for ent in entities:
-            id_res = list(graph.objects(rdflib.URIRef(ent), predicate))[0].toPython()
-            output[ent] = id_res
+        """
+        Resolve entities to telemetry ids, from the prebuilt index when given, otherwise one lookup per entity in graph.
+        Entities with no id are collected and reported together (MissingSensorIdsError) instead of failing on the first.
+        """
+        if index is not None:
+            output, missing = index.resolve(entities)
+        else:
+            output, missing = {}, []
+            for ent in entities:
+                id_res = next(graph.objects(rdflib.URIRef(ent), predicate), None)
+                if id_res is None: missing.append(str(ent))
+                else: output[str(ent)] = id_res.toPython()
+
+        if missing:
+            if raise_missing: raise MissingSensorIdsError(missing)
+            print(f"No ObjectPropertyId found for {len(missing)} entities: {missing}")
         
         return output
 
+    @staticmethod
+    def get_module_sensor_ids(df_match:pd.DataFrame, index:SensorIdIndex) -> tuple:
+        """
+        Resolve the telemetry ids for every point in a module's matches in a single in-memory pass.
+        RETURNS: ( {entity: ObjectPropertyId}, [entities with no id] )
+        """
+        return index.resolve_matches(df_match)
+
     @classmethod
     def _get_data_for_sensors(self, sensorIds:list, apiProjectId:str, queryEngine, ago='2d', startTs=None, endTs=None):
         str_format = [f'"{w}"' for w in sensorIds]
-        query = f"Timeseries | where ObjectPropertyId in ({', '.join(str_format)}) | where TimestampLocal > ago({ago}) | project ObjectPropertyId, TimestampLocal, Value"
+        # explicit range takes precedence over the relative ago() window
+        if startTs is not None and endTs is not None:
+            time_filter = f"TimestampLocal between (datetime({pd.Timestamp(startTs).isoformat()}) .. datetime({pd.Timestamp(endTs).isoformat()}))"
+        else:
+            time_filter = f"TimestampLocal > ago({ago})"
+        query = f"Timeseries | where ObjectPropertyId in ({', '.join(str_format)}) | where {time_filter} | project ObjectPropertyId, TimestampLocal, Value"
 
 
         return queryEngine.query(apiProjectId, query)
     
     @classmethod
-    def get_ts_data(self, sensorIds:list, apiProjectId:str, queryEngine, ago="2d", startTs=None, endTs=None, resample="15T"):
-        raw_df = self._get_data_for_sensors(sensorIds, apiProjectId, queryEngine, ago, startTs, endTs)
-        # process
-        raw_df.index = pd.to_datetime(raw_df['TimestampLocal'])
-        raw_df['Value'].apply(pd.to_numeric)
-        # pivot and resample
-        df_pivot = raw_df.drop(['TimestampLocal'], axis=1).pivot_table(columns=['ObjectPropertyId'], values=['Value'], index=raw_df.index, aggfunc='mean')
-        df_pivot.columns = df_pivot.columns.get_level_values(1)
-        df_pivot = df_pivot.resample(resample).last()
+    def _get_cached_data_for_sensors(self, sensorIds:list, apiProjectId:str, queryEngine, cache:TelemetryCache, ago='2d', startTs=None, endTs=None):
+        # resolve the relative window to absolute bounds so it can be compared against the ranges held by the cache
+        if startTs is None or endTs is None:
+            endTs = cache.now() if cache.now else pd.Timestamp.utcnow().tz_localize(None)
+            startTs = endTs - pd.Timedelta(ago)
+
+        fetch = lambda ids, start, end: self._get_data_for_sensors(ids, apiProjectId, queryEngine, startTs=start, endTs=end)
+        return cache.get(sensorIds, startTs, endTs, fetch, project=apiProjectId)
+    
+    @classmethod
+    def get_ts_data(self, sensorIds:list, apiProjectId:str, queryEngine, ago="2d", startTs=None, endTs=None, resample="15T", cache:TelemetryCache=None, rollups:TelemetryRollups=None, compact=False, raw_mode="keep", spill_dir="./server/cache/raw"):
+        """
+        cache: optional TelemetryCache; when provided only the parts of the window not already held locally are fetched from the queryEngine.
+        rollups: optional TelemetryRollups; the fetched rows are folded into it so later resample_ts_data calls are served from the rollups.
+        compact: categorical sensor ids, float32 values and no duplicate TimestampLocal column in raw; float32 pivot.
+        raw_mode: "keep" | "drop" | "spill"; what to do with the raw frame once the pivot is built. "spill" pickles it to spill_dir (see load_raw).
+        RETURNS: { raw, raw_path, pivot, rollups, span, memory } ; memory is the bytes held by each frame for this call.
+        """
+        if raw_mode not in ("keep", "drop", "spill"):
+            raise ValueError(f"Unknown raw_mode '{raw_mode}'. Use one of keep, drop, spill")
+
+        if cache is not None:
+            raw_df = self._get_cached_data_for_sensors(sensorIds, apiProjectId, queryEngine, cache, ago, startTs, endTs)
+        else:
+            raw_df = self._get_data_for_sensors(sensorIds, apiProjectId, queryEngine, ago, startTs, endTs)
+        memory = { 'remote_bytes': int(raw_df.memory_usage(deep=True).sum()) }
+
+        # process: parse timestamps/values once, then pivot and resample in one pass
+        ingested = ingest(raw_df)
+        ts_index = pd.DatetimeIndex(ingested.ts.view('datetime64[ns]'), name='TimestampLocal')
+        if compact:
+            raw_df = pd.DataFrame({
+                'ObjectPropertyId': pd.Categorical.from_codes(ingested.codes, categories=ingested.sensors),
+                'Value': ingested.values.astype('float32'),
+            }, index=ts_index)
+        else:
+            raw_df.index = ts_index
+            raw_df['Value'] = ingested.values
+        df_pivot = to_wide(ingested, resample, dtype='float32' if compact else 'float64')
+
+        if rollups is not None:
+            rollups.update_ingested(ingested)
+
+        span = (ts_index.min(), ts_index.max()) if len(ts_index) else (None, None)
+        memory['raw_bytes'] = int(raw_df.memory_usage(deep=True).sum())
+        memory['pivot_bytes'] = int(df_pivot.memory_usage(deep=True).sum())
+
+        raw_path = None
+        if raw_mode == "spill":
+            os.makedirs(spill_dir, exist_ok=True)
+            raw_path = os.path.join(spill_dir, f"raw_{uuid.uuid4()}.pkl")
+            raw_df.to_pickle(raw_path)
+        if raw_mode != "keep":
+            raw_df = None
+        memory['retained_bytes'] = memory['pivot_bytes'] + (memory['raw_bytes'] if raw_df is not None else 0)
 
         return {
             "raw": raw_df,
-            "pivot": df_pivot
+            "raw_path": raw_path,
+            "pivot": df_pivot,
+            "rollups": rollups,
+            "span": span,
+            "memory": memory
         }
 
     @staticmethod
-    def resample_ts_data(ts_data:dict, resampleAt:str, **args):
-        # need to reprocess the raw df into a new pivot and resample.
-        df_pivot = ts_data['raw'].drop(['TimestampLocal'], axis=1).pivot_table(columns=['ObjectPropertyId'], values=['Value'], index=ts_data['raw'].index, aggfunc='mean')
-        df_pivot.columns = df_pivot.columns.get_level_values(1)
-        df_pivot.resample(resampleAt, **args).last()
+    def load_raw(ts_data:dict) -> pd.DataFrame:
+        """Raw frame for ts_data, reloading it from disk if it was spilled"""
+        if ts_data.get('raw') is not None: return ts_data['raw']
+        if ts_data.get('raw_path'): return pd.read_pickle(ts_data['raw_path'])
+        raise ValueError("Raw telemetry was dropped for this result; refetch with raw_mode='keep' or 'spill', or provide rollups.")
+
+    @classmethod
+    def resample_ts_data(self, ts_data:dict, resampleAt:str, agg:str="last", **args):
+        """
+        Serve the data at a new resolution. Uses the rollups when ts_data has them, no extra resample args are given and the
+        rollup for that resolution still reaches back to the start of the span (see TelemetryRollups.RETAIN); otherwise
+        re-pivots and resamples the raw frame, which raises if raw was dropped.
+        """
+        rollups = ts_data.get('rollups')
+        start, end = ts_data.get('span') or (None, None)
+        if rollups is not None and not args and rollups.covers(resampleAt, start):
+            df_pivot = rollups.get(resampleAt, agg=agg, sensors=list(ts_data['pivot'].columns), start=start, end=end)
+        elif agg == "last" and not args:
+            # need to reprocess the raw df into a new pivot and resample.
+            raw = self.load_raw(ts_data)
+            df_pivot = to_wide(ingest(raw, use_index=True), resampleAt, dtype=raw['Value'].dtype)
+        else:
+            raw = self.load_raw(ts_data)
+            df_pivot = raw.drop(['TimestampLocal'], axis=1, errors='ignore').pivot_table(columns=['ObjectPropertyId'], values=['Value'], index=raw.index, aggfunc='mean', observed=True)
+            df_pivot.columns = df_pivot.columns.get_level_values(1)
+            df_pivot = getattr(df_pivot.resample(resampleAt, **args), agg)()
 
         return {
-            'raw': ts_data['raw'],
-            'pivot': df_pivot
-        }
\ No newline at end of file
+            **ts_data,
+            'pivot': df_pivot,
+        }
@@ -0,0 +1,135 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+# Bounded in-memory caches for derived server state (matches, targets, diagrams).
+#
+# Each namespace has its own entry and byte budget and an optional TTL, evicts least recently used entries first, and
+# counts hits, misses and evictions. Entries are stamped with the model version they were computed against; a lookup
+# under a newer version is a miss and drops the entry, so a model change invalidates everything without a sweep.
+# Sizes are the JSON length of the value, which is what we end up sending anyway; pass size= when it is already known.
+
+class CacheNamespace(object):
+    def __init__(self, name:str, max_entries:int=None, max_bytes:int=None, ttl:float=None, version:Callable=None):
+        """
+        max_entries / max_bytes: budgets; None for unbounded
+        ttl: seconds an entry stays valid after it is stored; None for no expiry
+        version: function returning the current model version entries are stamped and checked with
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = version or (lambda: None)
+        self._lock = threading.Lock()
+        # key -> (value, size, stored_at, version)
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evicted_lru': 0, 'evicted_ttl': 0, 'evicted_bytes': 0, 'invalidated': 0}
+
+    @staticmethod
+    def sizeof(value) -> int:
+        return len(json.dumps(value, default=str))
+
+    def get(self, key:Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return default
+            value, size, stored_at, version = entry
+            if version != self.version():
+                self._drop(key, 'invalidated')
+                self.counters['misses'] += 1
+                return default
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._drop(key, 'evicted_ttl')
+                self.counters['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return value
+
+    def set(self, key:Hashable, value, size:int=None, version=None):
+        """version: model version to stamp the entry with, when storing results for a model that isn't current yet"""
+        size = self.sizeof(value) if size is None else size
+        version = self.version() if version is None else version
+        with self._lock:
+            if key in self._entries: self._drop(key, None)
+            # never keep something that could not fit on its own
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.counters['evicted_bytes'] += 1
+                return value
+            self._entries[key] = (value, size, time.monotonic(), version)
+            self.bytes += size
+            self.counters['sets'] += 1
+            self._evict()
+        return value
+
+    def __setitem__(self, key:Hashable, value):
+        self.set(key, value)
+
+    def __contains__(self, key:Hashable):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def pop(self, key:Hashable):
+        with self._lock:
+            if key in self._entries: self._drop(key, 'invalidated')
+
+    def clear(self):
+        with self._lock:
+            self.counters['invalidated'] += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+
+    def items(self):
+        """(key, value) for entries valid under the current version, without touching LRU order or counters"""
+        with self._lock:
+            current, now = self.version(), time.monotonic()
+            return [(k, v) for k, (v, _, stored_at, version) in self._entries.items()
+                    if version == current and (self.ttl is None or now - stored_at <= self.ttl)]
+
+    def _drop(self, key:Hashable, reason:str):
+        _, size, _, _ = self._entries.pop(key)
+        self.bytes -= size
+        if reason: self.counters[reason] += 1
+
+    def _evict(self):
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)), 'evicted_lru')
+        while self.max_bytes is not None and self.bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)), 'evicted_bytes')
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {'entries': len(self._entries), 'bytes': self.bytes, 'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'ttl': self.ttl, 'hit_rate': self.counters['hits'] / lookups if lookups else None, **self.counters}
+
+class Cache(object):
+    """A set of namespaces sharing one version source"""
+    def __init__(self, version:Callable=None, **budgets):
+        """budgets: { namespace: dict(max_entries=, max_bytes=, ttl=) }"""
+        self.version = version
+        self.namespaces: Dict[str, CacheNamespace] = {}
+        for name, budget in budgets.items():
+            self.namespace(name, **budget)
+
+    def namespace(self, name:str, **budget) -> CacheNamespace:
+        if name not in self.namespaces:
+            self.namespaces[name] = CacheNamespace(name, version=self.version, **budget)
+        return self.namespaces[name]
+
+    def __getitem__(self, name:str) -> CacheNamespace:
+        return self.namespaces[name]
+
+    def clear(self):
+        for ns in self.namespaces.values(): ns.clear()
+
+    def stats(self) -> dict:
+        return {name: ns.stats() for name, ns in self.namespaces.items()}
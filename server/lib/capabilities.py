@@ -0,0 +1,74 @@
+import rdflib
+import pandas as pd
+from functools import cached_property
+from contextlib import nullcontext
+from itertools import product
+
+from .query_helpers import select_rows
+from .query_budget import QueryBudget, BudgetExceeded
+
+# Per target capability tables, for modules whose logic options differ only in which point slots they require.
+#
+# One query binds ( ?this ?capability ?point ) for every point slot any of the options uses (e.g. the econ module's
+# CAPABILITY_QUERY); each option then declares its slots as blocks over those capabilities (capability_blocks) and its
+# rows are expanded from the table rather than queried. A block is ( required, alternatives ), an alternative is
+# ( { '?var': capability }, { '?var': constant } ):
+#   - the rows of an option are the product of its blocks, as the joins of its own query would give
+#   - an alternative binding several vars gives the product of their candidates (e.g. OA and RA enthalpy)
+#   - a required block without candidates drops the target; an optional one leaves its vars unbound (OPTIONAL)
+#   - vars named '?_...' are joined on but not projected, so they only repeat rows (e.g. once per matching equipment
+#     type, as an option's un-DISTINCT subquery does)
+
+class CapabilityTable(object):
+    def __init__(self, dataset:rdflib.Graph, query:str, option:str=None, budget:QueryBudget=None, logic_options:tuple=()):
+        """
+        query: SELECT binding ?this ?capability ?point; run on first use, so an option answered from the match store costs nothing
+        option: name the query is timed (and budgeted) under
+        budget / logic_options: the query runs under budget.shared() for the options matched from the table, not out of
+            the budget of the option that happens to need it first (lib.query_budget)
+        """
+        self.dataset = dataset
+        self.query = query
+        self.option = option
+        self.budget = budget
+        self.logic_options = logic_options
+        # set when the query ran out of its budget; raised again for every option that needs the table
+        self.exceeded = None
+
+    @cached_property
+    def targets(self) -> dict:
+        """{ target: { capability: [points] } }"""
+        if self.exceeded is not None: raise self.exceeded
+        targets = {}
+        try:
+            with self.budget.shared(self.option, self.logic_options) if self.budget else nullcontext():
+                (_, rows) = select_rows(self.dataset, self.query, option=self.option)
+                for target, capability, point in rows:
+                    targets.setdefault(target, {}).setdefault(capability.toPython(), []).append(point)
+        except BudgetExceeded as e:
+            self.exceeded = e
+            raise
+        return targets
+
+    def match(self, logic_option) -> pd.DataFrame:
+        """logic_option's find_matches frame, from its capability_blocks"""
+        blocks = logic_option.capability_blocks
+        columns = ['?option', '?target'] + list(dict.fromkeys(v for _, alternatives in blocks for variables, constants in alternatives for v in (*constants, *variables) if not v.startswith('?_')))
+        option = rdflib.Literal(logic_option.name)
+
+        records = []
+        for target, capabilities in sorted(self.targets.items()):
+            rows = [{}]
+            for required, alternatives in blocks:
+                bindings = [
+                    {**{v: rdflib.Literal(c) for v, c in constants.items()}, **dict(zip(variables, points))}
+                    for variables, constants in alternatives
+                    for points in product(*(capabilities.get(c, ()) for c in variables.values()))
+                ]
+                if not bindings:
+                    if required: rows = []; break
+                    continue
+                rows = [{**r, **b} for r in rows for b in bindings]
+            records.extend({'?option': option, '?target': target, **{v: p for v, p in r.items() if not v.startswith('?_')}} for r in rows)
+
+        return pd.DataFrame.from_records(records, columns=columns).astype(object).where(lambda df: df.notna(), None)
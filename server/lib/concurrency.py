@@ -0,0 +1,121 @@
+import threading
+from contextlib import contextmanager
+
+# Shared / exclusive access to the server's dataset and caches.
+#
+# Requests that only read the model (matching, diagrams, targets) hold the lock shared and run in parallel; a model
+# upload holds it exclusively, so it never swaps the building graph or resets the caches under a running query.
+# Waiting writers block new readers, so an upload is not starved by a steady stream of match requests.
+
+class ReadWriteLock(object):
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers: self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+class ModelState(object):
+    """The lock plus a version number bumped on every model change, so responses can say which model they came from"""
+    def __init__(self):
+        self.lock = ReadWriteLock()
+        self.version = 0
+
+    @contextmanager
+    def read(self):
+        with self.lock.read():
+            yield self.version
+
+    @contextmanager
+    def write(self):
+        with self.lock.write():
+            try:
+                yield
+            finally:
+                # a failed load has still dropped the previous building
+                self.version += 1
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight(object):
+    """
+    Collapse concurrent calls for the same key into one: the first caller runs fn, callers arriving while it runs wait
+    and get the same result (or exception). Nothing is kept once the call completes; caching stays with the caller.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """RETURNS: ( fn() result, True if this call waited on another caller's run )"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader: flight = self._flights[key] = _Flight()
+            else: flight.waiters += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error: raise flight.error
+            return (flight.result, True)
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return (flight.result, False)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
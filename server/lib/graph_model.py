@@ -0,0 +1,139 @@
+import hashlib
+import rdflib
+
+from .query_helpers import values_clause
+
+# Dataset layout shared by the server and the offline tools: one named graph per ontology plus the 'building' graph,
+# queried as a union through the default graph.
+
+GRAPH_NS = rdflib.Namespace("https://_graph_.com#")
+
+# ontology graph name -> file in the static dir
+ONTOLOGIES = {
+    'brick': "brick.ttl",
+    'rnd': "rnd.ttl",
+    'switch': "Brick-SwitchExtension.ttl",
+}
+
+def init_graph_model(static_dir:str="./server/static"):
+    brick_path = f"{static_dir}/{ONTOLOGIES['brick']}"
+    switch_path = f"{static_dir}/{ONTOLOGIES['switch']}"
+    rnd_path = f"{static_dir}/{ONTOLOGIES['rnd']}"
+
+    ds = rdflib.Dataset(default_union=True, store="Oxigraph")
+    g_ns = GRAPH_NS
+
+    # Load brick
+    ds.add_graph(g_ns['brick']).parse(brick_path, format="turtle")
+    # # load RND ontology (this is what contains the relationships we will use to define enrichment)
+    ds.add_graph(g_ns['rnd']).parse(rnd_path, format='turtle')
+    # load Switch Extension
+    ds.add_graph(g_ns['switch']).parse(switch_path, format='turtle')
+
+    return (ds, g_ns)
+
+def load_building(ds:rdflib.Dataset, source, format:str="turtle", g_ns=GRAPH_NS):
+    """Replace the building graph with the model in source (path or file-like)"""
+    # dump old model
+    ds.remove_graph(g_ns['building'])
+    # load building model
+    if isinstance(source, str):
+        return ds.add_graph(g_ns['building']).parse(source, format=format)
+    return ds.add_graph(g_ns['building']).parse(file=source, format=format)
+
+def match_targets(ds:rdflib.Dataset, matches):
+    """Given a match result set, extract the unique targets and get some additional info from the graph"""
+
+    if matches.empty: return []
+
+    # get unique match targets
+    targets = matches['?target'].unique()
+
+    # get some more data from the graph:
+    target_data = []
+    for target in targets:
+        target_data.append({
+            "target": target.toPython(),
+            "label": next(ds.objects(target, rdflib.RDFS.label), rdflib.Literal('#')).toPython(),
+            "cls": dict(zip(['ont', 'slug'], next(ds.objects(target, rdflib.RDF.type), rdflib.Literal("#")).toPython().split('#')))
+        })
+
+    return sorted(target_data, key=lambda x: x['label'])
+
+def _triple_digest(triple, bnodes:dict=None) -> int:
+    return int.from_bytes(hashlib.sha256(" ".join(f"_:{bnodes[t]}" if isinstance(t, rdflib.BNode) else t.n3() for t in triple).encode()).digest(), "big")
+
+def _has_bnode(triple) -> bool:
+    return isinstance(triple[0], rdflib.BNode) or isinstance(triple[2], rdflib.BNode)
+
+def _bnode_labels(triples:list) -> dict:
+    """
+    Parse independent labels for the blank nodes of triples, by colour refinement: each blank node is labelled with a
+    hash of its edges (direction, predicate and the other end's term or label), repeated until the labels stop splitting
+    the blank nodes into more classes. Linear per round, where rdflib.compare's canonical labelling is far too slow for
+    large models; blank nodes it can't tell apart share a label, and their triples are summed either way.
+    """
+    edges = {}
+    for s, p, o in triples:
+        if isinstance(s, rdflib.BNode): edges.setdefault(s, []).append((f">{p.n3()}", o))
+        if isinstance(o, rdflib.BNode): edges.setdefault(o, []).append((f"<{p.n3()}", s))
+
+    labels, classes = {b: "" for b in edges}, 1
+    for _ in range(len(edges)):
+        labels = {
+            b: hashlib.sha256("\0".join([labels[b], *sorted(f"{e} {labels[t] if isinstance(t, rdflib.BNode) else t.n3()}" for e, t in es)]).encode()).hexdigest()
+            for b, es in edges.items()
+        }
+        if len(set(labels.values())) == classes: break
+        classes = len(set(labels.values()))
+    return labels
+
+def graph_digest(graph:rdflib.Graph) -> str:
+    """
+    Order independent content hash of a graph: the sum of per triple SHA-256 digests, so it is one pass with no sort.
+    Blank nodes are hashed by their place in the graph (_bnode_labels) rather than their parse-time labels, so the same
+    model digests the same on every load.
+    """
+    total, with_bnodes = 0, []
+    for triple in graph.triples((None, None, None)):
+        if _has_bnode(triple): with_bnodes.append(triple)
+        else: total += _triple_digest(triple)
+    labels = _bnode_labels(with_bnodes)
+    total += sum(_triple_digest(triple, labels) for triple in with_bnodes)
+    return f"{total % 2**256:064x}"
+
+def update_digest(digest:str, added, removed, graph:rdflib.Graph=None) -> str:
+    """
+    graph_digest after adding / removing triples (each must actually have changed the graph), without a rescan. An edit
+    to blank node triples can relabel other blank nodes, so that rescans graph (the model after the edit).
+    """
+    if any(map(_has_bnode, (*added, *removed))): return graph_digest(graph)
+    total = int(digest, 16) + sum(map(_triple_digest, added)) - sum(map(_triple_digest, removed))
+    return f"{total % 2**256:064x}"
+
+# Candidate targets an edit can change the matches of: the changed entities and everything they are a point, part,
+# downstream unit or root parent descendant of. Run on the model before and after the edit, so targets reached only
+# through a removed (or added) relationship are included.
+AFFECTED_TARGETS_QUERY = """
+    SELECT DISTINCT ?target
+    WHERE {{
+        {values}
+        ?entity (^brick:hasPoint|brick:isPointOf|^brick:hasPart|brick:isPartOf|^brick:feeds|brick:isFedBy|rnd:hasRootParent)* ?target .
+    }}
+    """
+
+def affected_targets(ds:rdflib.Dataset, entities) -> set:
+    if not entities: return set()
+    return { row[0] for row in ds.query(AFFECTED_TARGETS_QUERY.format(values=values_clause('?entity', entities))) }
+
+def ontology_digest(static_dir:str="./server/static") -> str:
+    """
+    Content hash of the ontology files init_graph_model loads. Hashes the files rather than the parsed graphs: reading
+    the files is cheaper than digesting their (blank node heavy) graphs, and needs to be stable across restarts and workers.
+    """
+    h = hashlib.sha256()
+    for name, filename in sorted(ONTOLOGIES.items()):
+        h.update(f"{name}\0".encode())
+        with open(f"{static_dir}/{filename}", "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
@@ -0,0 +1,129 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List
+
+# In-process timing metrics for the server.
+#
+# METRICS collects latency histograms and counters keyed by name + labels; /metrics serves METRICS.snapshot().
+# A route opens request_stages(route) and wraps its phases in stage(name); anything called underneath (module match,
+# SPARQL helpers) records into the same request through the context variable, so the route can also hand the
+# breakdown back in its response meta.
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# result rows / triples
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+
+class Histogram(object):
+    def __init__(self, buckets:tuple=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value:float):
+        i = next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self) -> dict:
+        # cumulative bucket counts, prometheus style
+        cumulative, total = {}, 0
+        for b, c in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += c
+            cumulative[str(b)] = total
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'min': self.min, 'max': self.max, 'buckets': cumulative}
+
+class Metrics(object):
+    def __init__(self, buckets:tuple=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.counters: Dict[tuple, float] = {}
+
+    @staticmethod
+    def _key(name:str, labels:dict) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+
+    def observe(self, name:str, value:float, buckets:tuple=None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms: self.histograms[key] = Histogram(buckets or self.buckets)
+            self.histograms[key].observe(value)
+
+    def inc(self, name:str, value:float=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """RETURNS: { 'histograms': { name: [ {labels, count, sum, ...} ] }, 'counters': { name: [ {labels, value} ] } }"""
+        with self._lock:
+            out = {'histograms': {}, 'counters': {}}
+            for (name, labels), h in sorted(self.histograms.items()):
+                out['histograms'].setdefault(name, []).append({'labels': dict(labels), **h.snapshot()})
+            for (name, labels), v in sorted(self.counters.items()):
+                out['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': v})
+            return out
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+METRICS = Metrics()
+
+class RequestStages(object):
+    """Per request breakdown: ordered stage timings plus one entry per SPARQL query run"""
+    def __init__(self, route:str):
+        self.route = route
+        self.stages: List[dict] = []
+        self.queries: List[dict] = []
+        self._start = time.perf_counter()
+
+    def breakdown(self) -> dict:
+        return {'total_s': time.perf_counter() - self._start, 'stages': self.stages, 'queries': self.queries}
+
+_current = contextvars.ContextVar("request_stages", default=None)
+
+def current() -> RequestStages:
+    return _current.get()
+
+@contextmanager
+def request_stages(route:str):
+    stages = RequestStages(route)
+    token = _current.set(stages)
+    try:
+        yield stages
+    finally:
+        _current.reset(token)
+        METRICS.observe("request_seconds", time.perf_counter() - stages._start, route=route)
+        METRICS.inc("requests", route=route)
+
+@contextmanager
+def stage(name:str, **labels):
+    """Time a block; recorded as stage_seconds{stage=name, route, **labels} and on the current request if there is one"""
+    req = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe("stage_seconds", elapsed, stage=name, route=req.route if req else None, **labels)
+        if req: req.stages.append({'stage': name, **labels, 'seconds': elapsed})
+
+def record_query(kind:str, seconds:float, rows:int, **labels):
+    """kind: 'select' | 'construct'. Rows are result rows for SELECT, triples for CONSTRUCT"""
+    METRICS.observe("sparql_seconds", seconds, kind=kind, **labels)
+    METRICS.observe("sparql_rows", rows, buckets=ROW_BUCKETS, kind=kind, **labels)
+    METRICS.inc("sparql_rows_total", rows, kind=kind, **labels)
+    if req := current():
+        req.queries.append({'kind': kind, **labels, 'seconds': seconds, 'rows': rows})
@@ -0,0 +1,99 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+# Background jobs for work that can outlive an HTTP request (matching large models, diagrams).
+#
+# A job runs fn(job) on a worker pool; fn reports progress with job.emit(event, **data). Every event gets a sequence
+# number so clients can poll for everything after the last one they saw, or stream them (server-sent events) with
+# events_since() blocking until something new arrives. Finished jobs are kept for polling until `keep` newer ones
+# have finished.
+
+TERMINAL = ('done', 'error')
+
+class Job(object):
+    def __init__(self, kind:str, params:dict):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events: List[dict] = []
+        self._cond = threading.Condition(threading.RLock())
+
+    def emit(self, event:str, **data):
+        with self._cond:
+            self.events.append({'seq': len(self.events) + 1, 'event': event, 'time': time.time(), 'data': data})
+            self._cond.notify_all()
+
+    def finish(self, status:str, result=None, error:str=None):
+        # state and the final event change together, so a reader never sees a finished job without its last event
+        with self._cond:
+            self.status, self.result, self.error, self.finished = status, result, error, time.time()
+            self.emit(status, error=error)
+
+    def events_since(self, seq:int=0, timeout:float=None) -> List[dict]:
+        """Events after seq; waits up to timeout for one if there are none yet and the job is still running"""
+        with self._cond:
+            if len(self.events) <= seq and self.status not in TERMINAL and timeout:
+                self._cond.wait(timeout)
+            return self.events[seq:]
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL
+
+    def summary(self, since:int=0, result:bool=True) -> dict:
+        out = {'job_id': self.id, 'kind': self.kind, 'params': self.params, 'status': self.status, 'created': self.created,
+               'started': self.started, 'finished': self.finished, 'events': self.events[since:], 'error': self.error}
+        if result and self.status == 'done': out['result'] = self.result
+        return out
+
+class JobManager(object):
+    def __init__(self, max_workers:int=2, keep:int=100):
+        """
+        max_workers: jobs run at the same time; the rest queue
+        keep: finished jobs retained for polling
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.jobs: 'OrderedDict[str, Job]' = OrderedDict()
+
+    def submit(self, kind:str, fn:Callable, **params) -> Job:
+        job = Job(kind, params)
+        with self._lock:
+            self.jobs[job.id] = job
+        job.emit('queued')
+        self.executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id:str) -> Job:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _run(self, job:Job, fn:Callable):
+        job.status, job.started = 'running', time.time()
+        job.emit('started')
+        try:
+            job.finish('done', result=fn(job))
+        except Exception as e:
+            job.finish('error', error=str(e))
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [j for j in self.jobs.values() if j.done]
+            for j in finished[:max(len(finished) - self.keep, 0)]:
+                del self.jobs[j.id]
@@ -0,0 +1,192 @@
+import re
+import time
+import zlib
+import numpy as np
+import pandas as pd
+import rdflib
+from types import SimpleNamespace
+from typing import Dict
+
+# Local stand-in for the remote telemetry query engine.
+#
+# LocalQueryEngine.query(projectId, kql) understands the KQL subset that AnalyticsHelper._get_data_for_sensors emits:
+#   Timeseries
+#   | where ObjectPropertyId in ("id1", "id2", ...)
+#   | where TimestampLocal > ago(2d)                                    OR
+#   | where TimestampLocal between (datetime(...) .. datetime(...))
+#   | project ObjectPropertyId, TimestampLocal, Value
+# and serves rows from SyntheticTelemetry in the same long format as the remote store.
+#
+# Values are a pure function of (sensor id, timestamp, seed) so overlapping windows and repeated runs return identical
+# data, which keeps cache and throughput measurements reproducible.
+
+BRICK = rdflib.Namespace("https://brickschema.org/schema/Brick#")
+SWITCH = rdflib.Namespace("https://switchautomation.com/schemas/BrickExtension#")
+
+# Brick / Switch point class -> synthetic profile
+CLASS_PROFILES = {
+    BRICK.Discharge_Air_Static_Pressure_Sensor: 'DAP',
+    BRICK.Discharge_Air_Static_Pressure_Setpoint: 'DAPSP',
+    BRICK.Position_Sensor: 'DAMPER_POS',
+    BRICK.Position_Command: 'DAMPER_POS',
+    BRICK.Outside_Air_Temperature_Sensor: 'OAT',
+    BRICK.Outside_Air_Enthalpy_Sensor: 'OA_ENTHALPY',
+    BRICK.Return_Air_Enthalpy_Sensor: 'RA_ENTHALPY',
+    BRICK.Return_Air_Temperature_Sensor: 'RAT',
+    BRICK.Mixed_Air_Temperature_Sensor: 'MAT',
+    BRICK.Discharge_Air_Temperature_Sensor: 'DAT',
+    BRICK.On_Off_Status: 'STATUS',
+    BRICK.On_Off_Command: 'STATUS',
+    BRICK.Enable_Status: 'STATUS',
+    BRICK.Enable_Command: 'STATUS',
+    SWITCH.Economy_Operating_Mode_Status: 'ECON_MODE',
+    SWITCH.Economy_Operating_Mode_Enable_Status: 'ECON_MODE',
+    SWITCH.Economy_Operating_Mode_Enable_Command: 'ECON_MODE',
+}
+
+# keyword in the sensor id -> profile; checked in order so DAPSP wins over DAP
+KEYWORD_PROFILES = (
+    ('DAPSP', 'DAPSP'), ('DAP', 'DAP'), ('DMP', 'DAMPER_POS'), ('DAMPER', 'DAMPER_POS'), ('OAT', 'OAT'),
+    ('OAE', 'OA_ENTHALPY'), ('RAE', 'RA_ENTHALPY'), ('RAT', 'RAT'), ('MAT', 'MAT'), ('DAT', 'DAT'),
+    ('RUN', 'STATUS'), ('STATUS', 'STATUS'), ('ECON', 'ECON_MODE'),
+)
+
+class SyntheticTelemetry(object):
+
+    PROFILES = ('DAP', 'DAPSP', 'DAMPER_POS', 'OAT', 'OA_ENTHALPY', 'RA_ENTHALPY', 'RAT', 'MAT', 'DAT', 'STATUS', 'ECON_MODE', 'GENERIC')
+
+    def __init__(self, profiles:Dict[str, str]=None, interval:str="1T", dropout:float=0.0, seed:int=0, occupied_hours:tuple=(7, 18)):
+        """
+        profiles: { ObjectPropertyId: profile }; ids not listed are matched on keywords in the id, else GENERIC
+        interval: sample spacing (density) of the generated readings
+        dropout: fraction of readings randomly (but reproducibly) missing
+        occupied_hours: (start, end) local hour the plant runs
+        """
+        self.profiles = dict(profiles or {})
+        self.interval = pd.Timedelta(interval)
+        self.dropout = dropout
+        self.seed = seed
+        self.occupied_hours = occupied_hours
+
+    @classmethod
+    def from_model(self, graph:rdflib.Graph, index, **kwargs):
+        """Assign profiles from the Brick class of each indexed point (index: lib.sensor_index.SensorIdIndex)"""
+        profiles = {}
+        for entity, sensor_id in index.ids.items():
+            for cls in graph.objects(rdflib.URIRef(entity), rdflib.RDF.type):
+                if cls in CLASS_PROFILES:
+                    profiles[sensor_id] = CLASS_PROFILES[cls]
+                    break
+        return self(profiles=profiles, **kwargs)
+
+    def profile_for(self, sensor_id:str) -> str:
+        if sensor_id in self.profiles: return self.profiles[sensor_id]
+        upper = sensor_id.upper()
+        for keyword, profile in KEYWORD_PROFILES:
+            if keyword in upper: return profile
+        return 'GENERIC'
+
+    def generate(self, sensorIds:list, start:pd.Timestamp, end:pd.Timestamp) -> pd.DataFrame:
+        """Long format rows for every sensor on the interval grid within [start, end]"""
+        step = self.interval.value
+        first = -(-pd.Timestamp(start).value // step) * step   # ceil onto the grid so windows line up
+        ts = np.arange(first, pd.Timestamp(end).value + 1, step, dtype='int64')
+
+        frames = []
+        for sensor_id in sensorIds:
+            sensor_seed = zlib.crc32(f"{self.seed}:{sensor_id}".encode())
+            values = self._values(self.profile_for(sensor_id), ts, sensor_seed)
+            keep = self._noise(ts, sensor_seed + 1) >= self.dropout if self.dropout else slice(None)
+            frames.append(pd.DataFrame({'ObjectPropertyId': sensor_id, 'TimestampLocal': ts[keep], 'Value': values[keep]}))
+
+        if not frames:
+            return pd.DataFrame({'ObjectPropertyId': [], 'TimestampLocal': np.array([], dtype='int64'), 'Value': []})
+        return pd.concat(frames, ignore_index=True)
+
+    # PROFILES
+    #
+
+    @staticmethod
+    def _noise(ts:np.ndarray, seed:int) -> np.ndarray:
+        # stateless hash noise in [0, 1) so the same (sensor, timestamp) always gives the same value
+        x = (ts // 10**9).astype('float64') * 12.9898 + (seed % 100003) * 78.233
+        return np.modf(np.abs(np.sin(x) * 43758.5453))[0]
+
+    def _values(self, profile:str, ts:np.ndarray, seed:int) -> np.ndarray:
+        hour = ((ts // 10**9) % 86400) / 3600.0
+        noise = self._noise(ts, seed) - 0.5
+        occupied = ((hour >= self.occupied_hours[0]) & (hour < self.occupied_hours[1])).astype('float64')
+        oat = 20 + 8 * np.sin((hour - 9) / 24 * 2 * np.pi)    # degC, warmest mid afternoon
+        rat = 23 + 0.5 * noise
+
+        if profile == 'DAP': return occupied * (250 + 40 * noise)                      # Pa
+        if profile == 'DAPSP': return np.where(occupied > 0, 250.0, 120.0)             # Pa
+        if profile == 'DAMPER_POS':
+            # mostly modulating, with the odd zone pinned open so T&R sees requests
+            base = 35 + 30 * np.sin(hour / 24 * 2 * np.pi + seed % 7) + 60 * noise
+            return np.clip(occupied * base + occupied * (self._noise(ts, seed + 2) > 0.9) * 100, 0, 100)
+        if profile == 'OAT': return oat + noise
+        if profile == 'OA_ENTHALPY': return 1.006 * oat + 0.008 * (2501 + 1.86 * oat) + noise    # kJ/kg
+        if profile == 'RA_ENTHALPY': return 1.006 * rat + 0.009 * (2501 + 1.86 * rat) + noise
+        if profile == 'RAT': return rat
+        if profile == 'MAT': return 0.3 * oat + 0.7 * rat + 0.3 * noise
+        if profile == 'DAT': return np.where(occupied > 0, 13 + 0.5 * noise, 0.3 * oat + 0.7 * rat)
+        if profile == 'STATUS': return occupied
+        if profile == 'ECON_MODE': return occupied * (oat < 18)
+        return 50 + 10 * noise
+
+class LocalQueryEngine(object):
+
+    def __init__(self, telemetry:SyntheticTelemetry=None, latency:float=0.0, latency_per_1k_rows:float=0.0, now=None, value_format:str="str"):
+        """
+        telemetry: data source; defaults to SyntheticTelemetry() with 1 minute density
+        latency: fixed seconds added to every query
+        latency_per_1k_rows: additional seconds per 1000 rows returned, to mimic transfer cost
+        now: timestamp ago() is relative to; fixed for reproducible runs, UTC now when None
+        value_format: "str" returns Value as strings like the remote store, "float" as numbers
+        """
+        self.telemetry = telemetry or SyntheticTelemetry()
+        self.latency = latency
+        self.latency_per_1k_rows = latency_per_1k_rows
+        self.now = pd.Timestamp(now) if now is not None else None
+        self.value_format = value_format
+        self.stats = {'queries': 0, 'rows': 0}
+
+    def query(self, projectId:str, kql:str) -> pd.DataFrame:
+        q = self.parse(kql)
+        df = self.telemetry.generate(q.sensors, q.start, q.end)
+
+        df['TimestampLocal'] = pd.to_datetime(df['TimestampLocal']).dt.strftime("%Y-%m-%dT%H:%M:%S")
+        if self.value_format == "str":
+            df['Value'] = df['Value'].round(3).astype(str)
+
+        self.stats['queries'] += 1
+        self.stats['rows'] += len(df)
+        delay = self.latency + self.latency_per_1k_rows * len(df) / 1000
+        if delay: time.sleep(delay)
+
+        return df[q.columns]
+
+    def parse(self, kql:str) -> SimpleNamespace:
+        stages = [s.strip() for s in kql.split("|")]
+        if stages[0] != "Timeseries":
+            raise ValueError(f"Unsupported table '{stages[0]}'; only Timeseries is served locally")
+
+        now = self.now if self.now is not None else pd.Timestamp.utcnow().tz_localize(None)
+        q = SimpleNamespace(sensors=None, start=None, end=now, columns=['ObjectPropertyId', 'TimestampLocal', 'Value'])
+
+        for stage in stages[1:]:
+            if m := re.fullmatch(r'where\s+ObjectPropertyId\s+in\s*\((.*)\)', stage, re.S):
+                q.sensors = re.findall(r'"([^"]*)"', m.group(1))
+            elif m := re.fullmatch(r'where\s+TimestampLocal\s*>\s*ago\((\w+)\)', stage):
+                q.start = now - pd.Timedelta(m.group(1))
+            elif m := re.fullmatch(r'where\s+TimestampLocal\s+between\s*\(\s*datetime\(([^)]*)\)\s*\.\.\s*datetime\(([^)]*)\)\s*\)', stage):
+                q.start, q.end = pd.Timestamp(m.group(1)), pd.Timestamp(m.group(2))
+            elif m := re.fullmatch(r'project\s+(.*)', stage):
+                q.columns = [c.strip() for c in m.group(1).split(",")]
+            else:
+                raise ValueError(f"Unsupported KQL stage: '{stage}'")
+
+        if q.sensors is None or q.start is None:
+            raise ValueError("Query must filter on ObjectPropertyId and TimestampLocal")
+        return q
@@ -1,3 +1,56 @@
 from enum import Enum
+import hashlib
+import uuid
 
-classEnum = Enum('classEnum', ["OBJECTIVE", "MODULE", "LOGIC_OPTION", "CONTROL_MODULE"])
\ No newline at end of file
+classEnum = Enum('classEnum', ["OBJECTIVE", "MODULE", "LOGIC_OPTION", "CONTROL_MODULE"])
+
+# Version digests for logic classes: change when anything that shapes a logic option's results changes, so persisted
+# results computed by an older definition can be recognised and dropped.
+
+def logic_option_digest(logic_option) -> str:
+    h = hashlib.sha1(str(logic_option.uuid).encode())
+    for part in (logic_option.sparql_query, getattr(logic_option, 'diagram_query', None)):
+        h.update(b"\0" + (part or "").encode())
+    # every return clause the option can run: SELECT, and SELECT_GROUPED / GROUP_BY for the store aggregations
+    for key, part in sorted((getattr(logic_option, '_sparql_return', None) or {}).items()):
+        h.update(f"\0{key}\0{part or ''}".encode())
+    # options matched from a shared capability table (lib.capabilities)
+    if blocks := getattr(logic_option, 'capability_blocks', None):
+        h.update(b"\0" + repr(blocks).encode())
+    # options matching in several queries (e.g. ASHRAE_Pressure_Trim_and_Respond._sparql_phases)
+    for key, part in sorted((getattr(logic_option, '_sparql_phases', None) or {}).items()):
+        h.update(f"\0{key}\0{part}".encode())
+    return h.hexdigest()
+
+def module_digest(module) -> str:
+    return hashlib.sha1("\0".join([str(module.uuid)] + [logic_option_digest(o) for o in module.logic_modules]).encode()).hexdigest()
+
+# Match ids: uuid5 of the logic option uuid and what the match is bound to (target and point URIs), so a rematch of the
+# same model gives the same ids and anything keyed on _match_id (diagram caches, client state) survives it.
+
+# per row random ids some queries bind (UUID()); superseded by _match_id
+RANDOM_VARS = ('?row_id', '?match_id')
+# result variables that don't identify a match: random ids and display metadata
+MATCH_ID_IGNORE = ('?option', '?label') + RANDOM_VARS
+
+def _canonical(value) -> str:
+    # grouped columns hold sets / lists (of lists) of points; their order comes from the query engine, so sort them
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return "[" + ",".join(sorted(_canonical(v) for v in value)) + "]"
+    if value is None or value != value: return ""
+    return str(value)
+
+def match_ids(logic_option, df) -> list:
+    """
+    One uuid5 per row of a find_matches result. Rows binding exactly the same entities (e.g. a target with two labels)
+    are numbered apart in the order of their other columns, so the numbering doesn't depend on the query's row order.
+    """
+    cols = sorted(c for c in df.columns if c.startswith('?') and c not in MATCH_ID_IGNORE)
+    ties = sorted(c for c in df.columns if c in MATCH_ID_IGNORE and c not in RANDOM_VARS)
+    names = ["\0".join(f"{c}={_canonical(v)}" for c, v in zip(cols, row)) for row in df[cols].itertuples(index=False)]
+    order = ["\0".join(_canonical(v) for v in row) for row in df[ties].itertuples(index=False)] if ties else [""] * len(df)
+    ids, seen = [None] * len(df), {}
+    for i in sorted(range(len(df)), key=lambda i: (names[i], order[i])):
+        n = seen[names[i]] = seen.get(names[i], -1) + 1
+        ids[i] = uuid.uuid5(logic_option.uuid, f"{names[i]}\0{n}" if n else names[i])
+    return ids
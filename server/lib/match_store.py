@@ -0,0 +1,138 @@
+import os
+import pickle
+import hashlib
+import threading
+import pandas as pd
+from typing import Tuple
+
+from .logic_master import logic_option_digest
+
+# Content addressed on-disk store for logic option match results.
+#
+# A find_matches result depends only on the building graph, the ontology graphs and the logic option's queries, so it
+# is stored under sha256(RESULT_FORMAT, building digest, ontology digest, logic_option_digest(option)) as a pickled
+# DataFrame (the post-groupby output, before the module adds rank / ids). The same model uploaded again, after a restart
+# or to another worker pointed at the same directory, is answered from disk without running SPARQL. Entries are never invalidated,
+# only aged out: a changed model or query gives a different key. Writes go to a per-writer temp file and are renamed
+# into place, so concurrent writers of the same key are harmless.
+#
+#   <directory>/<key[:2]>/<key>.pickle
+
+# layout of the stored frames; bump when the modules change how find_matches shapes its output (columns, grouping,
+# dtypes) without changing their queries, so entries written in the old layout are never served
+RESULT_FORMAT = 1
+
+class MatchStore(object):
+    def __init__(self, directory:str, max_bytes:int=None):
+        """
+        directory: where entries are kept; may be shared between server processes
+        max_bytes: size budget; least recently used entries are deleted when a write takes the store over it
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0, 'pruned': 0}
+
+    @staticmethod
+    def key(model_hash:str, ontology_hash:str, logic_option) -> str:
+        return hashlib.sha256("\0".join((str(RESULT_FORMAT), model_hash, ontology_hash, logic_option_digest(logic_option))).encode()).hexdigest()
+
+    def path(self, key:str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pickle")
+
+    def _count(self, counter:str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def get(self, key:str) -> pd.DataFrame:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                df = pickle.load(f)
+            # mark as recently used for pruning
+            os.utime(path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except Exception as e:
+            print(f"Failed to read match store entry {path}: {e}")
+            self._count('errors')
+            return None
+        self._count('hits')
+        return df
+
+    def set(self, key:str, df:pd.DataFrame):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"Failed to write match store entry {path}: {e}")
+            self._count('errors')
+            if os.path.exists(tmp): os.remove(tmp)
+            return
+        self._count('writes')
+        if self.max_bytes is not None: self.prune()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pickle"): continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        return entries
+
+    def prune(self):
+        """Delete least recently used entries until the store is within max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count('pruned')
+
+    def scope(self, model_hash:str, ontology_hash:str) -> 'MatchScope':
+        return MatchScope(self, model_hash, ontology_hash)
+
+    def stats(self) -> dict:
+        entries = self._entries() if os.path.isdir(self.directory) else []
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {'directory': self.directory, 'entries': len(entries), 'bytes': sum(size for _, size, _ in entries),
+                    'max_bytes': self.max_bytes, 'hit_rate': self.counters['hits'] / lookups if lookups else None, **self.counters}
+
+class MatchScope(object):
+    """The store bound to one building / ontology pair; what a module's match() is handed"""
+    def __init__(self, store:MatchStore, model_hash:str, ontology_hash:str):
+        self.store = store
+        self.model_hash = model_hash
+        self.ontology_hash = ontology_hash
+
+    def find_matches(self, logic_option, dataset, return_type="SELECT", **kwargs) -> Tuple[object, pd.DataFrame]:
+        """
+        logic_option.find_matches() (kwargs passed on), answered from the store when possible.
+        RETURNS: ( query result, or None when the result came from the store, result DataFrame )
+        """
+        # only the SELECT DataFrame is stored; CONSTRUCT results are graphs the caller goes on to modify
+        if return_type != "SELECT":
+            return logic_option.find_matches(dataset, return_type, **kwargs)
+
+        key = self.store.key(self.model_hash, self.ontology_hash, logic_option)
+        df = self.store.get(key)
+        if df is not None:
+            return (None, df)
+
+        res, df = logic_option.find_matches(dataset, return_type, **kwargs)
+        self.store.set(key, df)
+        return (res, df)
@@ -1,9 +1,101 @@
 import rdflib
 import pandas as pd
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Callable
 import uuid
 
-from ..logic_master import classEnum
+from ..logic_master import classEnum, match_ids
+from ..query_helpers import select_df, restrict, construct
+from ..instrumentation import stage
+from ..query_budget import QueryBudget, BudgetExceeded
+from ..capabilities import CapabilityTable
+
+# SHARED MATCHING
+# The four options repeat the same blocks (equipment typing, active point, econ mode, OAT / enthalpy points), so
+# MODULE.match(shared=True) queries every point slot they use once, into a per target capability table
+# (lib.capabilities), and each option's rows come from its capability_blocks. The blocks mirror the option's
+# sparql_query, which is still what find_matches runs when no table is given, down to its repeated rows
+# (tests/test_econ_shared.py compares the two).
+#
+# Every option's SELECT binds ?option to its name, as the table's rows do. Diff_Enthalpy, Diff_DB and Fixed_DB used to
+# bind the literal "{name}" (their SELECTs weren't f-strings), so results from before that fix carry "{name}" as their
+# ?option; logic_option_digest covers the SELECTs, so stored results of the old queries aren't reused.
+
+CAPABILITY_QUERY = """
+    SELECT DISTINCT ?this ?capability ?point
+    WHERE {
+        {
+            SELECT ?this
+            WHERE {
+                ?this rdf:type ?eT .
+                VALUES ?eT { brick:RTU brick:AHU } .
+            }
+        }
+
+        {
+            ?this rdf:type ?point .
+            VALUES ?point { brick:RTU brick:AHU } .
+            BIND("equipment" as ?capability)
+        } UNION {
+            ?this rdfs:label ?point .
+            BIND("label" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type ?point_type1 .
+            VALUES ?point_type1 { brick:On_Off_Status brick:On_Off_Command brick:Enable_Status brick:Enable_Command brick:Operating_Mode_Status switch:Operating_Mode_Command }
+            BIND("active" as ?capability)
+        } UNION {
+            # Fall back active point; DAF Run
+            ?this brick:hasPart ?part_run .
+            ?part_run rdf:type brick:Discharge_Fan .
+            ?part_run brick:hasPoint ?point .
+            ?point rdf:type ?run_status .
+            VALUES ?run_status { brick:On_Off_Status brick:On_Off_Command }
+            BIND("active_daf" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type ?point_type2 .
+            VALUES ?point_type2 { switch:Economy_Operating_Mode_Status switch:Economy_Operating_Mode_Enable_Status switch:Economy_Operating_Mode_Enable_Command }
+            BIND("econ_mode" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Outside_Air_Temperature_Sensor .
+            BIND("oat" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Return_Air_Temperature_Sensor .
+            BIND("rat" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Outside_Air_Enthalpy_Sensor .
+            BIND("oa_enthalpy" as ?capability)
+        } UNION {
+            # as spelt by ASHRAE_Econ_HL_Shutoff_Fixed_Enthalpy.sparql_query
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Outside_Air_Enthaply_Sensor .
+            BIND("oa_enthaply" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Return_Air_Enthalpy_Sensor .
+            BIND("ra_enthalpy" as ?capability)
+        } UNION {
+            ?this brick:hasPoint ?point .
+            ?point rdf:type brick:Outside_Air_Lockout_Temperature_Setpoint .
+            BIND("oa_lockout" as ?capability)
+        }
+    }
+    """
+
+# blocks shared by the options: ( required, ( ({ var: capability }, { var: constant }), ... ) )
+# The options' queries open with OPTIONAL { ?this rdfs:label ?label }: evaluated first, it binds ?this to every labelled
+# subject, so once the dataset has any label (the ontologies loaded with every building do) unlabelled equipment can't
+# match. The label is required here to match.
+BLOCK_LABEL = (True, (({'?label': 'label'}, {}),))
+# the options' equipment subquery isn't DISTINCT: equipment typed both RTU and AHU matches twice
+BLOCK_EQUIPMENT = (True, (({'?_equipment': 'equipment'}, {}),))
+BLOCK_ACTIVE = (True, (({'?m_b1': 'active'}, {'?m_b1_mode': 'Primary'}), ({'?m_b1': 'active_daf'}, {'?m_b1_mode': 'Alt:DAF'})))
+BLOCK_ECON_MODE = (True, (({'?m_b2': 'econ_mode'}, {}),))
+BLOCK_OAT = (True, (({'?m_b3': 'oat'}, {}),))
+BLOCK_LOCKOUT = (False, (({'?m_ob_1': 'oa_lockout'}, {}),))
 
 # LOGIC OPTIONS
 
@@ -92,12 +184,20 @@ class ASHRAE_Econ_HL_Shutoff_Diff_Enthalpy(object):
         """
     
     _sparql_return = {
-        "SELECT": """
+        "SELECT": f"""
             SELECT ("{name}" as ?option) ?match_id (?this as ?target) ?label ?m_b1_mode ?m_b1 ?m_b2 ?m_b3_mode ?m_b3_1 ?m_b3_2_1 ?m_b3_2_2 ?m_ob_1
             """,
         "CONSTRUCT": None
     }
 
+    # shared matching (MODULE.match(shared=True)): the slots of sparql_query over CAPABILITY_QUERY
+    capability_blocks = (
+        BLOCK_EQUIPMENT, BLOCK_LABEL, BLOCK_ACTIVE, BLOCK_ECON_MODE,
+        (True, (({'?m_b3_1': 'oat'}, {'?m_b3_mode': 'OAT'}), ({'?m_b3_2_1': 'oa_enthalpy', '?m_b3_2_2': 'ra_enthalpy'}, {'?m_b3_mode': 'Enthalpy'}))),
+        BLOCK_LOCKOUT,
+    )
+    _sparql_phases = {"CAPABILITIES": CAPABILITY_QUERY}
+
     # no paths to resolve here (+|*), all direct points and parts which is nice
     diagram_query = """
         CONSTRUCT {
@@ -198,10 +298,14 @@ class ASHRAE_Econ_HL_Shutoff_Diff_Enthalpy(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame]:
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", capabilities:CapabilityTable=None, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        # capabilities: the module's shared capability table, when matching all options together
+        # targets: bind ?this to these (incremental rematch)
+        if return_type == "SELECT" and capabilities is not None:
+            return (None, capabilities.match(self))
+
+        _query = self._sparql_return[return_type] + (self.sparql_query if targets is None else restrict(self.sparql_query, '?this', targets))
+        (res, res_df) = select_df(dataset, _query, option=self.__name__)
         return (res, res_df)
     
     @classmethod
@@ -347,12 +451,16 @@ class ASHRAE_Econ_HL_Shutoff_Fixed_DB(object):
         """
 
     _sparql_return = {
-        "SELECT": """
+        "SELECT": f"""
             SELECT ("{name}" as ?option) ?match_id (?this as ?target) ?label ?m_b1_mode ?m_b1 ?m_b2 ?m_b3 ?m_ob_1
         """,
         "CONSTRUCT": None
     }
 
+    # shared matching (MODULE.match(shared=True)): the slots of sparql_query over CAPABILITY_QUERY
+    capability_blocks = (BLOCK_EQUIPMENT, BLOCK_LABEL, BLOCK_ACTIVE, BLOCK_ECON_MODE, BLOCK_OAT, BLOCK_LOCKOUT)
+    _sparql_phases = {"CAPABILITIES": CAPABILITY_QUERY}
+
     # no paths to resolve here (+|*), all direct points and parts which is nice
     diagram_query = """
         CONSTRUCT {
@@ -439,10 +547,14 @@ class ASHRAE_Econ_HL_Shutoff_Fixed_DB(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame]:
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", capabilities:CapabilityTable=None, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        # capabilities: the module's shared capability table, when matching all options together
+        # targets: bind ?this to these (incremental rematch)
+        if return_type == "SELECT" and capabilities is not None:
+            return (None, capabilities.match(self))
+
+        _query = self._sparql_return[return_type] + (self.sparql_query if targets is None else restrict(self.sparql_query, '?this', targets))
+        (res, res_df) = select_df(dataset, _query, option=self.__name__)
         return (res, res_df)
     
     @classmethod
@@ -543,12 +655,16 @@ class ASHRAE_Econ_HL_Shutoff_Diff_DB(object):
         """
 
     _sparql_return = {
-        "SELECT": """
+        "SELECT": f"""
             SELECT ("{name}" as ?option) ?match_id (?this as ?target) ?label ?m_b1_mode ?m_b1 ?m_b2 ?m_b3 ?m_b4            
             """,
         "CONSTRUCT": None
     }
 
+    # shared matching (MODULE.match(shared=True)): the slots of sparql_query over CAPABILITY_QUERY
+    capability_blocks = (BLOCK_EQUIPMENT, BLOCK_LABEL, BLOCK_ACTIVE, BLOCK_ECON_MODE, BLOCK_OAT, (True, (({'?m_b4': 'rat'}, {}),)))
+    _sparql_phases = {"CAPABILITIES": CAPABILITY_QUERY}
+
     # no paths to resolve here (+|*), all direct points and parts which is nice
     diagram_query = """
         CONSTRUCT {
@@ -630,16 +746,20 @@ class ASHRAE_Econ_HL_Shutoff_Diff_DB(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame]:
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", capabilities:CapabilityTable=None, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        # capabilities: the module's shared capability table, when matching all options together
+        # targets: bind ?this to these (incremental rematch)
+        if return_type == "SELECT" and capabilities is not None:
+            return (None, capabilities.match(self))
+
         # Check ASHRAE Climate Zone first
         # find_climate_zone()
         # guard if not in (0B, 1B, 2B, 3B, 3C, 4B, 4C, 5A, 5B, 5C, 6A, 6B, 7, 8)
         # TODO: Write this
 
         # Query match
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
+        _query = self._sparql_return[return_type] + (self.sparql_query if targets is None else restrict(self.sparql_query, '?this', targets))
+        (res, res_df) = select_df(dataset, _query, option=self.__name__)
         
         return (res, res_df)
     
@@ -753,6 +873,10 @@ class ASHRAE_Econ_HL_Shutoff_Fixed_Enthalpy(object):
         "CONSTRUCT": None
     }
 
+    # shared matching (MODULE.match(shared=True)): the slots of sparql_query over CAPABILITY_QUERY
+    capability_blocks = (BLOCK_EQUIPMENT, BLOCK_LABEL, BLOCK_ACTIVE, BLOCK_ECON_MODE, BLOCK_OAT, (True, (({'?m_b4': 'oa_enthaply'}, {}),)), BLOCK_LOCKOUT)
+    _sparql_phases = {"CAPABILITIES": CAPABILITY_QUERY}
+
     # no paths to resolve here (+|*), all direct points and parts which is nice
     diagram_query = """
         CONSTRUCT {
@@ -846,11 +970,15 @@ class ASHRAE_Econ_HL_Shutoff_Fixed_Enthalpy(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame]:
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", capabilities:CapabilityTable=None, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        # capabilities: the module's shared capability table, when matching all options together
+        # targets: bind ?this to these (incremental rematch)
+        if return_type == "SELECT" and capabilities is not None:
+            return (None, capabilities.match(self))
+
         # Query match
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
+        _query = self._sparql_return[return_type] + (self.sparql_query if targets is None else restrict(self.sparql_query, '?this', targets))
+        (res, res_df) = select_df(dataset, _query, option=self.__name__)
         
         return (res, res_df)
     
@@ -894,20 +1022,43 @@ class MODULE_Air_Economizer_High_Limit_Shutoff_Exceeding_ASHRAE_Standards(object
     )
 
     @classmethod
-    def match(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+    def match(self, dataset:rdflib.Graph, return_type="SELECT", progress:Callable=None, store=None, shared=True, targets:list=None, budget:QueryBudget=None) -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+        """
+        progress: optional function(logic_option, rank, df_option) called as each logic option finishes matching
+        store: optional lib.match_store.MatchScope to answer find_matches from (and save to) the persistent match store
+        shared: match every option from one capability table (CAPABILITY_QUERY) instead of running each option's query
+        targets: only match these candidate targets (incremental rematch); the store holds whole model results, so isn't used
+        budget: per logic option query limits (lib.query_budget); an option that exceeds its budget is left out of the
+            result and recorded in budget.exceeded
+        """
+        budget = budget if budget is not None else QueryBudget()
         df_output = pd.DataFrame()
         res_output = {}
+        if shared and return_type == "SELECT":
+            # queried when the first option that isn't in the store needs it
+            query = CAPABILITY_QUERY if targets is None else restrict(CAPABILITY_QUERY, '?this', targets)
+            match_kwargs = {'capabilities': CapabilityTable(dataset, query, option=self.__name__, budget=budget, logic_options=self.logic_modules)}
+        else:
+            match_kwargs = {'targets': targets} if targets is not None else {}
+        store = store if targets is None else None
 
         for rank, logic_option in enumerate(self.logic_modules):
             # get matches
-            res_option, df_option = logic_option.find_matches(dataset, return_type)
+            try:
+                with stage("find_matches", option=logic_option.__name__), budget.option(logic_option):
+                    res_option, df_option = (store.find_matches(logic_option, dataset, return_type, **match_kwargs) if store
+                                             else logic_option.find_matches(dataset, return_type, **match_kwargs))
+            except BudgetExceeded as e:
+                # partial results for the module: the other options still match
+                budget.record(e)
+                continue
             if(return_type=="SELECT"):
             # add rank index, link to class
                 df_option['_rank'] = rank
                 df_option['_module'] = self.uuid or None
                 df_option['_logic'] = logic_option.uuid
                 df_option['_logic_name'] = logic_option.__name__
-                df_option['_match_id'] = [uuid.uuid4() for _ in range(len(df_option.index))]
+                df_option['_match_id'] = match_ids(logic_option, df_option)
 
             if(return_type=="CONSTRUCT"):
                 # add the module relationship and entity
@@ -919,6 +1070,10 @@ class MODULE_Air_Economizer_High_Limit_Shutoff_Exceeding_ASHRAE_Standards(object
 
             # add to outputs
             res_output[logic_option.__name__] = res_option
+            if(return_type=="SELECT"):
+                # same fill as the output below, so progress sees the option's rows as the result will hold them
+                df_option.fillna(0, inplace=True)
+            if progress: progress(logic_option, rank, df_option)
             df_output = pd.concat([df_output, df_option], ignore_index=True)
             df_output.fillna(0, inplace=True) # some NaNs are being returned; need to address this earlier.
         
@@ -933,7 +1088,7 @@ class MODULE_Air_Economizer_High_Limit_Shutoff_Exceeding_ASHRAE_Standards(object
         # lookup logic option (should only be 1, hence we take first element of list)
         logic_option = next( iter(filter(lambda x: str(x.uuid) == match_record['_logic'], self.logic_modules)), None)
         # run diagram graph creator
-        diagram_g = dataset.query(logic_option.diagram_query, initBindings={'target': rdflib.URIRef(match_record['?target'])})
+        diagram_g = construct(dataset, logic_option.diagram_query, option=logic_option.__name__, initBindings={'target': rdflib.URIRef(match_record['?target'])})
         # process graph in 
 
         return diagram_g
@@ -8,7 +8,11 @@ import math
 from functools import reduce
 from ..helpers import flatten
 
-from ..logic_master import classEnum
+from ..logic_master import classEnum, match_ids
+from ..query_helpers import select_rows, values_clause, restrict, construct
+from ..instrumentation import stage
+from ..sensor_index import SensorIdIndex, MissingSensorIdsError
+from ..query_budget import QueryBudget, BudgetExceeded
 
 class ASHRAE_Pressure_Trim_and_Respond(object):
     cType = classEnum.LOGIC_OPTION
@@ -57,9 +61,59 @@ class ASHRAE_Pressure_Trim_and_Respond(object):
         "SELECT": f"""
             SELECT ("{name}" as ?option) ?match_id ?target (?p1 as ?m_b1) (?p2 as ?m_b2) ?terminal_unit (?tu_damperPos as ?m_b3)
             """,
+        # aggregate="store": the store collapses damper points per terminal unit, so the flat cross product never leaves it
+        "SELECT_GROUPED": """
+            SELECT ?target (?p1 as ?m_b1) (?p2 as ?m_b2) ?terminal_unit (GROUP_CONCAT(DISTINCT STR(?tu_damperPos); separator=" ") as ?m_b3)
+            """,
+        "GROUP_BY": """
+            GROUP BY ?target ?p1 ?p2 ?terminal_unit
+            """,
         "CONSTRUCT": None
     }
 
+    # aggregate="phased": sparql_query split so no query joins target points, terminal units and damper points together.
+    # Rows come to (#p1 + #p2) per target + terminal units fed + damper points, rather than their product; the joins
+    # are dict lookups in find_matches.
+    _sparql_phases = {
+        # 1. qualify targets: each row is one candidate for one of the target point slots
+        "TARGET_POINTS": """
+            SELECT DISTINCT ?target ?slot ?point
+            WHERE {
+                ?target rdf:type/rdfs:subClassOf* brick:Equipment .
+                {
+                    ?target brick:hasPoint ?point .
+                    ?point rdf:type brick:Discharge_Air_Static_Pressure_Sensor .
+                    BIND("m_b1" as ?slot)
+                } UNION {
+                    ?target brick:hasPoint ?point .
+                    ?point rdf:type brick:Discharge_Air_Static_Pressure_Setpoint .
+                    BIND("m_b2" as ?slot)
+                }
+            }
+            """,
+        # 2. terminal units fed by the qualified targets (VALUES is filled in by find_matches)
+        "TERMINAL_UNITS": """
+            SELECT DISTINCT ?target ?terminal_unit
+            WHERE {{
+                {values}
+                ?target brick:feeds* ?terminal_unit .
+                ?terminal_unit rdf:type/rdfs:subClassOf* brick:Terminal_Unit .
+            }}
+            """,
+        # 3. discharge damper points by terminal unit. Not restricted by VALUES: the store joins a VALUES block into
+        # this pattern row by row (~100x slower here than fetching every damper point and dropping the unfed ones)
+        "DAMPER_POINTS": """
+            SELECT DISTINCT ?terminal_unit ?tu_damperPos
+            WHERE {
+                ?terminal_unit brick:hasPart ?damper .
+                ?damper rdf:type switch:Discharge_Damper .
+                ?damper brick:hasPoint ?tu_damperPos .
+                ?tu_damperPos rdf:type ?damperPosType .
+                VALUES ?damperPosType { brick:Position_Sensor brick:Position_Command } .
+            }
+            """,
+    }
+
     # def _diagram_query(target):
     #     return f"""
     #         CONSTRUCT {{
@@ -198,29 +252,84 @@ class ASHRAE_Pressure_Trim_and_Respond(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame, pd.DataFrame]:
-        # Initial SPARQL Query
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
-
-        # Process Results
-        # 1. collapse terminal unit damper pos into list[] per terminal unit (by all other fields) -> L[tu_dmpr_pos]
-        # 2. grouped by target with values list[target_p1], list[target_p2], list[ L[tu_dmpr_pos] ]
-        #
-        # This give us, for each target, a list of possible p1 & p2 points to pick, AND a list damper pos points for each terminal unit it feeds, with each list element being a list of all valid
-        # points for that particular Terminal Unit!
-
-        res_grp = res_df.astype(str).groupby(by=['?option', '?target', '?m_b1', '?m_b2', '?terminal_unit'], group_keys=True)['?m_b3'].apply(set).reset_index()
-        final_res = res_grp.groupby(by=['?option', '?target']).agg({'?m_b1': set, '?m_b2': set, '?terminal_unit': list, '?m_b3': list}).reset_index()
-        
-        # query result, query result Dataframe, Processed Matched DataFrame
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", aggregate="phased", targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame, pd.DataFrame]:
+        """
+        aggregate: "phased" qualifies targets on their points, then fetches downstream damper points for those targets
+                   only (_sparql_phases), merging the two in Python;
+                   "store" runs the single query grouped (GROUP BY / GROUP_CONCAT) and folds the grouped rows as they stream
+        targets: bind ?target to these (incremental rematch)
+        """
+        if return_type != "SELECT":
+            raise ValueError(f"{self.__name__} has no {return_type} query")
+        if aggregate == "phased":
+            return self._find_matches_phased(dataset, targets)
+        if aggregate == "store":
+            return self._find_matches_grouped(dataset, targets)
+        raise ValueError(f"Unknown aggregate '{aggregate}'. Use one of phased, store")
+
+    @classmethod
+    def _find_matches_grouped(self, dataset:rdflib.Graph, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        # one row per target / p1 / p2 / terminal unit, with that terminal unit's damper points space separated
+        _query = self._sparql_return["SELECT_GROUPED"] + self.sparql_query + self._sparql_return["GROUP_BY"]
+        if targets is not None: _query = restrict(_query, '?target', targets)
+        (res, rows) = select_rows(dataset, _query, option=self.__name__)
+
+        # fold into a row per target: set of p1s, set of p2s, and per terminal unit its set of damper points
+        targets = {}
+        for target, m_b1, m_b2, terminal_unit, m_b3 in rows:
+            targets.setdefault(target, []).append((m_b1, m_b2, terminal_unit, {rdflib.URIRef(p) for p in m_b3.split(" ")}))
+
+        option = rdflib.Literal(self.name)
+        final_res = pd.DataFrame([
+            (option, target, {r[0] for r in tus}, {r[1] for r in tus}, [r[2] for r in tus], [r[3] for r in tus])
+            for target, tus in sorted(targets.items()) for tus in [sorted(tus, key=lambda r: r[:3])]
+        ], columns=['?option', '?target', '?m_b1', '?m_b2', '?terminal_unit', '?m_b3'])
+
+        return (res, final_res)
+
+    @classmethod
+    def _find_matches_phased(self, dataset:rdflib.Graph, targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        option = rdflib.Literal(self.name)
+        columns = ['?option', '?target', '?m_b1', '?m_b2', '?terminal_unit', '?m_b3']
+
+        # 1. target point candidates; a target qualifies with at least one of each
+        _query = self._sparql_phases["TARGET_POINTS"]
+        if targets is not None: _query = restrict(_query, '?target', targets)
+        (res, rows) = select_rows(dataset, _query, option=self.__name__)
+        points = {}
+        for target, slot, point in rows:
+            points.setdefault(target, {'m_b1': set(), 'm_b2': set()})[slot.toPython()].add(point)
+        qualified = sorted(t for t, slots in points.items() if slots['m_b1'] and slots['m_b2'])
+        if not qualified: return (res, pd.DataFrame(columns=columns))
+
+        # 2. terminal units downstream of each qualified target
+        (res, rows) = select_rows(dataset, self._sparql_phases["TERMINAL_UNITS"].format(values=values_clause('?target', qualified)), option=self.__name__)
+        terminal_units = {}
+        for target, terminal_unit in rows:
+            terminal_units.setdefault(target, set()).add(terminal_unit)
+        fed = set().union(*terminal_units.values())
+
+        # 3. damper points of the terminal units fed; bound to them when only a few targets are being matched
+        _query = self._sparql_phases["DAMPER_POINTS"]
+        if targets is not None: _query = restrict(_query, '?terminal_unit', sorted(fed), filter=True)
+        (res, rows) = select_rows(dataset, _query, option=self.__name__)
+        damper_points = {}
+        for terminal_unit, tu_damperPos in rows:
+            if terminal_unit in fed: damper_points.setdefault(terminal_unit, set()).add(tu_damperPos)
+
+        # merge: as in the single query's join, a terminal unit needs a damper point and a target a terminal unit
+        final_res = pd.DataFrame([
+            (option, target, points[target]['m_b1'], points[target]['m_b2'], tus, [damper_points[tu] for tu in tus])
+            for target in qualified for tus in [sorted(tu for tu in terminal_units.get(target, ()) if tu in damper_points)] if tus
+        ], columns=columns)
+
         return (res, final_res)
 
     @classmethod
-    def prepare_match(self, match:pd.DataFrame, modelQueryFunc:Callable=None, modelQueryFuncArgs:dict={}) -> Tuple[dict, dict]:
+    def prepare_match(self, match:pd.DataFrame, modelQueryFunc:Callable=None, modelQueryFuncArgs:dict={}, index:SensorIdIndex=None) -> Tuple[dict, dict]:
         """
         modelQueryFunc: function(entities:list, **args) -> dict{ entity_subject:str, remote_telemetery_id_for_entity:str }
+        index: lib.sensor_index.SensorIdIndex for the loaded model; resolves the ids in memory, and is used over modelQueryFunc
         RETURNS: Tuple( List of sensor entities, dict of module slots for logic usage )
 
         Notes:
@@ -229,9 +338,9 @@ class ASHRAE_Pressure_Trim_and_Respond(object):
         # Get just sensors needed for logic to run (remove alternates)
         # No method for user choice here yet, just going to take index 0 option.
         sensors_in_use = {
-                'm_b1': list(match['?m_b1'])[0].toPython(),
-                'm_b2': list(match['?m_b2'])[0].toPython(),
-                'm_b3': [ list(pnts)[0].toPython() for pnts in match['?m_b3'] ]
+                'm_b1': next(iter(match['?m_b1'])).toPython(),
+                'm_b2': next(iter(match['?m_b2'])).toPython(),
+                'm_b3': [ next(iter(pnts)).toPython() for pnts in match['?m_b3'] ]
             }
 
         # Reduce to simple list of sensors
@@ -239,18 +348,22 @@ class ASHRAE_Pressure_Trim_and_Respond(object):
         for v in sensors_in_use.values():
             sensors.update(flatten(v))
         
-        module_sensors={}
-        # If the model query function has been provided, use it to get entity ids for telemetry
-        if modelQueryFunc:
+        sensor_id_map, module_sensors = {}, {}
+        # Resolve entity ids for telemetry: from the index in one pass, or with the model query function
+        if index is not None:
+            sensor_id_map, missing = index.resolve(sorted(sensors))
+            if missing: raise MissingSensorIdsError(missing)
+        elif modelQueryFunc:
             sensor_id_map = modelQueryFunc(**{"entities": list(sensors), **modelQueryFuncArgs})
+        else:
+            print("Model query function not provided; unable to fetch external store telemetry ids for provided entities.")
 
+        if index is not None or modelQueryFunc:
             module_sensors = {
                 'm_b1': sensor_id_map[ sensors_in_use['m_b1'] ],
                 'm_b2': sensor_id_map[ sensors_in_use['m_b2'] ],
                 'm_b3': [ sensor_id_map[ s ] for s in sensors_in_use['m_b3'] ]
             }
-        else:
-            print("Model query function not provided; unable to fetch external store telemetry ids for provided entities.")
         
         return ( sensor_id_map, module_sensors)
 
@@ -441,20 +554,37 @@ class MODULE_ASHRAE_Pressure_Trim_and_Respond(object):
     )
 
     @classmethod
-    def match(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+    def match(self, dataset:rdflib.Graph, return_type="SELECT", progress:Callable=None, store=None, targets:list=None, budget:QueryBudget=None) -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+        """
+        progress: optional function(logic_option, rank, df_option) called as each logic option finishes matching
+        store: optional lib.match_store.MatchScope to answer find_matches from (and save to) the persistent match store
+        targets: only match these candidate targets (incremental rematch); the store holds whole model results, so isn't used
+        budget: per logic option query limits (lib.query_budget); an option that exceeds its budget is left out of the
+            result and recorded in budget.exceeded
+        """
+        budget = budget if budget is not None else QueryBudget()
         df_output = pd.DataFrame()
         res_output = {}
+        match_kwargs = {'targets': targets} if targets is not None else {}
+        store = store if targets is None else None
 
         for rank, logic_option in enumerate(self.logic_modules):
             # get matches
-            res_option, df_option = logic_option.find_matches(dataset, return_type)
+            try:
+                with stage("find_matches", option=logic_option.__name__), budget.option(logic_option):
+                    res_option, df_option = (store.find_matches(logic_option, dataset, return_type, **match_kwargs) if store
+                                             else logic_option.find_matches(dataset, return_type, **match_kwargs))
+            except BudgetExceeded as e:
+                # partial results for the module: the other options still match
+                budget.record(e)
+                continue
             if(return_type=="SELECT"):
             # add rank index, link to class
                 df_option['_rank'] = rank
                 df_option['_module'] = self.uuid or None
                 df_option['_logic'] = logic_option.uuid
                 df_option['_logic_name'] = logic_option.__name__
-                df_option['_match_id'] = [uuid.uuid4() for _ in range(len(df_option.index))]
+                df_option['_match_id'] = match_ids(logic_option, df_option)
                 
             if(return_type=="CONSTRUCT"):
                 # add the module relationship and entity
@@ -466,6 +596,7 @@ class MODULE_ASHRAE_Pressure_Trim_and_Respond(object):
 
             # add to outputs
             res_output[logic_option.__name__] = res_option
+            if progress: progress(logic_option, rank, df_option)
             df_output = pd.concat([df_output, df_option], ignore_index=True)
         
         return (res_output, df_output)
@@ -479,7 +610,7 @@ class MODULE_ASHRAE_Pressure_Trim_and_Respond(object):
         # lookup logic option (should only be 1, hence we take first element of list)
         logic_option = next( iter(filter(lambda x: str(x.uuid) == match_record['_logic'], self.logic_modules)), None)
         # run diagram graph creator
-        diagram_g = dataset.query(logic_option.diagram_query, initBindings={'target': rdflib.URIRef(match_record['?target'])})
+        diagram_g = construct(dataset, logic_option.diagram_query, option=logic_option.__name__, initBindings={'target': rdflib.URIRef(match_record['?target'])})
         # process graph in 
 
         return diagram_g
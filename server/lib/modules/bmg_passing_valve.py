@@ -3,7 +3,10 @@ import pandas as pd
 from typing import Tuple, Dict, Callable
 import uuid
 
-from ..logic_master import classEnum
+from ..logic_master import classEnum, match_ids
+from ..query_helpers import select_rows, restrict, construct
+from ..instrumentation import stage
+from ..query_budget import QueryBudget, BudgetExceeded
 from ..helpers import flatten
 
 # OPTIONS
@@ -51,6 +54,13 @@ class BMG_Passing_Valve_MATvsDAT(object):
         "SELECT": f"""
             SELECT ("{name}" as ?option) ?target ?m_b1 ?m_b2 ?valve ?valve_class ?v_pos ?valve_class_simple (strUUID() as ?row_id)            
             """,
+        # what find_matches runs: the store collapses valves / position points per valve type, as space separated "valve v_pos" pairs
+        "SELECT_GROUPED": """
+            SELECT ?target ?m_b1 ?m_b2 ?valve_class_simple (GROUP_CONCAT(CONCAT(STR(?valve), " ", STR(?v_pos)); separator=" ") as ?valve_pos)
+            """,
+        "GROUP_BY": """
+            GROUP BY ?target ?m_b1 ?m_b2 ?valve_class_simple
+            """,
         "CONSTRUCT": None
     }
 
@@ -115,31 +125,34 @@ class BMG_Passing_Valve_MATvsDAT(object):
     """
 
     @classmethod
-    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[rdflib.query.Result, pd.DataFrame]:
-        # Initial SPARQL Query
-        _query = self._sparql_return[return_type] + self.sparql_query
-        res = dataset.query(_query)
-        res_df = pd.DataFrame(res, columns=[v.toPython() for v in res.vars])
-
-        # Process Results
-        # 1. collapse valve pos into list[] per valve (by all other fields) -> L[v_pos]
-        # 2. TODO: Redo this - group instead of pivot. Makes it cleaner
-        #    Pivot valve by valve_class
-        # 3. grouped by target with values list[m_b1], list[m_b2], list[valves], list[ L[v_pos] ]
-        #
-        # This give us a format for the values of -> ?valve: valve_type[ valves[] ], ?valve_class_simple: valve_type[], ?v_pos: valve_type[ valves[ valve_pos_points{} ] ]
+    def find_matches(self, dataset:rdflib.Graph, return_type="SELECT", targets:list=None) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+        """
+        Groups in the query (GROUP BY / GROUP_CONCAT) and folds the grouped rows into a row per target as they stream.
+        targets: bind ?target to these (incremental rematch)
+        """
+        if return_type != "SELECT":
+            raise ValueError(f"{self.__name__} has no {return_type} query")
+
+        # one row per target / m_b1 / m_b2 / valve type, with its (valve, position point) pairs
+        _query = self._sparql_return["SELECT_GROUPED"] + self.sparql_query + self._sparql_return["GROUP_BY"]
+        if targets is not None: _query = restrict(_query, '?target', targets, filter=True)
+        (res, rows) = select_rows(dataset, _query, option=self.__name__)
+
+        # fold into a row per target, with values -> ?valve: valve_type[ valves[] ], ?valve_class_simple: valve_type[], ?v_pos: valve_type[ valves[ valve_pos_points{} ] ]
         # in english: ?valve: list of valves for each valve simple type in same order as ?valve_class_simple. ?valve_class_simple: list of simple valve class names. ?v_pos: list of valve position points per valve, per valve type ?v_pos[valve_class_type][valve][valve_pos_point]
+        # m_b1 and m_b2 are sets, as they repeat for every valve type matched on the target.
+        targets = {}
+        for target, m_b1, m_b2, valve_class_simple, valve_pos in rows:
+            pairs = valve_pos.split(" ")
+            targets.setdefault(target, []).append((m_b1, m_b2, valve_class_simple.toPython(),
+                                                   [rdflib.URIRef(v) for v in pairs[0::2]], [{rdflib.URIRef(p)} for p in pairs[1::2]]))
 
-        res_grp = res_df.astype(str).groupby(by=['?row_id', '?option', '?target', '?m_b1', '?m_b2', '?valve', '?valve_class_simple'], group_keys=True)['?v_pos'].apply(set).reset_index()
-        # process simple class to string
-        res_grp['?valve_class_simple'] = res_grp['?valve_class_simple'].apply(lambda x: x.toPython())
-        # group into row per valve type, per target
-        res_vlv_pvt = res_grp.groupby(by=['?option', '?target', '?m_b1', '?m_b2', '?valve_class_simple'], group_keys=True).agg({'?valve':list, '?v_pos':list}).reset_index()
+        option = rdflib.Literal(self.name)
+        final_res = pd.DataFrame([
+            (option, target, {r[0] for r in grps}, {r[1] for r in grps}, [r[3] for r in grps], [r[2] for r in grps], [r[4] for r in grps])
+            for target, grps in sorted(targets.items()) for grps in [sorted(grps, key=lambda r: r[:3])]
+        ], columns=['?option', '?target', '?m_b1', '?m_b2', '?valve', '?valve_class_simple', '?v_pos'])
 
-        # we take the set for target points m_b1 and m_b2 as these are repeated in many rows for each terminal unit match. We only need the unique points.
-        # the terminal units are lists as these have already been grouped so are unique, and we want to preserve list order.
-        final_res = res_vlv_pvt.groupby(by=['?option', '?target'], as_index=False).agg({'?m_b1': set, '?m_b2': set, '?valve': list, '?valve_class_simple': list, '?v_pos': list}).reset_index()
-        
         return (res, final_res)
     
     @classmethod
@@ -200,20 +213,37 @@ class MODULE_BMG_Passing_Valve(object):
     )
 
     @classmethod
-    def match(self, dataset:rdflib.Graph, return_type="SELECT") -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+    def match(self, dataset:rdflib.Graph, return_type="SELECT", progress:Callable=None, store=None, targets:list=None, budget:QueryBudget=None) -> Tuple[ Dict[str, rdflib.query.Result], pd.DataFrame ]:
+        """
+        progress: optional function(logic_option, rank, df_option) called as each logic option finishes matching
+        store: optional lib.match_store.MatchScope to answer find_matches from (and save to) the persistent match store
+        targets: only match these candidate targets (incremental rematch); the store holds whole model results, so isn't used
+        budget: per logic option query limits (lib.query_budget); an option that exceeds its budget is left out of the
+            result and recorded in budget.exceeded
+        """
+        budget = budget if budget is not None else QueryBudget()
         df_output = pd.DataFrame()
         res_output = {}
+        match_kwargs = {'targets': targets} if targets is not None else {}
+        store = store if targets is None else None
 
         for rank, logic_option in enumerate(self.logic_modules):
             # get matches
-            res_option, df_option = logic_option.find_matches(dataset, return_type)
+            try:
+                with stage("find_matches", option=logic_option.__name__), budget.option(logic_option):
+                    res_option, df_option = (store.find_matches(logic_option, dataset, return_type, **match_kwargs) if store
+                                             else logic_option.find_matches(dataset, return_type, **match_kwargs))
+            except BudgetExceeded as e:
+                # partial results for the module: the other options still match
+                budget.record(e)
+                continue
             if(return_type=="SELECT"):
             # add rank index, link to class
                 df_option['_rank'] = rank
                 df_option['_module'] = self.uuid or None
                 df_option['_logic'] = logic_option.uuid
                 df_option['_logic_name'] = logic_option.__name__
-                df_option['_match_id'] = [uuid.uuid4() for _ in range(len(df_option.index))]
+                df_option['_match_id'] = match_ids(logic_option, df_option)
 
             if(return_type=="CONSTRUCT"):
                 # add the module relationship and entity
@@ -225,6 +255,10 @@ class MODULE_BMG_Passing_Valve(object):
 
             # add to outputs
             res_output[logic_option.__name__] = res_option
+            if(return_type=="SELECT"):
+                # same fill as the output below, so progress sees the option's rows as the result will hold them
+                df_option.fillna(0, inplace=True)
+            if progress: progress(logic_option, rank, df_option)
             df_output = pd.concat([df_output, df_option], ignore_index=True)
             df_output.fillna(0, inplace=True) # some NaNs are being returned; need to address this earlier.
         
@@ -239,7 +273,7 @@ class MODULE_BMG_Passing_Valve(object):
         # lookup logic option (should only be 1, hence we take first element of list)
         logic_option = next( iter(filter(lambda x: str(x.uuid) == match_record['_logic'], self.logic_modules)), None)
         # run diagram graph creator
-        diagram_g = dataset.query(logic_option.diagram_query, initBindings={'target': rdflib.URIRef(match_record['?target'])})
+        diagram_g = construct(dataset, logic_option.diagram_query, option=logic_option.__name__, initBindings={'target': rdflib.URIRef(match_record['?target'])})
         # process graph in 
 
         return diagram_g
@@ -0,0 +1,182 @@
+import time
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from .instrumentation import METRICS
+
+# Per logic option limits on query time and result rows, so one pathological model can't hold a worker indefinitely.
+#
+# A module match runs each logic option under its budget (QueryBudget.option); the query helpers (lib.query_helpers)
+# count result rows against it as they are read, raising BudgetExceeded once either is spent. The option's matches are
+# dropped and the module goes on with the next one; QueryBudget.exceeded lists the options that ran out, for the
+# response.
+#
+# With a time limit, a SELECT's rows are pulled from the store by a worker thread and the match waits for them only
+# until the deadline, so a query that hands over nothing for a long time (GROUP BY, ORDER BY, a slow join) still
+# returns control at the deadline. The store can't be interrupted inside an evaluation, though: the abandoned worker
+# runs it to the end (or to its next row, for a streaming query) and its rows are discarded. What is bounded is how long
+# a request waits, not the work the store does. CONSTRUCTs are materialised on the caller's thread and only checked once
+# they return.
+#
+# A logic option class can set query_budget = dict(seconds=..., max_rows=...) to override the defaults.
+#
+# A query several options share (lib.capabilities.CapabilityTable) runs under its own budget, the sum of theirs
+# (QueryBudget.shared), rather than out of whichever option needs it first; when it runs out, the overrun is recorded
+# once, against the shared query, listing the options left without matches.
+
+# rows read between deadline checks, and handed over per batch by the worker pulling a query's rows
+CHECK_EVERY = 64
+
+class BudgetExceeded(Exception):
+    def __init__(self, option:str, limit:str, elapsed:float, rows:int, seconds:float=None, max_rows:int=None, options:list=None):
+        """
+        limit: 'time' | 'rows', whichever ran out
+        options: for a shared query, the logic options that depend on it
+        """
+        self.option = option
+        self.options = options
+        self.limit = limit
+        self.elapsed = elapsed
+        self.rows = rows
+        self.seconds = seconds
+        self.max_rows = max_rows
+        super().__init__(f"{option} exceeded its query {limit} budget ({elapsed:.2f}s of {seconds}s, {rows} of {max_rows} rows)")
+
+    def record(self) -> dict:
+        return {'option': self.option, 'limit': self.limit, 'elapsed_s': round(self.elapsed, 3), 'rows': self.rows,
+                'budget': {'seconds': self.seconds, 'max_rows': self.max_rows}, **({'options': self.options} if self.options else {})}
+
+class OptionBudget(object):
+    """The running budget of one logic option: a deadline and a row allowance shared by all of its queries"""
+    def __init__(self, option:str, seconds:float=None, max_rows:int=None, options:list=None):
+        self.option = option
+        self.options = options
+        self.seconds = seconds
+        self.max_rows = max_rows
+        self.start = time.perf_counter()
+        self.deadline = self.start + seconds if seconds is not None else None
+        self.rows = 0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.seconds is None and self.max_rows is None
+
+    def check(self, rows:int=0):
+        """Count rows read outside rows_of (e.g. CONSTRUCT triples) and raise BudgetExceeded if the budget is spent"""
+        self.rows += rows
+        if self.max_rows is not None and self.rows > self.max_rows: raise self.exceeded('rows')
+        if self.deadline is not None and time.perf_counter() > self.deadline: raise self.exceeded('time')
+
+    def rows_of(self, rows:Iterable) -> Iterator:
+        """rows, counted against the budget as they are read"""
+        if self.unlimited:
+            yield from rows
+            return
+        max_rows = self.max_rows if self.max_rows is not None else float('inf')
+        self.check()
+        if self.deadline is not None: rows = _pulled(rows, self)
+        for row in rows:
+            self.rows += 1
+            if self.rows > max_rows: raise self.exceeded('rows')
+            if not self.rows % CHECK_EVERY: self.check()
+            yield row
+        self.check()
+
+    def exceeded(self, limit:str) -> BudgetExceeded:
+        return BudgetExceeded(self.option, limit, time.perf_counter() - self.start, self.rows, self.seconds, self.max_rows, self.options)
+
+class QueryBudget(object):
+    """Budgets for the logic options of one match run, and a record of the options that exceeded theirs"""
+    def __init__(self, seconds:float=None, max_rows:int=None):
+        """seconds / max_rows: per option defaults; None for no limit"""
+        self.defaults = {'seconds': seconds, 'max_rows': max_rows}
+        self.exceeded = []
+        self._recorded = set()
+
+    def limits(self, logic_option) -> dict:
+        return {**self.defaults, **(getattr(logic_option, 'query_budget', None) or {})}
+
+    def option(self, logic_option):
+        """Run the block's queries (through lib.query_helpers) under logic_option's budget"""
+        return _running(OptionBudget(logic_option.__name__, **self.limits(logic_option)))
+
+    def shared(self, name:str, logic_options):
+        """
+        Run the block's queries under a budget of their own, the sum of logic_options' (no limit where any of theirs has
+        none); for a query the options share, inside whichever option's budget needs it first
+        """
+        limits = [self.limits(o) for o in logic_options]
+        total = lambda k: None if any(l[k] is None for l in limits) else sum(l[k] for l in limits)
+        return _running(OptionBudget(name, total('seconds'), total('max_rows'), options=[o.__name__ for o in logic_options]))
+
+    def record(self, e:BudgetExceeded):
+        """Record an overrun; a shared query's is raised again for each option depending on it, and recorded once"""
+        if id(e) in self._recorded: return
+        self._recorded.add(id(e))
+        print(f"{e}; the matches of {', '.join(e.options or [e.option])} are left out of the result")
+        METRICS.inc("query_budget_exceeded", option=e.option, limit=e.limit)
+        self.exceeded.append(e.record())
+
+_DONE = object()
+
+def _pulled(rows:Iterable, budget:OptionBudget) -> Iterator:
+    """rows, read in batches by a worker thread; raises BudgetExceeded at the budget's deadline even if no row arrives"""
+    batches = queue.Queue(maxsize=4)
+    stop = threading.Event()
+
+    def hand_over(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def pull():
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) == CHECK_EVERY:
+                    if not hand_over(batch): return
+                    batch = []
+            hand_over(batch)
+            hand_over(_DONE)
+        except Exception as e:
+            hand_over(e)
+
+    threading.Thread(target=pull, name=f"query:{budget.option}", daemon=True).start()
+    try:
+        while True:
+            try:
+                item = batches.get(timeout=max(budget.deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                raise budget.exceeded('time')
+            if item is _DONE: return
+            if isinstance(item, Exception): raise item
+            yield from item
+    finally:
+        # the worker stops at its next hand over; an evaluation it is blocked in runs to the end unobserved
+        stop.set()
+
+_active = contextvars.ContextVar("query_budget", default=None)
+
+@contextmanager
+def _running(budget:OptionBudget):
+    token = _active.set(budget)
+    try:
+        yield budget
+    finally:
+        _active.reset(token)
+
+def active_budget() -> OptionBudget:
+    return _active.get()
+
+def within_budget(rows:Iterable) -> Iterable:
+    """rows counted against the active option budget, if there is one"""
+    budget = active_budget()
+    return budget.rows_of(rows) if budget else rows
@@ -0,0 +1,82 @@
+import re
+import time
+import rdflib
+import pandas as pd
+from typing import Tuple, Iterator
+from rdflib.query import ResultRow
+
+from .instrumentation import record_query
+from .sparql_profiler import active_session
+from .query_budget import active_budget, within_budget
+
+# Thin wrappers around dataset.query used by the logic modules, so every module query is timed and counted the same way
+# and can be routed through the profiler (lib.sparql_profiler.profiling). Rows are read against the logic option's query
+# budget, when one is active (lib.query_budget).
+
+def select_df(dataset:rdflib.Graph, query:str, option:str=None, **kwargs) -> Tuple[rdflib.query.Result, pd.DataFrame]:
+    """
+    Run a SELECT and load it into a DataFrame with '?var' column names.
+    option: logic option name the query belongs to; used as the metrics label
+    RETURNS: ( query result, result DataFrame )
+    """
+    start = time.perf_counter()
+    res = session.query(dataset, query, option=option, **kwargs) if (session := active_session()) else dataset.query(query, **kwargs)
+    rows = []
+    try:
+        rows.extend(within_budget(res))
+    finally:
+        record_query("select", time.perf_counter() - start, len(rows), option=option)
+    return (res, pd.DataFrame(rows, columns=[v.toPython() for v in res.vars]))
+
+def select_rows(dataset:rdflib.Graph, query:str, option:str=None, **kwargs) -> Tuple[rdflib.query.Result, Iterator[ResultRow]]:
+    """
+    Run a SELECT for a caller that folds the rows into its own structure as they arrive.
+    Iterating an rdflib Result keeps every row in Result.bindings; when the store hands rows over lazily (oxrdflib
+    does) they are read from its generator instead, so nothing holds on to a row once it has been folded.
+    RETURNS: ( query result, row iterator ); timing / row count are recorded when the iterator is exhausted
+    """
+    start = time.perf_counter()
+    res = session.query(dataset, query, option=option, **kwargs) if (session := active_session()) else dataset.query(query, **kwargs)
+
+    def rows():
+        if getattr(res, '_genbindings', None) is not None:
+            bindings, res._genbindings = res._genbindings, None
+            for b in bindings:
+                if b: yield ResultRow(b, res.vars)
+        else:
+            yield from res
+
+    def counted():
+        count = 0
+        try:
+            for row in within_budget(rows()):
+                count += 1
+                yield row
+        finally:
+            record_query("select", time.perf_counter() - start, count, option=option)
+
+    return (res, counted())
+
+def values_clause(var:str, terms) -> str:
+    """Inline VALUES block binding `var` (e.g. '?target') to each of terms; initBindings only binds a single value"""
+    return f"VALUES {var} {{ {' '.join(t.n3() for t in terms)} }}"
+
+def restrict(query:str, var:str, terms, filter:bool=False) -> str:
+    """
+    query with `var` bound to terms, by a VALUES block at the top of its (outermost) WHERE.
+    filter: FILTER(var IN (...)) at the end of the WHERE instead; some patterns the store evaluates far faster unbound
+    and filtered than joined with VALUES row by row, and others the reverse, so this is chosen per query by measuring
+    """
+    if filter:
+        end = query.rindex("}")
+        return f"{query[:end]}    FILTER({var} IN ({', '.join(t.n3() for t in terms)}))\n        {query[end:]}"
+    return re.sub(r"WHERE\s*\{", lambda m: f"{m.group(0)}\n            {values_clause(var, terms)}", query, count=1)
+
+def construct(dataset:rdflib.Graph, query:str, option:str=None, **kwargs) -> rdflib.query.Result:
+    """Run a CONSTRUCT; the result graph is materialised before returning so the timing covers evaluation"""
+    start = time.perf_counter()
+    res = session.query(dataset, query, option=option, **kwargs) if (session := active_session()) else dataset.query(query, **kwargs)
+    triples = len(res.graph) if res.graph is not None else 0
+    record_query("construct", time.perf_counter() - start, triples, option=option)
+    if budget := active_budget(): budget.check(triples)
+    return res
@@ -0,0 +1,86 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+# Recent match results per module, so a client that already holds one can be sent just the difference.
+#
+# A result version is the content hash of the serialised matches and targets, so recomputing an unchanged result (a
+# force_rematch, the same model uploaded again) gives the version the client already has. The last `keep` versions of
+# each module are kept as { _match_id: record } and { target: record }; the records are the same objects the result
+# cache holds, so history costs little beyond the index dicts.
+
+MATCH_KEY = '_match_id'
+TARGET_KEY = 'target'
+
+def result_version(matches_json:str, targets_json:str) -> str:
+    return hashlib.sha1(f"{matches_json}\0{targets_json}".encode()).hexdigest()[:16]
+
+def diff(old:Dict[str, dict], new:Dict[str, dict]) -> dict:
+    return {
+        'added': [r for k, r in new.items() if k not in old],
+        'changed': [r for k, r in new.items() if k in old and old[k] != r],
+        'removed': [k for k in old if k not in new],
+    }
+
+class _Version(object):
+    def __init__(self, version:str, matches:List[dict], targets:List[dict]):
+        self.version = version
+        self.matches = matches
+        self.targets = targets
+        self.match_index = { r[MATCH_KEY]: r for r in matches }
+        self.target_index = { r[TARGET_KEY]: r for r in targets }
+
+class ResultHistory(object):
+    def __init__(self, keep:int=4):
+        """keep: versions retained per module"""
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._modules: Dict[str, 'OrderedDict[str, _Version]'] = {}
+
+    def record(self, module_uuid:str, matches:List[dict], targets:List[dict], version:str=None) -> str:
+        """
+        Add a result as the module's latest version; version is computed from the records when not given.
+        RETURNS: the result version
+        """
+        if version is None:
+            version = result_version(json.dumps(matches), json.dumps(targets))
+        entry = _Version(version, matches, targets)
+        with self._lock:
+            versions = self._modules.setdefault(module_uuid, OrderedDict())
+            versions.pop(version, None)
+            versions[version] = entry
+            while len(versions) > self.keep:
+                versions.popitem(last=False)
+        return version
+
+    def version_of(self, module_uuid:str, matches:List[dict], targets:List[dict]) -> str:
+        """Version of a cached result; recorded first if it isn't the module's latest (e.g. restored from a snapshot)"""
+        with self._lock:
+            versions = self._modules.get(module_uuid)
+            latest = next(reversed(versions.values())) if versions else None
+        if latest and latest.matches is matches and latest.targets is targets:
+            return latest.version
+        return self.record(module_uuid, matches, targets)
+
+    def get(self, module_uuid:str, version:str) -> tuple:
+        """RETURNS: ( matches, targets ) of a held version, or None"""
+        with self._lock:
+            entry = (self._modules.get(module_uuid) or {}).get(version)
+        return (entry.matches, entry.targets) if entry else None
+
+    def delta(self, module_uuid:str, since:str, version:str) -> dict:
+        """
+        Changes from version `since` to `version`.
+        RETURNS: { matches: {added, changed, removed}, targets: {added, changed, removed} }, or None if either version
+        is no longer held
+        """
+        with self._lock:
+            versions = self._modules.get(module_uuid) or {}
+            old, new = versions.get(since), versions.get(version)
+        if not old or not new: return None
+        return {
+            'matches': diff(old.match_index, new.match_index),
+            'targets': diff(old.target_index, new.target_index),
+        }
@@ -0,0 +1,84 @@
+import rdflib
+import pandas as pd
+from typing import Dict, Iterable, List, Tuple
+
+from .helpers import flatten
+
+HAS_OBJECT_PROPERTY_ID = rdflib.URIRef("https://switchautomation.com/schemas/BrickExtension#hasObjectPropertyId")
+
+class MissingSensorIdsError(KeyError):
+    """Raised with every entity that has no telemetry id, rather than failing on the first one"""
+    def __init__(self, missing:list):
+        self.missing = missing
+        super().__init__(f"No ObjectPropertyId found for {len(missing)} entities: {missing}")
+
+class SensorIdIndex(object):
+    """
+    In-memory map of entity URI -> remote telemetry id (ObjectPropertyId).
+    Built with a single scan of the predicate when the building model is loaded; add()/remove() keep it in line with
+    triple level model edits.
+    """
+
+    def __init__(self, graph:rdflib.Graph=None, predicate:rdflib.URIRef=HAS_OBJECT_PROPERTY_ID):
+        self.predicate = predicate
+        self.ids: Dict[str, str] = {}
+        # every id of an entity, in the order seen; ids holds the first
+        self.all_ids: Dict[str, List[str]] = {}
+        if graph is not None: self.build(graph)
+
+    def build(self, graph:rdflib.Graph):
+        self.ids, self.all_ids = {}, {}
+        self.add(graph.triples((None, self.predicate, None)))
+        return self
+
+    def add(self, triples:Iterable[tuple]):
+        for s, p, o in triples:
+            if p != self.predicate: continue
+            value = o.toPython() if isinstance(o, rdflib.term.Identifier) else o
+            ids = self.all_ids.setdefault(str(s), [])
+            if value not in ids: ids.append(value)
+            # keep the first id seen for an entity, same as the previous graph lookup did
+            self.ids.setdefault(str(s), value)
+
+    def remove(self, triples:Iterable[tuple]):
+        for s, p, o in triples:
+            if p != self.predicate: continue
+            value = o.toPython() if isinstance(o, rdflib.term.Identifier) else o
+            ids = self.all_ids.get(str(s), [])
+            if value not in ids: continue
+            ids.remove(value)
+            # an entity with another id falls back to it
+            if ids: self.ids[str(s)] = ids[0]
+            else:
+                del self.ids[str(s)]
+                del self.all_ids[str(s)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entity):
+        return str(entity) in self.ids
+
+    def get(self, entity, default=None):
+        return self.ids.get(str(entity), default)
+
+    def resolve(self, entities:Iterable) -> Tuple[Dict[str, str], List[str]]:
+        """RETURNS: ( {entity: ObjectPropertyId} for found entities, [entities with no id] )"""
+        found, missing = {}, []
+        for ent in entities:
+            key = str(ent)
+            if key in self.ids: found[key] = self.ids[key]
+            else: missing.append(key)
+        return (found, missing)
+
+    def resolve_matches(self, df_match:pd.DataFrame, slot_regex:str="^\\?m_") -> Tuple[Dict[str, str], List[str]]:
+        """
+        Resolve every point bound in a module's match frame in one pass.
+        slot_regex: columns holding point slots; values may be single terms or nested sets/lists/dicts of terms.
+        """
+        entities = set()
+        for column in df_match.filter(regex=slot_regex).columns:
+            for value in df_match[column]:
+                if isinstance(value, dict): value = list(value.values())
+                entities.update(e for e in flatten(list(value) if isinstance(value, (set, tuple)) else value) if isinstance(e, str) and "http" in e)
+        return self.resolve(sorted(entities))
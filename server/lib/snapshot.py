@@ -0,0 +1,64 @@
+import os
+import json
+import time
+import pickle
+import rdflib
+from types import SimpleNamespace
+
+# On-disk snapshot of server state for warm restarts.
+#
+#   <snapshot_dir>/manifest.json   format, model hash, module digests, save time, building file name / triple count
+#   <snapshot_dir>/building.nt     the building graph (only rewritten when the model hash changes)
+#   <snapshot_dir>/caches.pickle   { namespace: [(key, value), ...] } for entries valid under the current model
+#
+# Every file is written to a temp name and renamed into place, manifest last, so a crash mid-save leaves the previous
+# snapshot readable. The manifest is what ties the pieces together: load_snapshot() ignores a snapshot whose format
+# it does not know.
+
+FORMAT = 1
+
+def _atomic_write(path:str, write):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+def read_manifest(snapshot_dir:str) -> dict:
+    path = os.path.join(snapshot_dir, "manifest.json")
+    if not os.path.exists(path): return None
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest if manifest.get('format') == FORMAT else None
+
+def save_snapshot(snapshot_dir:str, graph:rdflib.Graph, caches:dict, model_hash:str, module_versions:dict, **meta) -> dict:
+    """
+    graph: the building graph; written only if the snapshot on disk is for a different model_hash
+    caches: { namespace: [(key, value), ...] }
+    module_versions: { module uuid: lib.logic_master.module_digest(module) }
+    RETURNS: the manifest written
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = read_manifest(snapshot_dir) or {}
+
+    if previous.get('model_hash') != model_hash or not os.path.exists(os.path.join(snapshot_dir, "building.nt")):
+        _atomic_write(os.path.join(snapshot_dir, "building.nt"), lambda f: graph.serialize(f, format="nt", encoding="utf-8"))
+
+    _atomic_write(os.path.join(snapshot_dir, "caches.pickle"), lambda f: pickle.dump(caches, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    manifest = {'format': FORMAT, 'model_hash': model_hash, 'module_versions': module_versions, 'saved_at': time.time(),
+                'triples': len(graph), **meta}
+    _atomic_write(os.path.join(snapshot_dir, "manifest.json"), lambda f: f.write(json.dumps(manifest, indent=1).encode()))
+    return manifest
+
+def load_snapshot(snapshot_dir:str) -> SimpleNamespace:
+    """RETURNS: SimpleNamespace(manifest, building_path, caches) or None when there is no usable snapshot"""
+    manifest = read_manifest(snapshot_dir)
+    building_path = os.path.join(snapshot_dir, "building.nt")
+    if not manifest or not os.path.exists(building_path): return None
+
+    caches = {}
+    caches_path = os.path.join(snapshot_dir, "caches.pickle")
+    if os.path.exists(caches_path):
+        with open(caches_path, "rb") as f:
+            caches = pickle.load(f)
+    return SimpleNamespace(manifest=manifest, building_path=building_path, caches=caches)
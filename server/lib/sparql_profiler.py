@@ -0,0 +1,243 @@
+import time
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Mapping
+
+import rdflib
+from rdflib.paths import Path
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql import evaluate as sparql_evaluate
+from rdflib.plugins.sparql.parserutils import CompValue
+from rdflib.plugins.sparql.processor import SPARQLResult
+
+from .query_budget import OptionBudget, active_budget, within_budget
+
+# Query profiler for the logic option SPARQL.
+#
+# The server evaluates queries natively in Oxigraph, which gives us no plan or per-operator numbers. To see where a
+# query spends its time we re-run it through rdflib's own evaluator with evalPart wrapped, so every algebra node (BGP,
+# Join, LeftJoin = OPTIONAL, Union, Extend = BIND, ToMultiSet = VALUES / sub-select, ...) records how many solutions
+# it produced, how often it was evaluated and the time spent in it. Each triple pattern in a BGP is also counted on
+# its own against the store so an unselective pattern or property path stands out.
+#
+# Timings are rdflib's, not Oxigraph's, so compare them relative to each other; the cardinalities hold for both. The
+# native wall time is recorded next to them for reference. rdflib is far slower than the store, so an active query
+# budget (lib.query_budget) is checked for every solution any node produces, not only for result rows.
+#
+# Use from code:
+#     with profiling() as session:
+#         logic_option.find_matches(ds)
+#     print(session.profiles[0].report())
+# or through /profile-logic and server/profile_query.py.
+
+class NodeStats(object):
+    def __init__(self, name:str, detail:str, depth:int):
+        self.name = name
+        self.detail = detail
+        self.depth = depth
+        self.calls = 0
+        self.rows = 0
+        self.inclusive_s = 0.0
+        self.children: List['NodeStats'] = []
+
+    @property
+    def self_s(self) -> float:
+        return max(self.inclusive_s - sum(c.inclusive_s for c in self.children), 0.0)
+
+    def walk(self):
+        yield self
+        for c in self.children: yield from c.walk()
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'detail': self.detail, 'calls': self.calls, 'rows': self.rows,
+                'inclusive_s': self.inclusive_s, 'self_s': self.self_s, 'children': [c.to_dict() for c in self.children]}
+
+class QueryProfile(object):
+    def __init__(self, query:str, option:str=None, kind:str="select"):
+        self.query = query
+        self.option = option
+        self.kind = kind
+        self.root: NodeStats = None
+        self.nodes: Dict[int, NodeStats] = {}
+        self.patterns: List[dict] = []
+        self.rows = 0
+        self.total_s = 0.0
+        self.native_s = None
+
+    def to_dict(self) -> dict:
+        return {'option': self.option, 'kind': self.kind, 'rows': self.rows, 'total_s': self.total_s, 'native_s': self.native_s,
+                'plan': self.root.to_dict() if self.root else None, 'patterns': self.patterns}
+
+    def report(self) -> str:
+        """Plain text plan with per node cardinality and time, slowest node marked"""
+        lines = [f"{self.option or 'query'} ({self.kind}): {self.rows:,} results in {self.total_s:.3f} s (rdflib)"
+                 + (f", {self.native_s:.3f} s native" if self.native_s is not None else "")]
+        if self.root:
+            slowest = max(self.root.walk(), key=lambda n: n.self_s)
+            lines.append(f"  {'rows':>10} {'calls':>8} {'incl s':>9} {'self s':>9}  node")
+            for n in self.root.walk():
+                mark = " <== slowest" if n is slowest and n.self_s > 0 else ""
+                lines.append(f"  {n.rows:>10,} {n.calls:>8,} {n.inclusive_s:>9.3f} {n.self_s:>9.3f}  {'  ' * n.depth}{n.name} {n.detail}{mark}")
+        if self.patterns:
+            lines.append("  triple patterns (standalone matches in the store):")
+            for p in self.patterns:
+                lines.append(f"  {('>=' if p['capped'] else '') + format(p['matches'], ','):>12}  {p['pattern']}")
+        return "\n".join(lines)
+
+class ProfileSession(object):
+    """Collects a QueryProfile for every module query run while the session is active"""
+    def __init__(self, native:bool=True, pattern_cap:int=100_000):
+        self.native = native
+        self.pattern_cap = pattern_cap
+        self.profiles: List[QueryProfile] = []
+
+    def query(self, dataset:rdflib.Graph, query:str, option:str=None, initBindings:dict=None) -> rdflib.query.Result:
+        res, profile = profile_query(dataset, query, option=option, initBindings=initBindings, native=self.native, pattern_cap=self.pattern_cap)
+        self.profiles.append(profile)
+        return res
+
+# PROFILING HOOK
+#
+
+_session = contextvars.ContextVar("sparql_profile_session", default=None)
+_active = contextvars.ContextVar("sparql_profile", default=None)
+_install_lock = threading.Lock()
+_evalPart = sparql_evaluate.evalPart
+
+def active_session() -> ProfileSession:
+    return _session.get()
+
+@contextmanager
+def profiling(**kwargs):
+    """Route module queries (lib.query_helpers) through the profiler for the duration of the block"""
+    session = ProfileSession(**kwargs)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+def _install():
+    # patched once and left in place; it passes straight through unless a profile is active in this context
+    with _install_lock:
+        if sparql_evaluate.evalPart is not _profiled_evalPart:
+            sparql_evaluate.evalPart = _profiled_evalPart
+
+def _profiled_evalPart(ctx, part):
+    profile = _active.get()
+    if profile is None or id(part) not in profile.nodes:
+        return _evalPart(ctx, part)
+
+    node = profile.nodes[id(part)]
+    node.calls += 1
+    start = time.perf_counter()
+    out = _evalPart(ctx, part)
+    node.inclusive_s += time.perf_counter() - start
+    # query forms hand back a result dict rather than solutions; those are timed as a whole by profile_query
+    if isinstance(out, Mapping): return out
+    return _counted(node, out, active_budget())
+
+def _counted(node:NodeStats, results, budget:OptionBudget=None):
+    # time spent producing each solution is charged to the node, including its children's work
+    it = iter(results)
+    while True:
+        start = time.perf_counter()
+        try:
+            row = next(it)
+        except StopIteration:
+            node.inclusive_s += time.perf_counter() - start
+            return
+        node.inclusive_s += time.perf_counter() - start
+        node.rows += 1
+        # intermediate solutions aren't result rows; only the deadline applies to them
+        if budget: budget.check()
+        yield row
+
+# ALGEBRA
+#
+
+def _n3(term, nsm) -> str:
+    if isinstance(term, (rdflib.term.Identifier, Path)):
+        try:
+            return term.n3(nsm)
+        except TypeError:
+            return term.n3()
+    return str(term)
+
+def _detail(part:CompValue, nsm) -> str:
+    if part.name == "BGP":
+        return "{ " + " . ".join(" ".join(_n3(t, nsm) for t in triple) for triple in part.triples) + " }"
+    if part.name == "Extend":
+        return f"?{part.var}"
+    if part.name in ("Project", "SelectQuery"):
+        return " ".join(f"?{v}" for v in part.PV or [])
+    if part.name == "values":
+        return f"{len(part.res)} rows"
+    if part.name == "LeftJoin":
+        return "(OPTIONAL)"
+    return ""
+
+def _build_tree(part:CompValue, profile:QueryProfile, nsm, depth:int=0) -> NodeStats:
+    node = NodeStats(part.name, _detail(part, nsm), depth)
+    profile.nodes[id(part)] = node
+    for key in ("p", "p1", "p2"):
+        child = part.get(key)
+        if isinstance(child, CompValue):
+            node.children.append(_build_tree(child, profile, nsm, depth + 1))
+    return node
+
+def _pattern_counts(dataset:rdflib.Graph, part:CompValue, bindings:dict, cap:int, nsm, out:list):
+    if part.name == "BGP":
+        for triple in part.triples:
+            s, p, o = (bindings.get(t, None) if isinstance(t, rdflib.Variable) else t for t in triple)
+            matches = sum(1 for _ in itertools.islice(dataset.triples((s, p, o)), cap + 1))
+            out.append({'pattern': " ".join(_n3(t, nsm) for t in triple), 'matches': min(matches, cap), 'capped': matches > cap})
+    for key in ("p", "p1", "p2"):
+        child = part.get(key)
+        if isinstance(child, CompValue): _pattern_counts(dataset, child, bindings, cap, nsm, out)
+
+def explain(dataset:rdflib.Graph, query:str) -> str:
+    """The algebra rdflib evaluates the query as, one operator per line"""
+    q = prepareQuery(query, initNs=dict(dataset.namespaces()))
+    profile = QueryProfile(query)
+    root = _build_tree(q.algebra, profile, dataset.namespace_manager)
+    return "\n".join(f"{'  ' * n.depth}{n.name} {n.detail}" for n in root.walk())
+
+def profile_query(dataset:rdflib.Graph, query:str, option:str=None, initBindings:dict=None, native:bool=True,
+                  pattern_cap:int=100_000):
+    """
+    Evaluate query with per algebra node accounting.
+    initBindings: { var name: term } as for dataset.query
+    native: also time the query through the store's own engine
+    pattern_cap: stop counting a standalone triple pattern after this many matches
+    RETURNS: ( rdflib Result, QueryProfile )
+    """
+    _install()
+    nsm = dataset.namespace_manager
+    q = prepareQuery(query, initNs=dict(dataset.namespaces()))
+    profile = QueryProfile(query, option=option, kind=q.algebra.name.replace("Query", "").lower())
+    profile.root = _build_tree(q.algebra, profile, nsm)
+
+    token = _active.set(profile)
+    try:
+        start = time.perf_counter()
+        res = SPARQLResult(sparql_evaluate.evalQuery(dataset, q, initBindings or {}))
+        # materialise so the evaluation happens inside the profile
+        profile.rows = len(res.graph) if res.type == "CONSTRUCT" else len(list(within_budget(res)))
+        profile.total_s = time.perf_counter() - start
+        profile.root.rows, profile.root.inclusive_s = profile.rows, profile.total_s
+    finally:
+        _active.reset(token)
+
+    bindings = {rdflib.Variable(k): v for k, v in (initBindings or {}).items()}
+    _pattern_counts(dataset, q.algebra, bindings, pattern_cap, nsm, profile.patterns)
+
+    if native:
+        start = time.perf_counter()
+        native_res = dataset.query(query, initBindings=initBindings or {})
+        len(native_res.graph) if native_res.type == "CONSTRUCT" else sum(1 for _ in within_budget(native_res))
+        profile.native_s = time.perf_counter() - start
+
+    return (res, profile)
@@ -0,0 +1,155 @@
+import io
+import random
+from typing import TextIO
+
+# Synthetic Brick + Switch-extension building models for scaling work on matching.
+#
+# Emits N-Triples (valid Turtle, so it can go straight to /upload-model) with tunable counts. Each AHU/RTU gets the
+# points every module query looks for, rotated across units so each econ logic option has targets, and:
+#   - a brick:feeds chain of feeds_depth hops down to its VAVs (feeds_depth-1 intermediate HVAC_Equipment boxes)
+#   - switch:Discharge_Damper parts on each VAV with position sensor/command points
+#   - coils with hot/chilled water valves, linked to the unit with rnd:hasRootParent
+#   - filler points on every equipment to bulk the model out
+# Every point carries a switch:hasObjectPropertyId.
+
+BRICK = "https://brickschema.org/schema/Brick#"
+SWITCH = "https://switchautomation.com/schemas/BrickExtension#"
+RND = "http://switch.com/rnd#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+
+# econ point sets rotated across units: (name, [point classes])
+ECON_VARIANTS = (
+    ('diff_enthalpy', [BRICK + "Outside_Air_Enthalpy_Sensor", BRICK + "Return_Air_Enthalpy_Sensor", BRICK + "Outside_Air_Lockout_Temperature_Setpoint"]),
+    ('diff_db', [BRICK + "Outside_Air_Temperature_Sensor", BRICK + "Return_Air_Temperature_Sensor"]),
+    ('fixed_db', [BRICK + "Outside_Air_Temperature_Sensor", BRICK + "Outside_Air_Lockout_Temperature_Setpoint"]),
+    # the class as ASHRAE_Econ_HL_Shutoff_Fixed_Enthalpy spells it (sic)
+    ('fixed_enthalpy', [BRICK + "Outside_Air_Temperature_Sensor", BRICK + "Outside_Air_Enthaply_Sensor", BRICK + "Outside_Air_Lockout_Temperature_Setpoint"]),
+    ('none', []),
+)
+
+FILLER_POINTS = (
+    BRICK + "Zone_Air_Temperature_Sensor",
+    BRICK + "Zone_Air_Temperature_Setpoint",
+    BRICK + "Supply_Air_Flow_Sensor",
+    BRICK + "Occupancy_Sensor",
+)
+
+class _Writer(object):
+    def __init__(self, out:TextIO, base:str):
+        self.out = out
+        self.base = base
+        self.count = 0
+        self._point_n = 0
+
+    def iri(self, local:str) -> str:
+        return f"<{self.base}{local}>"
+
+    def triple(self, s:str, p:str, o:str):
+        self.out.write(f"{s} <{p}> {o} .\n")
+        self.count += 1
+
+    def entity(self, local:str, cls:str, label:str=None) -> str:
+        s = self.iri(local)
+        self.triple(s, RDF_TYPE, f"<{cls}>")
+        if label: self.triple(s, RDFS_LABEL, f'"{label}"')
+        return s
+
+    def point(self, parent:str, local:str, cls:str) -> str:
+        p = self.entity(local, cls)
+        self.triple(parent, BRICK + "hasPoint", p)
+        self.triple(p, SWITCH + "hasObjectPropertyId", f'"op-{self._point_n:08d}"')
+        self._point_n += 1
+        return p
+
+def write_building(out:TextIO, n_ahus:int=2, vavs_per_ahu:int=10, feeds_depth:int=1, dampers_per_vav:int=1, damper_points:int=2,
+                   points_per_equipment:int=2, valves_per_ahu:int=2, root_parent:bool=True, rtu_every:int=4, seed:int=0,
+                   base:str="http://example.com/synthetic#") -> int:
+    """
+    Write a synthetic building as N-Triples to out. RETURNS: number of triples written.
+
+    n_ahus: air handlers (every rtu_every-th is typed brick:RTU)
+    vavs_per_ahu: terminal units fed by each air handler
+    feeds_depth: brick:feeds hops from the air handler to its VAVs
+    dampers_per_vav / damper_points: discharge dampers per VAV and position points per damper (1 sensor, 2 adds a command)
+    points_per_equipment: filler points on every AHU, VAV and intermediate box
+    valves_per_ahu: coil valves per unit, alternating hot / chilled water
+    root_parent: add rnd:hasRootParent from coils to their unit (needed by the passing valve module)
+    """
+    rng = random.Random(seed)
+    w = _Writer(out, base)
+
+    def filler(parent:str, local:str):
+        for i in range(points_per_equipment):
+            w.point(parent, f"{local}_PT{i}", FILLER_POINTS[i % len(FILLER_POINTS)])
+
+    for a in range(n_ahus):
+        ahu_local = f"AHU{a}"
+        is_rtu = rtu_every and a % rtu_every == rtu_every - 1
+        ahu = w.entity(ahu_local, BRICK + ("RTU" if is_rtu else "AHU"), f"{'RTU' if is_rtu else 'AHU'} {a}")
+
+        # pressure reset points
+        w.point(ahu, f"{ahu_local}_DAP", BRICK + "Discharge_Air_Static_Pressure_Sensor")
+        w.point(ahu, f"{ahu_local}_DAPSP", BRICK + "Discharge_Air_Static_Pressure_Setpoint")
+        # passing valve points
+        w.point(ahu, f"{ahu_local}_DAT", BRICK + "Discharge_Air_Temperature_Sensor")
+        w.point(ahu, f"{ahu_local}_MAT", BRICK + "Mixed_Air_Temperature_Sensor")
+
+        # econ points: active point direct or via the discharge fan, econ mode, then the rotated OAT/enthalpy set
+        if a % 2:
+            fan = w.entity(f"{ahu_local}_DAF", BRICK + "Discharge_Fan", f"AHU {a} DAF")
+            w.triple(ahu, BRICK + "hasPart", fan)
+            w.point(fan, f"{ahu_local}_DAF_RUN", BRICK + "On_Off_Status")
+        else:
+            w.point(ahu, f"{ahu_local}_RUN", BRICK + "On_Off_Status")
+        w.point(ahu, f"{ahu_local}_ECON", SWITCH + "Economy_Operating_Mode_Status")
+        for i, cls in enumerate(ECON_VARIANTS[a % len(ECON_VARIANTS)][1]):
+            w.point(ahu, f"{ahu_local}_ECONPT{i}", cls)
+        filler(ahu, ahu_local)
+
+        # coils and valves
+        for v in range(valves_per_ahu):
+            hot = v % 2 == 1
+            coil = w.entity(f"{ahu_local}_COIL{v}", BRICK + ("Hot_Water_Coil" if hot else "Chilled_Water_Coil"))
+            w.triple(ahu, BRICK + "hasPart", coil)
+            if root_parent: w.triple(coil, RND + "hasRootParent", ahu)
+            valve = w.entity(f"{ahu_local}_COIL{v}_VLV", BRICK + ("Hot_Water_Valve" if hot else "Chilled_Water_Valve"))
+            w.triple(coil, BRICK + "hasPart", valve)
+            w.point(valve, f"{ahu_local}_COIL{v}_VLV_POS", BRICK + "Position_Sensor")
+
+        # feeds chain: ahu -> box_1 -> ... -> box_(depth-1) -> VAVs, with VAVs spread across the last level
+        upstream = [ahu]
+        for d in range(1, feeds_depth):
+            level = []
+            for b in range(max(1, len(upstream) * 2 if d > 1 else 2)):
+                box_local = f"{ahu_local}_BOX{d}_{b}"
+                box = w.entity(box_local, BRICK + "HVAC_Equipment", f"AHU {a} box {d}.{b}")
+                w.triple(upstream[b % len(upstream)], BRICK + "feeds", box)
+                filler(box, box_local)
+                level.append(box)
+            upstream = level
+
+        for t in range(vavs_per_ahu):
+            vav_local = f"{ahu_local}_VAV{t}"
+            vav = w.entity(vav_local, BRICK + "VAV", f"VAV {a}.{t}")
+            w.triple(rng.choice(upstream), BRICK + "feeds", vav)
+            for d in range(dampers_per_vav):
+                damper = w.entity(f"{vav_local}_DMP{d}", SWITCH + "Discharge_Damper", f"VAV {a}.{t} damper {d}")
+                w.triple(vav, BRICK + "hasPart", damper)
+                w.point(damper, f"{vav_local}_DMP{d}_POS", BRICK + "Position_Sensor")
+                if damper_points > 1:
+                    w.point(damper, f"{vav_local}_DMP{d}_CMD", BRICK + "Position_Command")
+            filler(vav, vav_local)
+
+    return w.count
+
+def generate_building(**params) -> str:
+    """Synthetic building as an N-Triples string; see write_building for parameters"""
+    out = io.StringIO()
+    write_building(out, **params)
+    return out.getvalue()
+
+def params_for_triples(target:int, **params) -> dict:
+    """Scale n_ahus so the model comes out close to target triples, keeping the other parameters fixed"""
+    per_ahu = write_building(io.StringIO(), **{**params, 'n_ahus': 1})
+    return {**params, 'n_ahus': max(1, round(target / per_ahu))}
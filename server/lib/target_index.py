@@ -0,0 +1,72 @@
+import threading
+from typing import Dict, List, Set
+
+# Match lookups by target.
+#
+# group_by_target() is the per module index behind /get-target-matches. TargetModuleIndex is the inverse across
+# modules: target -> the modules (and logic option, rank, match id) that matched it, kept up to date as each module is
+# matched, so "what applies to this equipment" is one lookup rather than a match of every module. The server clears it
+# when the model changes.
+
+# match record fields kept in the cross module index
+ENTRY_FIELDS = ('_logic', '_logic_name', '_rank', '_match_id')
+
+def group_by_target(matches:List[dict]) -> Dict[str, List[dict]]:
+    """{ target: [match records] }, each list in the order of matches (target, then option)"""
+    index = {}
+    for r in matches:
+        index.setdefault(r['?target'], []).append(r)
+    return index
+
+class TargetModuleIndex(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # target -> { module_uuid: [entries] }
+        self._targets: Dict[str, Dict[str, List[dict]]] = {}
+        # module_uuid -> ( result version indexed, targets it has entries for )
+        self._modules: Dict[str, tuple] = {}
+
+    def update(self, module_uuid:str, matches:List[dict], version:str):
+        """Replace a module's entries with those of its result `version`; a no-op if that version is already indexed"""
+        with self._lock:
+            if self._modules.get(module_uuid, (None,))[0] == version: return
+        entries = {}
+        for r in matches:
+            entries.setdefault(r['?target'], []).append({ f: r.get(f) for f in ENTRY_FIELDS })
+        with self._lock:
+            self._drop(module_uuid)
+            for target, target_entries in entries.items():
+                self._targets.setdefault(target, {})[module_uuid] = target_entries
+            self._modules[module_uuid] = (version, set(entries))
+
+    def _drop(self, module_uuid:str):
+        _, targets = self._modules.pop(module_uuid, (None, ()))
+        for target in targets:
+            modules = self._targets.get(target)
+            if modules is None: continue
+            modules.pop(module_uuid, None)
+            if not modules: del self._targets[target]
+
+    def discard(self, module_uuid:str):
+        """Drop a module's entries, e.g. when its result no longer describes the model"""
+        with self._lock:
+            self._drop(module_uuid)
+
+    def lookup(self, target:str) -> Dict[str, List[dict]]:
+        """{ module_uuid: [ {_logic, _logic_name, _rank, _match_id} ] } for every indexed module that matched target"""
+        with self._lock:
+            return { module_uuid: list(entries) for module_uuid, entries in self._targets.get(target, {}).items() }
+
+    def modules(self) -> Set[str]:
+        """Modules whose matches are indexed"""
+        with self._lock:
+            return set(self._modules)
+
+    def clear(self):
+        with self._lock:
+            self._targets.clear()
+            self._modules.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'targets': len(self._targets), 'modules': len(self._modules)}
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from .concurrency import SingleFlight
+
+try:
+    import fcntl
+except ImportError:
+    # no cross process lock (Windows): the cache directory must not be shared between server processes
+    fcntl = None
+
+# Local on-disk cache for remote telemetry.
+#
+# Data is held per (project, ObjectPropertyId) as a pickled frame of (TimestampLocal, Value) rows, alongside an index
+# that records which time ranges have already been fetched for that sensor. A request for a window only goes to the
+# remote store for the parts of the window the cache does not hold yet; the fresh rows are merged into the sensor frame
+# on disk. The most recent `settle` of a fetch is never recorded as held, as telemetry can still arrive for it (ingest
+# lag); it is fetched again by the next request that covers it. "Recent" is judged against the site's clock (now), as
+# TimestampLocal is site local time.
+#
+# Remote fetches run with no lock held. Everything else (working out the missing ranges, merging fetched rows, reads
+# and eviction) is a transaction on the index: under the in-process lock and an exclusive lock on index.lock, with
+# index.json re-read first and written back before the lock is released, so server processes sharing the directory
+# see each other's fetches and never write over them. Requests in one process missing the same range share its fetch.
+#
+# index.json layout:
+# {
+#   "<project>/<ObjectPropertyId>": { "file": str, "ranges": [[start_iso, end_iso], ...], "bytes": int, "last_access": epoch_s }
+# }
+
+class TelemetryCache(object):
+
+    def __init__(self, cache_dir:str="./server/cache/telemetry", max_age:str="7d", max_bytes:int=2*1024**3, settle:str="1h", now:Callable=None):
+        """
+        cache_dir: directory holding the sensor frames and the range index
+        max_age: sensors not read or written within this timedelta string are evicted
+        max_bytes: total size budget for the sensor frames on disk; least recently used sensors are evicted first
+        settle: how far behind now telemetry is considered complete; fetched ranges newer than this aren't held
+        now: the site's current local time (naive, on the TimestampLocal scale); required unless settle is 0, as the
+             server's own clock is not the site's
+        """
+        self.cache_dir = cache_dir
+        self.max_age = pd.Timedelta(max_age) if max_age else None
+        self.max_bytes = max_bytes
+        self.settle = pd.Timedelta(settle) if settle else pd.Timedelta(0)
+        if now is None and self.settle:
+            raise ValueError("TelemetryCache needs now(), the site's local clock, to tell which telemetry has settled")
+        self.now = now
+        # the index is shared by request threads and the job pool
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._flights = SingleFlight()
+        self.stats = {'hits': 0, 'partial_hits': 0, 'misses': 0, 'remote_queries': 0, 'evictions': 0}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index_path = os.path.join(self.cache_dir, "index.json")
+        self._lock_path = os.path.join(self.cache_dir, "index.lock")
+        self.index = self._load_index()
+
+    # PUBLIC
+    #
+
+    def get(self, sensorIds:list, start:pd.Timestamp, end:pd.Timestamp, fetch:Callable, project:str=None) -> pd.DataFrame:
+        """
+        Return the long format telemetry (ObjectPropertyId, TimestampLocal, Value) for sensorIds within [start, end].
+        fetch: function(sensorIds:list, startTs:pd.Timestamp, endTs:pd.Timestamp) -> pd.DataFrame in the remote store format.
+        project: the apiProjectId the sensors belong to; ObjectPropertyIds are only unique within a project
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+        with self._transaction():
+            # work out which ranges are missing per sensor, then group sensors missing the same range so each range is one query
+            to_fetch = {}
+            for sensor in sensorIds:
+                held = self._ranges(self._key(project, sensor))
+                missing = self._subtract(start, end, held)
+                if not missing: self.stats['hits'] += 1
+                elif len(held): self.stats['partial_hits'] += 1
+                else: self.stats['misses'] += 1
+
+                for rng in missing:
+                    to_fetch.setdefault(rng, []).append(sensor)
+
+        for (r_start, r_end), sensors in to_fetch.items():
+            self._flights.do((project, r_start, r_end, tuple(sensors)), lambda: self._fill(project, sensors, r_start, r_end, fetch))
+
+        with self._transaction():
+            # read before evicting so sensors fetched for this request are always returned
+            output = self._read(project, sensorIds, start, end)
+            if to_fetch: self._evict()
+            return output
+
+    def _fill(self, project:str, sensors:list, r_start:pd.Timestamp, r_end:pd.Timestamp, fetch:Callable):
+        # another request or server process may have fetched the range since it was found missing
+        with self._transaction():
+            sensors = [s for s in sensors if self._subtract(r_start, r_end, self._ranges(self._key(project, s)))]
+            if sensors: self.stats['remote_queries'] += 1
+        if not sensors: return
+
+        fresh = fetch(sensors, r_start, r_end)
+        with self._transaction():
+            self._merge(project, sensors, fresh, r_start, r_end)
+
+    def evict(self):
+        """Drop sensors older than max_age, then least recently used sensors until the cache is within max_bytes"""
+        with self._transaction():
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+
+        if self.max_age is not None:
+            expired = [s for s, e in self.index.items() if now - e['last_access'] > self.max_age.total_seconds()]
+            for sensor in expired: self._drop(sensor)
+
+        if self.max_bytes is not None:
+            total = sum(e['bytes'] for e in self.index.values())
+            for sensor, entry in sorted(self.index.items(), key=lambda x: x[1]['last_access']):
+                if total <= self.max_bytes: break
+                total -= entry['bytes']
+                self._drop(sensor)
+
+    def clear(self):
+        with self._transaction():
+            for key in list(self.index.keys()):
+                self._drop(key, evicted=False)
+
+    def size(self) -> int:
+        return sum(e['bytes'] for e in self.index.values())
+
+    # RANGE HELPERS
+    #
+
+    def _ranges(self, key:str) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        entry = self.index.get(key)
+        if not entry: return []
+        return [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in entry['ranges']]
+
+    @staticmethod
+    def _subtract(start:pd.Timestamp, end:pd.Timestamp, held:list) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        # held ranges are kept sorted and non-overlapping by _union
+        missing = []
+        cursor = start
+        for h_start, h_end in held:
+            if h_end < cursor: continue
+            if h_start > end: break
+            if h_start > cursor: missing.append((cursor, h_start))
+            cursor = max(cursor, h_end)
+        if cursor < end: missing.append((cursor, end))
+        return missing
+
+    @staticmethod
+    def _union(ranges:list) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        merged = []
+        for r_start, r_end in sorted(ranges):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], r_end))
+            else:
+                merged.append((r_start, r_end))
+        return merged
+
+    # STORAGE
+    #
+
+    @staticmethod
+    def _key(project:str, sensor:str) -> str:
+        return f"{project or ''}/{sensor}"
+
+    def _file(self, key:str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+
+    def _load_frame(self, key:str) -> pd.DataFrame:
+        entry = self.index.get(key)
+        if not entry or not os.path.exists(entry['file']):
+            return pd.DataFrame({'TimestampLocal': pd.Series(dtype='datetime64[ns]'), 'Value': pd.Series(dtype='object')})
+        return pd.read_pickle(entry['file'])
+
+    def _merge(self, project:str, sensors:list, fresh:pd.DataFrame, r_start:pd.Timestamp, r_end:pd.Timestamp):
+        fresh = fresh[['ObjectPropertyId', 'TimestampLocal', 'Value']].copy()
+        fresh['TimestampLocal'] = pd.to_datetime(fresh['TimestampLocal'])
+        by_sensor = dict(tuple(fresh.groupby('ObjectPropertyId', sort=False)))
+        # rows for the unsettled tail are kept, but the tail isn't held so it is fetched again
+        held_end = min(r_end, self.now() - self.settle) if self.settle else r_end
+
+        for sensor in sensors:
+            key = self._key(project, sensor)
+            new_rows = by_sensor.get(sensor)
+            frame = self._load_frame(key)
+            if new_rows is not None and not new_rows.empty:
+                frame = pd.concat([frame, new_rows.drop(columns=['ObjectPropertyId'])], ignore_index=True)
+                # range queries are inclusive at both ends so boundary rows can arrive twice
+                frame = frame.drop_duplicates(subset=['TimestampLocal'], keep='last').sort_values('TimestampLocal', ignore_index=True)
+
+            path = self._file(key)
+            frame.to_pickle(path)
+            # a settled range with no rows is still recorded as held, so empty sensors are not re-queried
+            ranges = self._union(self._ranges(key) + ([(r_start, held_end)] if held_end > r_start else []))
+            self.index[key] = {
+                'file': path,
+                'ranges': [[s.isoformat(), e.isoformat()] for s, e in ranges],
+                'bytes': os.path.getsize(path),
+                'last_access': time.time(),
+            }
+
+    def _read(self, project:str, sensorIds:list, start:pd.Timestamp, end:pd.Timestamp) -> pd.DataFrame:
+        frames = []
+        for sensor in sensorIds:
+            key = self._key(project, sensor)
+            if key not in self.index: continue
+            frame = self._load_frame(key)
+            frame = frame.loc[(frame['TimestampLocal'] >= start) & (frame['TimestampLocal'] <= end)]
+            frames.append(frame.assign(ObjectPropertyId=sensor))
+            self.index[key]['last_access'] = time.time()
+
+        if not frames:
+            return pd.DataFrame(columns=['ObjectPropertyId', 'TimestampLocal', 'Value'])
+        return pd.concat(frames, ignore_index=True)[['ObjectPropertyId', 'TimestampLocal', 'Value']]
+
+    def _drop(self, key:str, evicted=True):
+        entry = self.index.pop(key, None)
+        if entry and os.path.exists(entry['file']):
+            os.remove(entry['file'])
+        if evicted: self.stats['evictions'] += 1
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Hold the index exclusively, across threads and server processes, reloaded from disk; saved back on exit (also on
+        error, as frames may already have been written or removed to match it). Re-entrant within a thread.
+        """
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._depth = 1
+                try:
+                    self.index = self._load_index()
+                    yield
+                finally:
+                    self._depth = 0
+                    self._save_index()
+                    # closing lock_file releases the flock
+
+    def _load_index(self) -> Dict[str, dict]:
+        if not os.path.exists(self._index_path): return {}
+        with open(self._index_path) as f:
+            return json.load(f)
+
+    def _save_index(self):
+        # per process temp file, so workers sharing the directory never interleave writes to one file
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self._index_path)
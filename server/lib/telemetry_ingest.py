@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from types import SimpleNamespace
+
+# Long -> wide telemetry pipeline.
+#
+# ingest() parses the remote store rows once into flat numpy columns: int64 nanosecond timestamps, float64 values and
+# int32 dictionary codes for ObjectPropertyId. to_wide() then builds the aligned wide frame with a single lexsort and a
+# scatter into a preallocated matrix, rather than pivot_table + resample which each copy the whole frame.
+
+def ingest(raw_df:pd.DataFrame, ts_format:str="ISO8601", use_index:bool=False) -> SimpleNamespace:
+    """
+    raw_df: long format rows (ObjectPropertyId, TimestampLocal, Value) as returned by the query engine
+    ts_format: format hint for string timestamps; ignored when the column is already datetime
+    use_index: take timestamps from the (already parsed) DatetimeIndex instead of the TimestampLocal column
+    RETURNS: namespace(ts: int64[ns], values: float64, codes: int32, sensors: Index of ObjectPropertyId for each code)
+    """
+    ts_col = raw_df.index.to_series() if use_index else raw_df['TimestampLocal']
+    if not pd.api.types.is_datetime64_any_dtype(ts_col):
+        ts_col = pd.to_datetime(ts_col, format=ts_format)
+
+    codes, sensors = pd.factorize(raw_df['ObjectPropertyId'], sort=True)
+
+    return SimpleNamespace(
+        ts=ts_col.to_numpy(dtype='datetime64[ns]').view('int64'),
+        values=pd.to_numeric(raw_df['Value'], errors='coerce').to_numpy(dtype='float64'),
+        codes=codes.astype('int32'),
+        sensors=pd.Index(np.asarray(sensors), name='ObjectPropertyId'),
+    )
+
+def to_wide(t:SimpleNamespace, resample:str=None, dtype='float64') -> pd.DataFrame:
+    """
+    Build the wide frame (one column per sensor) from ingested telemetry.
+    Duplicate readings for a sensor at the same timestamp are averaged; with resample, each bucket takes the last
+    timestamp's value per sensor. Equivalent to pivot_table(aggfunc='mean').resample(resample).last().
+    """
+    valid = ~np.isnan(t.values)
+    ts, codes, values = t.ts[valid], t.codes[valid], t.values[valid]
+    n_sensors = len(t.sensors)
+
+    if not len(ts):
+        return pd.DataFrame(columns=t.sensors, index=pd.DatetimeIndex([], name='TimestampLocal'), dtype=dtype)
+
+    if resample:
+        # bucket number per row, with bins anchored at midnight of the first day like resample()
+        step = pd.Timedelta(to_offset(resample)).value
+        origin = pd.Timestamp(ts.min()).normalize().value
+        slot = (ts - origin) // step
+        first_slot = slot.min()
+        slot -= first_slot
+        n_rows = int(slot.max()) + 1
+        index = pd.DatetimeIndex(origin + (first_slot + np.arange(n_rows)) * step, name='TimestampLocal')
+    else:
+        uniq_ts, slot = np.unique(ts, return_inverse=True)
+        n_rows = len(uniq_ts)
+        index = pd.DatetimeIndex(uniq_ts, name='TimestampLocal')
+
+    # single sort: by sensor, then bucket, then timestamp
+    order = np.lexsort((ts, slot, codes))
+    ts, slot, codes, values = ts[order], slot[order], codes[order], values[order]
+
+    # mean of duplicate readings at the same (sensor, timestamp)
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (ts[1:] != ts[:-1])])
+    means = np.add.reduceat(values, starts) / np.diff(np.r_[starts, len(values)])
+    slot, codes = slot[starts], codes[starts]
+
+    # last reading per (sensor, bucket)
+    last = np.r_[(codes[1:] != codes[:-1]) | (slot[1:] != slot[:-1]), True]
+
+    out = np.full((n_rows, n_sensors), np.nan, dtype=dtype)
+    out[slot[last], codes[last]] = means[last]
+
+    return pd.DataFrame(out, index=index, columns=t.sensors)
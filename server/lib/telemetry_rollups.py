@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from typing import Dict, List, Tuple
+from types import SimpleNamespace
+
+from .telemetry_ingest import ingest
+
+# Incrementally maintained telemetry rollups.
+#
+# For each standard interval a frame indexed by (ObjectPropertyId, bucket) holds the partial aggregates
+# [last_ts, last, sum, count, min, max]. These partials are composable, so a coarser resolution can be built from any
+# finer rollup whose interval divides it, and new raw rows can be folded into existing buckets without touching history.
+#
+# Each update() batch is taken to be a complete fetch window, so per sensor the span from its first to its last row is
+# recorded as covered. Rows inside a covered span are ignored, so overlapping fetch windows can be fed to update() without
+# double counting, while an older or wider window (a backfill) still folds in the history it adds.
+#
+# Fine rollups are kept for a limited span behind the newest row seen (RETAIN); older buckets are evicted, and a
+# resolution served from such a rollup only reaches back that far.
+
+_PARTIAL_COLUMNS = ['last_ts', 'last', 'sum', 'count', 'min', 'max']
+
+class TelemetryRollups(object):
+    STANDARD_INTERVALS = ("1T", "5T", "15T", "1H", "1D")
+    AGGREGATIONS = ("last", "mean", "min", "max")
+    # how far behind the newest row each interval's buckets are kept; None keeps everything
+    RETAIN = {"1T": "2D", "5T": "7D", "15T": "31D", "1H": "366D", "1D": None}
+
+    def __init__(self, intervals:tuple=STANDARD_INTERVALS, retain:dict=None):
+        """retain: { interval: timedelta string | None }, overriding RETAIN"""
+        # order finest -> coarsest; every interval must be a multiple of the finest so it can be derived from it
+        self.intervals = tuple(sorted(intervals, key=lambda x: pd.Timedelta(to_offset(x))))
+        finest = pd.Timedelta(to_offset(self.intervals[0]))
+        for interval in self.intervals:
+            step = pd.Timedelta(to_offset(interval))
+            if step % finest:
+                raise ValueError(f"Rollup interval {interval} is not a multiple of the finest interval {self.intervals[0]}")
+            # buckets must line up across update() calls regardless of where each batch starts
+            if pd.Timedelta("1D") % step:
+                raise ValueError(f"Rollup interval {interval} does not evenly divide a day")
+
+        retain = {**self.RETAIN, **(retain or {})}
+        self.retain = { i: pd.Timedelta(retain[i]) if retain.get(i) else None for i in self.intervals }
+        self.rollups: Dict[str, pd.DataFrame] = { i: self._empty() for i in self.intervals }
+        # sensor -> sorted, non-overlapping [start, end] spans already rolled up
+        self.covered: Dict[str, List[Tuple[pd.Timestamp, pd.Timestamp]]] = {}
+        self.newest: pd.Timestamp = None
+
+    # PUBLIC
+    #
+
+    def update(self, raw_df:pd.DataFrame):
+        """
+        Fold new long format rows (ObjectPropertyId, TimestampLocal, Value) into every rollup.
+        """
+        if raw_df.empty: return
+        self.update_ingested(ingest(raw_df))
+
+    def update_ingested(self, t:SimpleNamespace):
+        """Same as update(), for telemetry already parsed by telemetry_ingest.ingest()"""
+        df = pd.DataFrame({
+            'sensor': t.sensors.to_numpy()[t.codes],
+            'ts': t.ts.view('datetime64[ns]'),
+            'value': t.values,
+        }).dropna(subset=['value'])
+
+        if df.empty: return
+        spans = df.groupby('sensor')['ts'].agg(['min', 'max'])
+
+        # drop anything already rolled up
+        ts = df['ts'].to_numpy()
+        keep = np.ones(len(df), dtype=bool)
+        for sensor, rows in df.groupby('sensor', sort=False).indices.items():
+            for start, end in self.covered.get(sensor, ()):
+                keep[rows[(ts[rows] >= start.to_datetime64()) & (ts[rows] <= end.to_datetime64())]] = False
+        df = df.loc[keep]
+
+        for sensor, (start, end) in spans.iterrows():
+            self.covered[sensor] = self._union(self.covered.get(sensor, []) + [(start, end)])
+        self.newest = spans['max'].max() if self.newest is None else max(self.newest, spans['max'].max())
+        if df.empty: return
+
+        # duplicate readings at the same timestamp count once, as their mean (same as the pivot_table path)
+        df = df.groupby(['sensor', 'ts'], as_index=False, sort=False)['value'].mean()
+
+        # partial aggregates at the finest interval, then derive coarser intervals from those partials
+        df = df.sort_values('ts', kind='stable')
+        df['bucket'] = df['ts'].dt.floor(self.intervals[0])
+        partial = df.groupby(['sensor', 'bucket']).agg(
+            last_ts=('ts', 'max'), last=('value', 'last'), sum=('value', 'sum'),
+            count=('value', 'count'), min=('value', 'min'), max=('value', 'max')
+        )
+
+        for interval in self.intervals:
+            new = partial if interval == self.intervals[0] else self._regroup(partial, interval)
+            self.rollups[interval] = self._evict(interval, self._fold(self.rollups[interval], new))
+
+    def size(self) -> int:
+        """Buckets held across every rollup"""
+        return sum(len(frame) for frame in self.rollups.values())
+
+    def get(self, resolution:str, agg:str="last", sensors:list=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Return a wide frame (bucket index, one column per ObjectPropertyId) at the requested resolution, built from the
+        nearest rollup whose interval divides it.
+        """
+        if agg not in self.AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation '{agg}'. Use one of {self.AGGREGATIONS}")
+
+        source = self.nearest(resolution)
+        frame = self.rollups[source]
+
+        if sensors is not None:
+            frame = frame.loc[frame.index.get_level_values(0).isin(sensors)]
+        if start is not None or end is not None:
+            buckets = frame.index.get_level_values(1)
+            mask = pd.Series(True, index=frame.index)
+            if start is not None: mask &= buckets >= pd.Timestamp(start).floor(source)
+            if end is not None: mask &= buckets <= pd.Timestamp(end)
+            frame = frame.loc[mask.to_numpy()]
+
+        if pd.Timedelta(to_offset(source)) != pd.Timedelta(to_offset(resolution)):
+            frame = self._regroup(frame, resolution)
+
+        values = frame['sum'] / frame['count'] if agg == "mean" else frame[agg]
+        wide = values.unstack(level=0)
+        if not wide.empty:
+            # match resample() output: every bucket in the span present, empty buckets as NaN
+            wide = wide.asfreq(resolution)
+        wide.index.name = 'TimestampLocal'
+        wide.columns.name = 'ObjectPropertyId'
+        return wide
+
+    def covers(self, resolution:str, start) -> bool:
+        """True when the rollup serving resolution still holds buckets back to start, i.e. none of [start, newest] was evicted"""
+        source = self.nearest(resolution)
+        if start is None or self.newest is None or self.retain[source] is None: return True
+        return pd.Timestamp(start).floor(source) >= (self.newest - self.retain[source]).floor(source)
+
+    def nearest(self, resolution:str) -> str:
+        """Coarsest rollup interval that evenly divides the requested resolution"""
+        target = pd.Timedelta(to_offset(resolution))
+        for interval in reversed(self.intervals):
+            step = pd.Timedelta(to_offset(interval))
+            if step <= target and target % step == pd.Timedelta(0):
+                return interval
+        raise ValueError(f"Resolution {resolution} cannot be built from rollup intervals {self.intervals}")
+
+    # HELPERS
+    #
+
+    @staticmethod
+    def _union(ranges:list) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        merged = []
+        for r_start, r_end in sorted(ranges):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], r_end))
+            else:
+                merged.append((r_start, r_end))
+        return merged
+
+    def _evict(self, interval:str, frame:pd.DataFrame) -> pd.DataFrame:
+        if self.retain[interval] is None or frame.empty: return frame
+        cutoff = (self.newest - self.retain[interval]).floor(interval)
+        return frame.loc[frame.index.get_level_values(1) >= cutoff]
+
+    @staticmethod
+    def _empty() -> pd.DataFrame:
+        index = pd.MultiIndex.from_arrays([pd.Index([], dtype=object), pd.DatetimeIndex([])], names=['sensor', 'bucket'])
+        return pd.DataFrame(columns=_PARTIAL_COLUMNS, index=index)
+
+    @staticmethod
+    def _regroup(partial:pd.DataFrame, interval:str=None) -> pd.DataFrame:
+        # combine partial aggregates per (sensor, bucket); into coarser buckets when an interval is given
+        partial = partial.sort_values('last_ts', kind='stable')
+        buckets = partial.index.get_level_values(1)
+        if interval and len(buckets):
+            # bins anchored at midnight of the first day, same as resample()'s default origin
+            step = pd.Timedelta(to_offset(interval))
+            origin = buckets.min().normalize()
+            buckets = origin + ((buckets - origin) // step) * step
+        keys = [partial.index.get_level_values(0), buckets]
+        g = partial.groupby(keys)
+        out = pd.DataFrame({
+            'last_ts': g['last_ts'].max(),
+            'last': g['last'].last(),
+            'sum': g['sum'].sum(),
+            'count': g['count'].sum(),
+            'min': g['min'].min(),
+            'max': g['max'].max(),
+        })
+        out.index.names = ['sensor', 'bucket']
+        return out
+
+    @classmethod
+    def _fold(self, existing:pd.DataFrame, new:pd.DataFrame) -> pd.DataFrame:
+        if existing.empty: return new.sort_index()
+
+        # only buckets present in both need combining; everything else is a straight append
+        overlap = existing.index.intersection(new.index)
+        if len(overlap):
+            combined = self._regroup(pd.concat([existing.loc[overlap], new.loc[overlap]]))
+            existing = existing.drop(overlap)
+            new = pd.concat([new.drop(overlap), combined])
+
+        return pd.concat([existing, new]).sort_index()
@@ -1,47 +1,119 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-import rdflib
 import json
+import atexit
+import threading
+import rdflib
+import pandas as pd
 
-from helpers import msg, MsgType, data, MatchJSONEncoder
+from helpers import msg, MsgType, data, MatchJSONEncoder, match_records
 import lib.modules as LogicModules
 from lib.diagram_generator import generate_tidy_tree
+from lib.sensor_index import SensorIdIndex
+from lib.graph_model import init_graph_model, load_building, match_targets, graph_digest, update_digest, ontology_digest, affected_targets
+from lib.instrumentation import METRICS, request_stages, stage
+from lib.sparql_profiler import profiling
+from lib.concurrency import ModelState, SingleFlight
+from lib.jobs import JobManager, TERMINAL
+from lib.cache import Cache
+from lib.logic_master import module_digest, RANDOM_VARS
+from lib.snapshot import save_snapshot, load_snapshot
+from lib.match_store import MatchStore
+from lib.result_history import ResultHistory, result_version
+from lib.target_index import TargetModuleIndex, group_by_target
+from lib.query_budget import QueryBudget, BudgetExceeded
+
+# per namespace budgets for derived results (lib/cache.py); bytes are serialised JSON size
+CACHE_BUDGETS = {
+    'matches': dict(max_entries=32, max_bytes=512 * 2**20),
+    'targets': dict(max_entries=32, max_bytes=64 * 2**20),
+    # holds the records in 'matches' rather than copies, so it is only bounded by entry count
+    'target_index': dict(max_entries=32),
+    'diagrams': dict(max_entries=5000, max_bytes=256 * 2**20, ttl=6 * 3600),
+}
+# on-disk budget for the persistent match store (lib/match_store.py)
+MATCH_STORE_BYTES = 2 * 2**30
+# default per logic option query limits (lib/query_budget.py); options can set their own with a query_budget attribute
+QUERY_BUDGET = dict(seconds=30, max_rows=2_000_000)
 
 # Going to run simple server from a class so I can store state in memory across requests
 class Server():
 
-    def __init__(self):
+    def __init__(self, snapshot_dir="./server/cache/snapshot", snapshot_interval=60, match_store_dir="./server/cache/matches"):
+        """
+        snapshot_dir: where the building graph and caches are saved for warm restarts; None to disable
+        snapshot_interval: seconds between checks for unsaved cache changes
+        match_store_dir: persistent, content addressed logic option results (may be shared between workers); None to disable
+        """
         self.app = Flask(__name__, static_url_path="/static")
         CORS(self.app)
         self.createDB()    
         
         print("Loading graph frame with Brick and Switch ontologies.")
         (self.ds, self.g_ns) = self.init_graph_model() 
+        self.ontology_hash = ontology_digest()
+        self.match_store = MatchStore(match_store_dir, max_bytes=MATCH_STORE_BYTES) if match_store_dir else None
+        # entity URI -> telemetry id lookup for the building model; rebuilt whenever a model is loaded
+        self.sensor_index = SensorIdIndex()
+        # readers (matching, diagrams) share the dataset and db; model uploads take it exclusively
+        self.model = ModelState()
+        # concurrent identical match / diagram requests share one computation
+        self.flights = SingleFlight()
+        # background pool for long running matching / diagrams (the /jobs routes)
+        self.jobs = JobManager(max_workers=2)
+        # recent match results per module, for delta responses
+        self.history = ResultHistory(keep=4)
+        # target -> modules that matched it, across every module matched on the current model
+        self.target_modules = TargetModuleIndex()
+        # content hash of the loaded building graph
+        self.model_hash = None
+        self.model_filename = None
+
+        self.snapshot_dir = snapshot_dir
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_mark = None
+        if snapshot_dir:
+            self.restore_snapshot()
+            atexit.register(self.save_snapshot)
+            threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,), daemon=True, name="snapshot").start()
 
 
         # Define routes (need to do it here as don't have access to @app decorator. Could use flask_classful instead)
         self.app.route("/hello-world", methods=['GET'])(self.hello_world)
         self.app.route("/graph-size", methods=['GET'])(self.graph_size)
         self.app.route("/upload-model", methods=['POST'])(self.upload_model)
+        self.app.route("/update-model", methods=['POST'])(self.update_model)
         self.app.route("/get-modules", methods=['GET'])(self.get_modules)
         self.app.route("/get-module-matches", methods=['POST'])(self.get_module_matches)
+        self.app.route("/get-target-matches", methods=['POST'])(self.get_target_matches)
+        self.app.route("/get-target-modules", methods=['POST'])(self.get_target_modules)
         self.app.route("/get-match-diagram", methods=['POST'])(self.get_match_diagram)
+        self.app.route("/metrics", methods=['GET'])(self.metrics)
+        self.app.route("/profile-logic", methods=['POST'])(self.profile_logic)
+        self.app.route("/jobs", methods=['GET'])(self.list_jobs)
+        self.app.route("/jobs/match", methods=['POST'])(self.submit_match_job)
+        self.app.route("/jobs/diagram", methods=['POST'])(self.submit_diagram_job)
+        self.app.route("/jobs/<job_id>", methods=['GET'])(self.get_job)
+        self.app.route("/jobs/<job_id>/events", methods=['GET'])(self.job_events)
     
     def createDB(self):
+        # derived values are bounded caches stamped with the model version; anything from an older model reads as a miss
+        self.cache = Cache(version=lambda: self.model.version, **CACHE_BUDGETS)
         self.db = {
             'modules': { str(getattr(LogicModules, m).MODULE.uuid): getattr(LogicModules, m).MODULE for m in LogicModules.__all__ },
-            'matches': {},
-            'targets': {}, # this is a derived value from matches. Useful for front end vis.
-            'diagrams': {}, # { module_uuid: { logic_uuid: { match_uuid: diagram_data } } } 
+            'matches': self.cache['matches'],
+            'targets': self.cache['targets'], # this is a derived value from matches. Useful for front end vis.
+            'target_index': self.cache['target_index'], # { module_uuid: (result_version, { target: [match records] }) }
+            'diagrams': self.cache['diagrams'], # { (module_uuid, logic_uuid, match_uuid): diagram_data }
         }
     
     #   FLASK STUFF
     #
 
-    def start(self, address="localhost:8080", debug=False):
+    def start(self, address="localhost:8080", debug=False, threaded=True):
         assert len(address.split(":")) == 2
         host, port = address.split(":")
-        self.app.run(host=host, port=port, debug=debug)
+        self.app.run(host=host, port=port, debug=debug, threaded=threaded)
     
     # ROUTES AND METHODS
     #
@@ -64,18 +136,53 @@ class Server():
             if file:
                 # try and process as a model
                 try:
-                    res = self.parse_model_file(file)
-                    # reset db
-                    self.createDB()
+                    # exclusive: waits for running matches/diagrams to finish and holds new ones until the swap is done
+                    with self.model.write():
+                        res = self.parse_model_file(file)
+                        # reset db
+                        self.cache.clear()
+                        self.target_modules.clear()
+                        triples = len(self.ds.graph(self.g_ns['building']))
+                        self.model_filename = file.filename
+                    self.save_snapshot()
                     # return { "msg_type": "success", "msg": "File successfully loaded into graph", "meta": { "filename": file.filename, "triples": len(self.ds.graph(self.g_ns['building'])) }}
-                    return msg(MsgType.SUCCESS, "File successfully loaded into graph", filename=file.filename, triples=len(self.ds.graph(self.g_ns['building'])) )
+                    return msg(MsgType.SUCCESS, "File successfully loaded into graph", filename=file.filename, triples=triples, sensor_ids=len(self.sensor_index), model_version=self.model.version )
 
                 
                 except Exception as e:
                     return msg(MsgType.ERROR, "Failed to parse model", error=str(e))
 
+    def update_model(self):
+        """
+        Add / remove triples in the loaded building model. Cached module results are kept: only the targets the edit
+        can affect are rematched, and their matches spliced into the cached ones.
+        body: { add: triples, remove: triples, format (of both; default turtle) }. Blank nodes can't be removed this
+        way, as they won't be the ones in the model.
+        """
+        jsonData = request.get_json()
+        try:
+            add = rdflib.Graph().parse(data=jsonData.get('add') or "", format=jsonData.get('format', "turtle"))
+            remove = rdflib.Graph().parse(data=jsonData.get('remove') or "", format=jsonData.get('format', "turtle"))
+        except Exception as e:
+            return msg(MsgType.ERROR, "Failed to parse model edit", error=str(e))
+
+        with request_stages("update_model") as stages, self.model.write():
+            if self.model_hash is None:
+                return msg(MsgType.ERROR, "No model loaded")
+            (added, removed, affected, rematched) = self.apply_model_edit(add, remove)
+            triples = len(self.ds.graph(self.g_ns['building']))
+        self.save_snapshot()
+
+        return msg(MsgType.SUCCESS, "Model updated", added=added, removed=removed, affected_targets=len(affected), rematched=rematched,
+                   triples=triples, sensor_ids=len(self.sensor_index), model_version=self.model.version, timings=stages.breakdown())
+
     def graph_size(self):
-        return data(len(self.ds))
+        with self.model.read():
+            return data(len(self.ds))
+
+    def metrics(self):
+        return data({**METRICS.snapshot(), 'caches': self.cache.stats(), 'match_store': self.match_store.stats() if self.match_store else None,
+                     'target_modules': self.target_modules.stats()})
     
     def get_modules(self):
         return_data = []
@@ -90,11 +197,23 @@ class Server():
         return data(return_data)
     
     def get_module_matches(self):
+        with request_stages("get_module_matches") as stages, self.model.read() as version:
+            res = self._get_module_matches()
+            if 'meta' in res: res['meta']['model_version'] = version
+            # per stage breakdown on request
+            if request.get_json().get('timings') and 'meta' in res: res['meta']['timings'] = stages.breakdown()
+            return res
+
+    def _get_module_matches(self):
 
         # Get required values from request body
         jsonData = request.get_json()
         module_uuid = jsonData.get('module_uuid')
         force_rematch = jsonData.get('force_rematch')
+        # result version the client already holds; when given we only send what changed since
+        since = jsonData.get('result_version')
+        # clients paging matches per target (/get-target-matches) only need the target list
+        include_matches = jsonData.get('include_matches', True)
 
         if not module_uuid: return msg(MsgType.ERROR, "No module_id provided")
 
@@ -103,6 +222,12 @@ class Server():
         if not (m:=self.db['modules'].get(module_uuid)):
             return msg(MsgType.ERROR, "No module exists for that uuid", uuid=module_uuid)
 
+        (matches, targets, version, meta) = self.module_result(m, force_rematch)
+        return self.matches_response(module_uuid, matches, targets, version, since, include_matches, **meta)
+
+    def module_result(self, m, force_rematch=False):
+        """RETURNS: ( matches, targets, result version, meta ) from the cache, or from a match run when not cached"""
+        module_uuid = str(m.uuid)
         if not force_rematch:
             # check if we already have matches!
             matches = self.db['matches'].get(module_uuid)
@@ -110,22 +235,222 @@ class Server():
             targets = self.db['targets'].get(module_uuid)
 
             if matches and targets: 
-                return data( matches=matches, targets=targets, meta={"from_cache": True})
+                version = self.history.version_of(module_uuid, matches, targets)
+                # cached results restored from a snapshot haven't been indexed yet
+                self.target_modules.update(module_uuid, matches, version)
+                return (matches, targets, version, {"from_cache": True})
         
-        # else run matching and target functions
-        (raw_match, df_match) = m.match(self.ds)
-        # let sort the df by target, then by option
-        df_match.sort_values(by=["?target", "?option"], inplace=True)
+        # else run matching and target functions; requests for the same module arriving meanwhile wait on this run
+        ((matches, targets, version, exceeded), coalesced) = self.flights.do(("matches", module_uuid, self.model.version), lambda: self.run_module_match(m))
+
+        meta = {"from_cache": False, "coalesced": coalesced}
+        # logic options left out of a partial result
+        if exceeded: meta["budget_exceeded"] = exceeded
+        return (matches, targets, version, meta)
+
+    def matches_response(self, module_uuid, matches, targets, version, since=None, include_matches=True, **meta):
+        """The full match / target lists, or only the changes if the client's version (since) is still in history"""
+        if since and (delta := self.history.delta(module_uuid, since, version)) is not None:
+            if not include_matches: del delta['matches']
+            return data( delta=delta, meta={"result_version": version, "delta_from": since, **meta} )
+        if not include_matches:
+            return data( targets=targets, meta={"result_version": version, **meta} )
+        return data( matches=matches, targets=targets, meta={"result_version": version, **meta} )
+
+    def get_target_matches(self):
+        with request_stages("get_target_matches") as stages, self.model.read() as version:
+            res = self._get_target_matches()
+            if 'meta' in res: res['meta']['model_version'] = version
+            if request.get_json().get('timings') and 'meta' in res: res['meta']['timings'] = stages.breakdown()
+            return res
+
+    def _get_target_matches(self):
+        """
+        One target's matches for a module, a page at a time.
+        body: { module_uuid, target, offset (default 0), limit (default 100) }
+        """
+        jsonData = request.get_json()
+        module_uuid = jsonData.get('module_uuid')
+        target = jsonData.get('target')
+        offset = max(int(jsonData.get('offset') or 0), 0)
+        limit = min(max(int(jsonData.get('limit') or 100), 1), 1000)
 
-        self.db['matches'][module_uuid] = json.loads(json.dumps(df_match.to_dict(orient='records'), cls=MatchJSONEncoder))
+        if not target: return msg(MsgType.ERROR, "No target provided")
+        if not (m:=self.db['modules'].get(module_uuid)):
+            return msg(MsgType.ERROR, "No module exists for that uuid", uuid=module_uuid)
+
+        (matches, targets, version, meta) = self.module_result(m, jsonData.get('force_rematch'))
+        rows = self.target_index(module_uuid, matches, version).get(target, [])
+
+        return data( matches=rows[offset:offset + limit], target=target, total=len(rows), offset=offset, limit=limit,
+                     meta={"result_version": version, **meta} )
+
+    def get_target_modules(self):
+        with request_stages("get_target_modules") as stages, self.model.read() as version:
+            res = self._get_target_modules()
+            if 'meta' in res: res['meta']['model_version'] = version
+            if request.get_json().get('timings') and 'meta' in res: res['meta']['timings'] = stages.breakdown()
+            return res
+
+    def _get_target_modules(self):
+        """
+        Every module (and logic option / match) that matched a target, from the cross module index.
+        body: { target, match_missing (default false; first match the modules not yet matched on this model) }
+        """
+        jsonData = request.get_json()
+        target = jsonData.get('target')
+        if not target: return msg(MsgType.ERROR, "No target provided")
+
+        if jsonData.get('match_missing'):
+            indexed = self.target_modules.modules()
+            for module_uuid, m in self.db['modules'].items():
+                if module_uuid not in indexed: self.module_result(m)
+
+        indexed = self.target_modules.modules()
+        modules = [{'uuid': module_uuid, 'name': self.db['modules'][module_uuid].name, 'matches': entries}
+                   for module_uuid, entries in self.target_modules.lookup(target).items() if module_uuid in self.db['modules']]
+        # modules not matched on this model yet can't be answered for; the client can ask again with match_missing
+        unmatched = [module_uuid for module_uuid in self.db['modules'] if module_uuid not in indexed]
+
+        return data( target=target, modules=modules, unmatched=unmatched )
+
+    def target_index(self, module_uuid, matches, version):
+        """{ target: [match records] } for a module's current result; built with the match run, rebuilt if evicted"""
+        entry = self.db['target_index'].get(module_uuid)
+        if entry is None or entry[0] != version:
+            entry = self.db['target_index'].set(module_uuid, (version, group_by_target(matches)), size=0)
+        return entry[1]
+
+    def run_module_match(self, m, progress=None):
+        """
+        Match a module and store the result. Logic options that exceed their query budget are left out; such a partial
+        result isn't cached, so the next request tries them again (options that finished are kept in the match store).
+        RETURNS: ( matches, targets, result version, [ budget exceeded records ] )
+        """
+        budget = QueryBudget(**QUERY_BUDGET)
+        with stage("match", module=m.name):
+            (raw_match, df_match) = m.match(self.ds, progress=progress, store=self.match_scope(), budget=budget)
+        self.sort_matches(df_match)
+
+        with stage("serialize"):
+            matches_json = json.dumps(match_records(df_match), cls=MatchJSONEncoder)
 
         # get additional target information
-        targets = self.get_match_targets(df_match)
-        self.db['targets'][module_uuid] = json.loads(json.dumps(targets))
+        with stage("targets"):
+            targets_json = json.dumps(self.get_match_targets(df_match))
 
-        return data( matches=self.db['matches'][module_uuid], targets=self.db['targets'][module_uuid], meta={"from_cache": False} )
+        return (*self.store_module_result(str(m.uuid), matches_json, targets_json, cache=not budget.exceeded), budget.exceeded)
+
+    def sort_matches(self, df_match):
+        # nothing to sort when every option ran out of budget (no columns either)
+        if df_match.empty: return
+        # let sort the df by target, then by option
+        with stage("sort"):
+            df_match.sort_values(by=["?target", "?option"], inplace=True)
+            # random per query ids would make every rematch look like a change to the result history
+            df_match.drop(columns=[c for c in RANDOM_VARS if c in df_match.columns], inplace=True)
+
+    def store_module_result(self, module_uuid, matches_json, targets_json, model_version=None, cache=True):
+        """
+        Cache a module's serialised matches and targets, record the result version and index it.
+        model_version: stamp for the cache entries when storing inside a model write (the version the model is about to have)
+        cache: False for a partial result (lib/query_budget.py); only its result version is recorded
+        RETURNS: ( matches, targets, result version )
+        """
+        if not cache:
+            matches, targets = json.loads(matches_json), json.loads(targets_json)
+            return (matches, targets, self.history.record(module_uuid, matches, targets, version=result_version(matches_json, targets_json)))
+
+        matches = self.db['matches'].set(module_uuid, json.loads(matches_json), size=len(matches_json), version=model_version)
+        targets = self.db['targets'].set(module_uuid, json.loads(targets_json), size=len(targets_json), version=model_version)
+
+        version = self.history.record(module_uuid, matches, targets, version=result_version(matches_json, targets_json))
+        with stage("target_index"):
+            self.db['target_index'].set(module_uuid, (version, group_by_target(matches)), size=0, version=model_version)
+            self.target_modules.update(module_uuid, matches, version)
+        return (matches, targets, version)
+
+    def apply_model_edit(self, add:rdflib.Graph, remove:rdflib.Graph):
+        """
+        Apply an edit to the building graph and bring cached module results up to date by rematching only the
+        targets it affects. Call holding the model for writing.
+        RETURNS: ( triples added, triples removed, affected targets, modules rematched )
+        """
+        building = self.ds.graph(self.g_ns['building'])
+        # only triples that change the graph count (for the digest) or can change a match
+        removed = [t for t in remove if t in building]
+        added = [t for t in add if t not in building or t in remove]
+        entities = { term for t in added + removed for term in (t[0], t[2]) if isinstance(term, rdflib.URIRef) }
+
+        # results for the model before the edit (the version is bumped as the write finishes)
+        cached = {}
+        for module_uuid in self.db['modules']:
+            if (matches:=self.db['matches'].get(module_uuid)) and (targets:=self.db['targets'].get(module_uuid)):
+                cached[module_uuid] = (matches, targets)
+
+        with stage("affected_targets"):
+            affected = affected_targets(self.ds, entities)
+        with stage("edit"):
+            for t in removed: building.remove(t)
+            for t in added: building.add(t)
+            self.sensor_index.remove(removed)
+            self.sensor_index.add(added)
+            self.model_hash = update_digest(self.model_hash, added, removed, graph=building)
+        with stage("affected_targets"):
+            affected |= affected_targets(self.ds, entities)
+
+        rematched = set()
+        for module_uuid, (matches, targets) in cached.items():
+            if self.rematch_targets(self.db['modules'][module_uuid], matches, targets, affected, model_version=self.model.version + 1):
+                rematched.add(module_uuid)
+            else:
+                # a logic option ran out of query budget; the cached result can't be brought up to date, so the next
+                # request matches the module in full
+                self.db['matches'].pop(module_uuid)
+                self.db['targets'].pop(module_uuid)
+        # indexed results that weren't cached (evicted) or couldn't be rematched can't be brought up to date
+        for module_uuid in self.target_modules.modules() - rematched:
+            self.target_modules.discard(module_uuid)
+
+        return (len(added), len(removed), affected, len(rematched))
+
+    def rematch_targets(self, m, matches, targets, affected, model_version=None):
+        """
+        Replace the matches / targets of the affected targets in a module's cached result with a rematch of just those
+        RETURNS: ( matches, targets, result version ), or None if a logic option exceeded its query budget
+        """
+        budget = QueryBudget(**QUERY_BUDGET)
+        with stage("match", module=m.name):
+            (_, df_match) = m.match(self.ds, targets=sorted(affected), budget=budget) if affected else (None, pd.DataFrame())
+        if budget.exceeded: return None
+        affected = { t.toPython() for t in affected }
+
+        if df_match.empty:
+            new_matches, new_targets = [], []
+        else:
+            self.sort_matches(df_match)
+            with stage("serialize"):
+                new_matches = json.loads(json.dumps(match_records(df_match), cls=MatchJSONEncoder))
+            with stage("targets"):
+                new_targets = self.get_match_targets(df_match)
+
+        # same order as a full match: matches by target then option, targets by label (then target)
+        spliced_matches = sorted([r for r in matches if r['?target'] not in affected] + new_matches, key=lambda r: (r['?target'], r['?option']))
+        spliced_targets = sorted(sorted([t for t in targets if t['target'] not in affected] + new_targets, key=lambda t: t['target']), key=lambda t: t['label'])
+
+        with stage("serialize"):
+            matches_json = json.dumps(spliced_matches, cls=MatchJSONEncoder)
+            targets_json = json.dumps(spliced_targets)
+        return self.store_module_result(str(m.uuid), matches_json, targets_json, model_version=model_version)
 
     def get_match_diagram(self):
+        with request_stages("get_match_diagram") as stages, self.model.read() as version:
+            res = self._get_match_diagram()
+            if 'meta' in res: res['meta']['model_version'] = version
+            if request.get_json().get('timings') and 'meta' in res: res['meta']['timings'] = stages.breakdown()
+            return res
+
+    def _get_match_diagram(self):
         # Get required values from request body
         jsonData = request.get_json()
         match = jsonData['match']
@@ -138,66 +463,241 @@ class Server():
         
         if not force_regen:
             # check if we already have diagram!
-            matches = self.db['diagrams'].get(match['_module'], {}).get(match['_logic'], {}).get(match['_match_id'])
+            matches = self.db['diagrams'].get((match['_module'], match['_logic'], match['_match_id']))
             if matches: 
                 return data( matches, meta={"from_cache": True})
         
+        key = ("diagram", match['_module'], match['_logic'], match['_match_id'], self.model.version)
+        (diagram_data, coalesced) = self.flights.do(key, lambda: self.build_match_diagram(m, match))
+
+        return data( diagram_data, meta={"coalesced": coalesced} )
+
+    def build_match_diagram(self, m, match):
         # get diagram graph
-        diagram_g = m.get_match_diagram_graph(self.ds, match)
+        with stage("diagram_query", module=m.name):
+            diagram_g = m.get_match_diagram_graph(self.ds, match)
 
         # generate match diagram data
-        diagram_data = generate_tidy_tree(diagram_g.graph, match)
+        with stage("tidy_tree", module=m.name):
+            diagram_data = generate_tidy_tree(diagram_g.graph, match)
 
         # save to db
-        self.db['diagrams'].setdefault(match['_module'], {}).setdefault(match['_logic'], {})[match['_match_id']] = diagram_data
+        self.db['diagrams'][(match['_module'], match['_logic'], match['_match_id'])] = diagram_data
 
-        return data( diagram_data )
+        return diagram_data
 
-    #   NON ROUTE METHODS
-    #
+    # JOBS
+    # Same work as /get-module-matches and /get-match-diagram, run on the job pool. Poll /jobs/<id>?since=<seq> or
+    # stream /jobs/<id>/events (server-sent events) for progress; match jobs emit an 'option' event with that logic
+    # option's match count and ids as each one finishes. The matches themselves are read from the result history when
+    # the finished job is polled (job_result), not kept with the job.
 
-    def init_graph_model(self):
-        brick_path = "./server/static/brick.ttl"
-        switch_path = "./server/static/Brick-SwitchExtension.ttl"
-        rnd_path = "./server/static/rnd.ttl"
+    def list_jobs(self):
+        return data([job.summary(since=len(job.events), result=False) for job in self.jobs.list()])
 
-        ds = rdflib.Dataset(default_union=True, store="Oxigraph")
-        g_ns = rdflib.Namespace("https://_graph_.com#")
+    def submit_match_job(self):
+        jsonData = request.get_json()
+        module_uuid = jsonData.get('module_uuid')
+        force_rematch = bool(jsonData.get('force_rematch'))
 
-        # Load brick
-        ds.add_graph(g_ns['brick']).parse(brick_path, format="turtle")
-        # # load RND ontology (this is what contains the relationships we will use to define enrichment)
-        ds.add_graph(g_ns['rnd']).parse(rnd_path, format='turtle')
-        # load Switch Extension
-        ds.add_graph(g_ns['switch']).parse(switch_path, format='turtle')
+        if not (m:=self.db['modules'].get(module_uuid)):
+            return msg(MsgType.ERROR, "No module exists for that uuid", uuid=module_uuid)
 
-        return (ds, g_ns)
+        job = self.jobs.submit("match", lambda job: self.match_job(job, m, force_rematch), module_uuid=module_uuid, force_rematch=force_rematch)
+        return data(job.summary(result=False))
+
+    def match_job(self, job, m, force_rematch):
+        # the job result only references the module result (see job_result), which can age out of the history; each
+        # option event carries that option's rows, so a client following the events has every match regardless
+        module_uuid = str(m.uuid)
+        with self.model.read() as version:
+            if not force_rematch and (matches:=self.db['matches'].get(module_uuid)) and (targets:=self.db['targets'].get(module_uuid)):
+                return {'module_uuid': module_uuid, 'counts': {'matches': len(matches), 'targets': len(targets)},
+                        'meta': {"from_cache": True, "model_version": version, "result_version": self.history.version_of(module_uuid, matches, targets)}}
+
+            def progress(logic_option, rank, df_option):
+                # serialised as in the module result, less the columns only other options bind
+                rows = json.loads(json.dumps(match_records(df_option), cls=MatchJSONEncoder))
+                job.emit('option', option=logic_option.__name__, logic=str(logic_option.uuid), rank=rank, of=len(m.logic_modules),
+                         count=len(df_option), match_ids=[r['_match_id'] for r in rows], matches=rows)
+
+            ((matches, targets, res_version, exceeded), coalesced) = self.flights.do(("matches", module_uuid, version), lambda: self.run_module_match(m, progress))
+            meta = {"from_cache": False, "coalesced": coalesced, "model_version": version, "result_version": res_version}
+            if exceeded: meta["budget_exceeded"] = exceeded
+            return {'module_uuid': module_uuid, 'counts': {'matches': len(matches), 'targets': len(targets)}, 'meta': meta}
+
+    def job_result(self, job):
+        """A finished job's result; a match job's matches / targets come from the module's result history"""
+        if job.kind != "match" or job.status != 'done': return job.result
+        held = self.history.get(job.result['module_uuid'], job.result['meta']['result_version'])
+        if held is None:
+            # superseded by newer results; /get-module-matches has the current one
+            return {**job.result, 'expired': True}
+        return {**job.result, 'matches': held[0], 'targets': held[1]}
+
+    def submit_diagram_job(self):
+        jsonData = request.get_json()
+        match = jsonData['match']
 
-    def parse_model_file(self, modelfile):
-        # dump old model
-        self.ds.remove_graph(self.g_ns['building'])
-        # load building model
-        self.ds.add_graph(self.g_ns['building']).parse(file=modelfile, format="turtle")
+        if not (m:=self.db['modules'].get(match['_module'])):
+            return msg(MsgType.ERROR, "No module exists for that uuid", uuid=match['_module'])
 
-    def get_match_targets(self, matches):
-        """Given a match result set, extract the unique targets and get some additional info from the graph"""
+        job = self.jobs.submit("diagram", lambda job: self.diagram_job(job, m, match, jsonData.get('force_regen')), match_id=match['_match_id'])
+        return data(job.summary(result=False))
+
+    def diagram_job(self, job, m, match, force_regen):
+        with self.model.read() as version:
+            if not force_regen and (diagram:=self.db['diagrams'].get((match['_module'], match['_logic'], match['_match_id']))):
+                return {'diagram': diagram, 'meta': {"from_cache": True, "model_version": version}}
+
+            key = ("diagram", match['_module'], match['_logic'], match['_match_id'], version)
+            (diagram, coalesced) = self.flights.do(key, lambda: self.build_match_diagram(m, match))
+            return {'diagram': diagram, 'meta': {"from_cache": False, "coalesced": coalesced, "model_version": version}}
+
+    def get_job(self, job_id):
+        if not (job:=self.jobs.get(job_id)):
+            return msg(MsgType.ERROR, "No job exists for that id", job_id=job_id)
+        summary = job.summary(since=int(request.args.get('since', 0)), result=False)
+        if job.status == 'done': summary['result'] = self.job_result(job)
+        return data(summary)
+
+    def job_events(self, job_id):
+        if not (job:=self.jobs.get(job_id)):
+            return msg(MsgType.ERROR, "No job exists for that id", job_id=job_id)
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+
+        def stream(seq):
+            while True:
+                events = job.events_since(seq, timeout=15)
+                if not events:
+                    if job.done: return
+                    yield ": keep-alive\n\n"
+                    continue
+                for event in events:
+                    seq = event['seq']
+                    # the final event carries the result so a subscriber doesn't need a follow-up poll
+                    if event['event'] == 'done': event = {**event, 'result': self.job_result(job)}
+                    yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event, cls=MatchJSONEncoder)}\n\n"
+                    if event['event'] in TERMINAL: return
+
+        return Response(stream(since), mimetype="text/event-stream", headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def profile_logic(self):
+        """
+        Profile logic option queries against the loaded model (see lib.sparql_profiler).
+        body: { module_uuid, logic_uuid (optional; all options when omitted), match (optional; profile that match's diagram query instead), native (default true) }
+        """
+        jsonData = request.get_json()
+        module_uuid = jsonData.get('module_uuid') or (jsonData.get('match') or {}).get('_module')
 
-        if matches.empty: return []
+        if not (m:=self.db['modules'].get(module_uuid)):
+            return msg(MsgType.ERROR, "No module exists for that uuid", uuid=module_uuid)
 
-        # get unique match targets
-        targets = matches['?target'].unique()
+        # rdflib's evaluator is far slower than the store; bound it so a profile can't hold the model for long
+        budget = QueryBudget(**QUERY_BUDGET)
+        with self.model.read(), profiling(native=jsonData.get('native', True)) as session:
+            if match := jsonData.get('match'):
+                logic_option = next((o for o in m.logic_modules if str(o.uuid) == match.get('_logic')), m)
+                try:
+                    with budget.option(logic_option):
+                        m.get_match_diagram_graph(self.ds, match)
+                except BudgetExceeded as e:
+                    budget.record(e)
+            else:
+                for logic_option in m.logic_modules:
+                    if jsonData.get('logic_uuid') in (None, str(logic_option.uuid)):
+                        try:
+                            with budget.option(logic_option):
+                                logic_option.find_matches(self.ds)
+                        except BudgetExceeded as e:
+                            budget.record(e)
+
+        meta = {"budget_exceeded": budget.exceeded} if budget.exceeded else None
+        return data([{**p.to_dict(), 'report': p.report()} for p in session.profiles], meta=meta)
 
-        # get some more data from the graph:
-        target_data = []
-        for target in targets:
-            target_data.append({
-                "target": target.toPython(),
-                "label": next(self.ds.objects(target, rdflib.RDFS.label), rdflib.Literal('#')).toPython(),
-                "cls": dict(zip(['ont', 'slug'], next(self.ds.objects(target, rdflib.RDF.type), rdflib.Literal("#")).toPython().split('#'))) 
-            })
+    #   NON ROUTE METHODS
+    #
 
+    def init_graph_model(self):
+        return init_graph_model()
+
+    def parse_model_file(self, modelfile, format="turtle"):
+        self.model_hash = None
+        # dump old model and load the new building model
+        with stage("parse_model"):
+            load_building(self.ds, modelfile, format=format, g_ns=self.g_ns)
+        # index telemetry ids once for the whole model
+        with stage("sensor_index"):
+            self.sensor_index.build(self.ds.graph(self.g_ns['building']))
+        with stage("model_digest"):
+            self.model_hash = graph_digest(self.ds.graph(self.g_ns['building']))
+
+    def match_scope(self):
+        """The persistent match store for the loaded model, or None when there isn't one to key on"""
+        if not self.match_store or self.model_hash is None: return None
+        return self.match_store.scope(self.model_hash, self.ontology_hash)
+
+    # SNAPSHOTS
+    # The building graph and cached results are saved after each upload, whenever caches changed (checked every
+    # snapshot_interval) and at exit; a restarting server reloads them so cached responses are available immediately.
+
+    def module_versions(self):
+        return { uuid: module_digest(m) for uuid, m in self.db['modules'].items() }
+
+    def _snapshot_state(self):
+        # changes whenever there is something new to save
+        return (self.model.version, sum(ns.counters['sets'] for ns in self.cache.namespaces.values()))
+
+    def _snapshot_loop(self, interval):
+        while True:
+            threading.Event().wait(interval)
+            if self._snapshot_state() != self._snapshot_mark: self.save_snapshot()
+
+    def save_snapshot(self):
+        if not self.snapshot_dir: return
+        with self._snapshot_lock, self.model.read():
+            if self.model_hash is None: return
+            try:
+                state = self._snapshot_state()
+                caches = { name: ns.items() for name, ns in self.cache.namespaces.items() }
+                save_snapshot(self.snapshot_dir, self.ds.graph(self.g_ns['building']), caches, self.model_hash, self.module_versions(),
+                              filename=self.model_filename, model_version=self.model.version)
+                self._snapshot_mark = state
+            except Exception as e:
+                print(f"Failed to write snapshot to {self.snapshot_dir}: {e}")
+
+    def restore_snapshot(self):
+        try:
+            snap = load_snapshot(self.snapshot_dir)
+            if not snap: return
+            print(f"Restoring snapshot from {self.snapshot_dir} ({snap.manifest.get('filename')}, {snap.manifest.get('triples')} triples).")
+            with self.model.write():
+                self.parse_model_file(snap.building_path, format="nt")
+                self.model_filename = snap.manifest.get('filename')
+        except Exception as e:
+            print(f"Failed to restore snapshot from {self.snapshot_dir}: {e}")
+            return
+
+        if self.model_hash != snap.manifest.get('model_hash'):
+            print("Snapshot building graph does not match its manifest; starting with empty caches.")
+            return
+
+        # drop results from modules whose queries changed since the snapshot was taken
+        current = self.module_versions()
+        valid = { uuid for uuid, version in snap.manifest.get('module_versions', {}).items() if current.get(uuid) == version }
+        restored = 0
+        for name, items in snap.caches.items():
+            if name not in self.cache.namespaces: continue
+            for key, value in items:
+                if (key[0] if isinstance(key, tuple) else key) not in valid: continue
+                self.cache[name].set(key, value)
+                restored += 1
+        self._snapshot_mark = self._snapshot_state()
+        print(f"Restored {restored} cached results for {len(valid)}/{len(current)} modules.")
 
-        return sorted(target_data, key=lambda x: x['label'])
+    def get_match_targets(self, matches):
+        """Given a match result set, extract the unique targets and get some additional info from the graph"""
+        return match_targets(self.ds, matches)
 
 
 
@@ -0,0 +1,85 @@
+# Profile logic option SPARQL against a building model (see lib/sparql_profiler.py).
+#
+# Against a model file, loaded into the same dataset layout the server uses:
+#   python server/profile_query.py model.ttl                          # every option of every module
+#   python server/profile_query.py model.ttl --module Pressure --explain
+#   python server/profile_query.py model.ttl --module Econ --option Diff_DB --target http://example.com/bldg#AHU1
+# Against the model currently uploaded to a running server:
+#   python server/profile_query.py --server http://localhost:8080 --module Econ
+#
+# --target profiles the diagram query for that target instead of the match query.
+
+import os
+import sys
+import json
+import argparse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import lib.modules as LogicModules
+from lib.graph_model import init_graph_model, load_building
+from lib.sparql_profiler import profiling, explain
+
+def select(modules, module_filter, option_filter):
+    for m in modules:
+        if module_filter and module_filter.lower() not in m.name.lower(): continue
+        for logic_option in m.logic_modules:
+            if option_filter and option_filter.lower() not in logic_option.__name__.lower(): continue
+            yield (m, logic_option)
+
+def diagram_record(m, logic_option, target):
+    return {'?target': target, '_module': str(m.uuid), '_logic': str(logic_option.uuid)}
+
+def profile_local(args, selected):
+    (ds, g_ns) = init_graph_model(args.static_dir)
+    load_building(ds, args.model, format=args.format, g_ns=g_ns)
+
+    reports = []
+    for m, logic_option in selected:
+        if args.explain:
+            query = logic_option.diagram_query if args.target else logic_option._sparql_return["SELECT"] + logic_option.sparql_query
+            print(f"== {logic_option.__name__}\n{explain(ds, query)}\n")
+            continue
+        with profiling(native=not args.no_native) as session:
+            if args.target: m.get_match_diagram_graph(ds, diagram_record(m, logic_option, args.target))
+            else: logic_option.find_matches(ds)
+        reports += [{**p.to_dict(), 'report': p.report()} for p in session.profiles]
+    return reports
+
+def profile_remote(args, selected):
+    reports = []
+    for m, logic_option in selected:
+        body = {'module_uuid': str(m.uuid), 'logic_uuid': str(logic_option.uuid), 'native': not args.no_native}
+        if args.target: body['match'] = diagram_record(m, logic_option, args.target)
+        req = urllib.request.Request(args.server.rstrip("/") + "/profile-logic", data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req) as res:
+            out = json.loads(res.read())
+        if 'data' not in out: sys.exit(out.get('msg'))
+        reports += out['data']
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile logic option SPARQL queries")
+    parser.add_argument("model", nargs="?", help="building model file; omit with --server")
+    parser.add_argument("--format", default="turtle", help="rdflib parser format of the model file")
+    parser.add_argument("--server", help="profile the model loaded in a running server instead, e.g. http://localhost:8080")
+    parser.add_argument("--module", help="substring of the module name")
+    parser.add_argument("--option", help="substring of the logic option name")
+    parser.add_argument("--target", help="profile the diagram query for this target URI")
+    parser.add_argument("--explain", action="store_true", help="print the query algebra only, without running it (local only)")
+    parser.add_argument("--no-native", action="store_true", help="skip the native (Oxigraph) timing run")
+    parser.add_argument("--json", action="store_true", help="print the profiles as JSON")
+    parser.add_argument("--static-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+    args = parser.parse_args()
+
+    if not (args.model or args.server): parser.error("provide a model file or --server")
+
+    modules = [getattr(LogicModules, m).MODULE for m in LogicModules.__all__]
+    selected = list(select(modules, args.module, args.option))
+    if not selected: parser.error("no logic options match --module/--option")
+
+    reports = profile_remote(args, selected) if args.server else profile_local(args, selected)
+    if args.json:
+        print(json.dumps([{k: v for k, v in r.items() if k != 'report'} for r in reports], indent=2, default=str))
+    else:
+        for r in reports: print(r['report'] + "\n")
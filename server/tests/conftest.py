@@ -0,0 +1,49 @@
+import io
+import os
+import sys
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the server imports its modules relative to server/ (lib.*, helpers)
+sys.path.insert(0, SERVER_DIR)
+
+@pytest.fixture(scope="session")
+def workdir(tmp_path_factory):
+    """
+    A repo root stand-in to run from: the server resolves ./server/static and its cache dirs against the working
+    directory, and main creates a Server on import.
+    """
+    root = tmp_path_factory.mktemp("root")
+    (root / "server").mkdir()
+    (root / "server" / "static").symlink_to(os.path.join(SERVER_DIR, "static"))
+    cwd = os.getcwd()
+    os.chdir(root)
+    yield root
+    os.chdir(cwd)
+
+@pytest.fixture(scope="session")
+def ontology_dataset(workdir):
+    """Dataset with the ontologies loaded; tests load their building into it with lib.graph_model.load_building"""
+    from lib.graph_model import init_graph_model
+    (ds, _) = init_graph_model()
+    return ds
+
+@pytest.fixture(scope="session")
+def main(workdir):
+    import main
+    return main
+
+@pytest.fixture(scope="session")
+def server(main):
+    """A Server without snapshots or a match store, shared by the tests; each test uploads its own model"""
+    return main.Server(snapshot_dir=None, match_store_dir=None)
+
+@pytest.fixture
+def upload():
+    """upload(server, turtle) -> test client for the server, with the model loaded"""
+    def upload(server, model:str):
+        client = server.app.test_client()
+        res = client.post('/upload-model', data={'model': (io.BytesIO(model.encode()), 'model.ttl')}).json
+        assert res['msg_type'] == "SUCCESS", res
+        return client
+    return upload
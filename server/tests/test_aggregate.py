@@ -0,0 +1,26 @@
+import pytest
+import pandas as pd
+
+from lib.graph_model import load_building
+from lib.synthetic_building import generate_building
+from lib.modules.ashrae_pressure_reset_module import ASHRAE_Pressure_Trim_and_Respond
+
+def canonical(value):
+    # the aggregations order lists (and type the option literal) differently; compare what they bind
+    if isinstance(value, (set, list)): return sorted(map(canonical, value), key=str)
+    return str(value)
+
+def records(df:pd.DataFrame) -> list:
+    return sorted(({c: canonical(v) for c, v in row.items()} for row in df.to_dict(orient='records')), key=str)
+
+def test_pressure_aggregations_agree(ontology_dataset, tmp_path):
+    (tmp_path / "synth.ttl").write_text(generate_building(n_ahus=4, vavs_per_ahu=3, valves_per_ahu=1))
+    load_building(ontology_dataset, str(tmp_path / "synth.ttl"))
+
+    (_, phased) = ASHRAE_Pressure_Trim_and_Respond.find_matches(ontology_dataset, aggregate="phased")
+    (_, grouped) = ASHRAE_Pressure_Trim_and_Respond.find_matches(ontology_dataset, aggregate="store")
+    assert len(phased) == 4
+    assert records(phased) == records(grouped)
+
+    with pytest.raises(ValueError, match="Unknown aggregate"):
+        ASHRAE_Pressure_Trim_and_Respond.find_matches(ontology_dataset, aggregate="frame")
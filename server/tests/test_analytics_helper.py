@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from lib.analytics_helper import AnalyticsHelper
+from lib.local_query_engine import LocalQueryEngine
+from lib.telemetry_rollups import TelemetryRollups
+
+NOW = "2024-01-08"
+
+def fetch(ago="7d", **kwargs):
+    return AnalyticsHelper.get_ts_data(["AHU0_OAT", "AHU0_DAP"], "project", LocalQueryEngine(now=NOW), ago=ago, **kwargs)
+
+def test_resample_beyond_rollup_retention_uses_raw():
+    ts = fetch(rollups=TelemetryRollups())
+    # the 1T rollup only keeps 2 days, so a 7 day span must come from raw
+    assert not ts['rollups'].covers("1T", ts['span'][0])
+    pivot = AnalyticsHelper.resample_ts_data(ts, "1T")['pivot']
+    assert len(pivot) == 7 * 24 * 60 + 1
+    assert pivot.index.min() == pd.Timestamp("2024-01-01")
+
+def test_resample_within_rollup_retention_matches_raw():
+    ts = fetch(rollups=TelemetryRollups())
+    assert ts['rollups'].covers("15T", ts['span'][0])
+    from_rollups = AnalyticsHelper.resample_ts_data(ts, "15T")['pivot']
+    from_raw = AnalyticsHelper.resample_ts_data({**ts, 'rollups': None}, "15T")['pivot']
+    pd.testing.assert_frame_equal(from_rollups, from_raw, check_names=False, check_freq=False)
+
+def test_resample_beyond_rollup_retention_without_raw_raises():
+    ts = fetch(rollups=TelemetryRollups(), raw_mode="drop")
+    with pytest.raises(ValueError, match="Raw telemetry was dropped"):
+        AnalyticsHelper.resample_ts_data(ts, "1T")
+
+def test_compact_matches_full_precision():
+    full, compact = fetch("1d"), fetch("1d", compact=True)
+    assert 'TimestampLocal' not in compact['raw'].columns
+    assert compact['raw']['ObjectPropertyId'].dtype == "category"
+    assert compact['raw']['Value'].dtype == "float32" and compact['pivot'].dtypes.eq("float32").all()
+    pd.testing.assert_frame_equal(compact['pivot'], full['pivot'].astype("float32"))
+    assert compact['memory']['retained_bytes'] < full['memory']['retained_bytes']
+
+def test_raw_mode_drop():
+    ts = fetch("1d", raw_mode="drop")
+    assert ts['raw'] is None and ts['raw_path'] is None
+    assert ts['memory']['retained_bytes'] == ts['memory']['pivot_bytes']
+    with pytest.raises(ValueError, match="Raw telemetry was dropped"):
+        AnalyticsHelper.load_raw(ts)
+    with pytest.raises(ValueError, match="Raw telemetry was dropped"):
+        AnalyticsHelper.resample_ts_data(ts, "1H")
+
+def test_raw_mode_spill(tmp_path):
+    kept = fetch("1d")
+    spilled = fetch("1d", raw_mode="spill", spill_dir=str(tmp_path))
+    assert spilled['raw'] is None and spilled['raw_path'].startswith(str(tmp_path))
+    pd.testing.assert_frame_equal(AnalyticsHelper.load_raw(spilled), kept['raw'])
+    pd.testing.assert_frame_equal(AnalyticsHelper.resample_ts_data(spilled, "1H")['pivot'], AnalyticsHelper.resample_ts_data(kept, "1H")['pivot'])
+
+def test_unknown_raw_mode():
+    with pytest.raises(ValueError, match="Unknown raw_mode"):
+        fetch("1d", raw_mode="discard")
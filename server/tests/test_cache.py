@@ -0,0 +1,63 @@
+from lib.cache import Cache, CacheNamespace
+
+class Clock(object):
+    def __init__(self): self.version = 0
+    def __call__(self): return self.version
+
+def test_lru_eviction_by_entries():
+    ns = CacheNamespace("t", max_entries=2)
+    ns.set("a", 1); ns.set("b", 2)
+    ns.get("a")
+    ns.set("c", 3)
+    assert ns.get("b") is None and ns.get("a") == 1 and ns.get("c") == 3
+    assert ns.counters['evicted_lru'] == 1
+
+def test_eviction_by_bytes_and_oversized_values():
+    ns = CacheNamespace("t", max_bytes=10)
+    ns.set("a", "x", size=6); ns.set("b", "y", size=6)
+    assert ns.get("a") is None and ns.get("b") == "y" and ns.bytes == 6
+    ns.set("c", "z", size=11)
+    assert ns.get("c") is None and ns.get("b") == "y"
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("lib.cache.time.monotonic", lambda: now[0])
+    ns = CacheNamespace("t", ttl=10)
+    ns.set("a", 1)
+    now[0] += 5
+    assert ns.get("a") == 1
+    now[0] += 6
+    assert ns.get("a") is None and ns.counters['evicted_ttl'] == 1
+
+def test_model_version_invalidates_entries():
+    clock = Clock()
+    cache = Cache(version=clock, matches=dict(max_entries=4), targets=dict(max_entries=4))
+    cache['matches'].set("m", [1])
+    clock.version += 1
+    assert cache['matches'].get("m") is None
+    assert cache['matches'].counters['invalidated'] == 1 and len(cache['matches']) == 0
+
+def test_entries_stamped_for_the_next_version():
+    # results stored inside a model write are valid once the write bumps the version, not before
+    clock = Clock()
+    ns = CacheNamespace("t", version=clock)
+    ns.set("m", [1], version=clock.version + 1)
+    assert ns.items() == []
+    clock.version += 1
+    assert ns.get("m") == [1]
+
+def test_items_skips_stale_entries_without_counting():
+    clock = Clock()
+    ns = CacheNamespace("t", version=clock)
+    ns.set("old", 1)
+    clock.version += 1
+    ns.set("new", 2)
+    assert ns.items() == [("new", 2)]
+    assert ns.counters['hits'] == ns.counters['misses'] == 0
+
+def test_stats():
+    ns = CacheNamespace("t", max_entries=1)
+    ns.set("a", [1, 2])
+    ns.get("a"); ns.get("b")
+    stats = ns.stats()
+    assert stats['hit_rate'] == 0.5 and stats['entries'] == 1 and stats['bytes'] == len("[1, 2]")
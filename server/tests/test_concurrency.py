@@ -0,0 +1,85 @@
+import time
+import threading
+import pytest
+
+from lib.concurrency import ReadWriteLock, ModelState, SingleFlight
+
+def started(fn):
+    t = threading.Thread(target=fn, daemon=True)
+    t.start()
+    return t
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=2)
+    def reader():
+        with lock.read(): inside.wait()
+    threads = [started(reader) for _ in range(3)]
+    for t in threads: t.join(2)
+    assert not any(t.is_alive() for t in threads)
+
+def test_writer_waits_for_readers_and_excludes_them():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+    writer = started(lambda: (lock.acquire_write(), events.append("write"), lock.release_write()))
+    time.sleep(0.05)
+    assert events == []
+    lock.release_read()
+    writer.join(2)
+    assert events == ["write"]
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+    writer = started(lambda: (lock.acquire_write(), events.append("write"), lock.release_write()))
+    time.sleep(0.05)
+    reader = started(lambda: (lock.acquire_read(), events.append("read"), lock.release_read()))
+    time.sleep(0.05)
+    # the new reader queues behind the writer rather than starving it
+    assert events == []
+    lock.release_read()
+    writer.join(2); reader.join(2)
+    assert events == ["write", "read"]
+
+def test_model_version_bumps_even_when_the_write_fails():
+    state = ModelState()
+    with pytest.raises(ValueError):
+        with state.write(): raise ValueError()
+    with state.read() as version:
+        assert version == 1
+
+def test_single_flight_runs_once_for_concurrent_callers():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls, results = [], []
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return "result"
+    threads = [started(lambda: results.append(flights.do("key", fn))) for _ in range(4)]
+    time.sleep(0.05)
+    release.set()
+    for t in threads: t.join(2)
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    assert flights.in_flight() == 0
+
+def test_single_flight_shares_errors_and_keeps_nothing():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+    def fn():
+        release.wait(2)
+        raise RuntimeError("failed")
+    def call():
+        try: flights.do("key", fn)
+        except RuntimeError as e: errors.append(str(e))
+    threads = [started(call) for _ in range(3)]
+    time.sleep(0.05)
+    release.set()
+    for t in threads: t.join(2)
+    assert errors == ["failed"] * 3
+    # a later call runs again
+    assert flights.do("key", lambda: 1) == (1, False)
@@ -0,0 +1,64 @@
+import pandas as pd
+
+from lib.graph_model import load_building
+from lib.modules.ashrae_econ_module import MODULE
+
+MODEL = """
+@prefix brick: <https://brickschema.org/schema/Brick#> .
+@prefix switch: <https://switchautomation.com/schemas/BrickExtension#> .
+@prefix ex: <http://example.com/building#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+# every point variant the options use, labelled
+ex:AHU1 a brick:AHU ; rdfs:label "AHU 1" ;
+    brick:hasPoint ex:AHU1_ONOFF, ex:AHU1_ECON, ex:AHU1_OAT, ex:AHU1_RAT, ex:AHU1_OAH, ex:AHU1_RAH, ex:AHU1_OAH2, ex:AHU1_LOCK .
+ex:AHU1_ONOFF a brick:On_Off_Status .
+ex:AHU1_ECON a switch:Economy_Operating_Mode_Status .
+ex:AHU1_OAT a brick:Outside_Air_Temperature_Sensor .
+ex:AHU1_RAT a brick:Return_Air_Temperature_Sensor .
+ex:AHU1_OAH a brick:Outside_Air_Enthalpy_Sensor .
+ex:AHU1_RAH a brick:Return_Air_Enthalpy_Sensor .
+ex:AHU1_OAH2 a brick:Outside_Air_Enthaply_Sensor .
+ex:AHU1_LOCK a brick:Outside_Air_Lockout_Temperature_Setpoint .
+
+# the same without a label
+ex:AHU2 a brick:AHU ;
+    brick:hasPoint ex:AHU2_ONOFF, ex:AHU2_ECON, ex:AHU2_OAT, ex:AHU2_RAT .
+ex:AHU2_ONOFF a brick:On_Off_Status .
+ex:AHU2_ECON a switch:Economy_Operating_Mode_Status .
+ex:AHU2_OAT a brick:Outside_Air_Temperature_Sensor .
+ex:AHU2_RAT a brick:Return_Air_Temperature_Sensor .
+
+# two labels, typed AHU and RTU, active through its discharge fan
+ex:RTU3 a brick:AHU, brick:RTU ; rdfs:label "RTU 3", "RTU-3" ;
+    brick:hasPart ex:RTU3_FAN ;
+    brick:hasPoint ex:RTU3_ECON, ex:RTU3_OAT .
+ex:RTU3_FAN a brick:Discharge_Fan ; brick:hasPoint ex:RTU3_FAN_STATUS .
+ex:RTU3_FAN_STATUS a brick:On_Off_Status .
+ex:RTU3_ECON a switch:Economy_Operating_Mode_Enable_Command .
+ex:RTU3_OAT a brick:Outside_Air_Temperature_Sensor .
+"""
+
+def normalised(df:pd.DataFrame) -> list:
+    # the per option queries bind random ?match_ids; everything else must agree
+    df = df.drop(columns=[c for c in ('?match_id', '?row_id') if c in df.columns])
+    return sorted((tuple(sorted((c, str(v)) for c, v in row.items())) for row in df.to_dict(orient='records')))
+
+def test_shared_matching_equals_per_option_queries(ontology_dataset, tmp_path):
+    (tmp_path / "model.ttl").write_text(MODEL)
+    load_building(ontology_dataset, str(tmp_path / "model.ttl"))
+
+    (_, shared) = MODULE.match(ontology_dataset, shared=True)
+    (_, per_option) = MODULE.match(ontology_dataset, shared=False)
+    for option in MODULE.logic_modules:
+        assert normalised(shared[shared['_logic_name'] == option.__name__]) == normalised(per_option[per_option['_logic_name'] == option.__name__]), option.__name__
+    # the unlabelled AHU drops out (see BLOCK_LABEL); the others each match an option
+    assert "http://example.com/building#AHU2" not in {str(t) for t in per_option['?target']}
+    assert {str(t) for t in per_option['?target']} == {"http://example.com/building#AHU1", "http://example.com/building#RTU3"}
+
+def test_option_binds_its_name(ontology_dataset, tmp_path):
+    (tmp_path / "model.ttl").write_text(MODEL)
+    load_building(ontology_dataset, str(tmp_path / "model.ttl"))
+    for option in MODULE.logic_modules:
+        (_, df) = option.find_matches(ontology_dataset)
+        assert not df.empty and {str(o) for o in df['?option']} == {option.name}, option.__name__
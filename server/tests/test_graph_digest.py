@@ -0,0 +1,48 @@
+import rdflib
+
+from lib.graph_model import graph_digest, update_digest
+
+EX = rdflib.Namespace("http://example.com/building#")
+
+MODEL = """
+@prefix brick: <https://brickschema.org/schema/Brick#> .
+@prefix ex: <http://example.com/building#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+ex:AHU1 a brick:AHU ; rdfs:label "AHU 1" ;
+    brick:hasPoint ex:OAT1 ;
+    brick:hasPart [ a brick:Damper ; brick:hasPoint [ a brick:Damper_Position_Command ] ] .
+ex:AHU2 a brick:AHU ;
+    brick:hasPart [ a brick:Damper ] .
+ex:OAT1 a brick:Outside_Air_Temperature_Sensor .
+"""
+
+def parse(data:str=MODEL) -> rdflib.Graph:
+    return rdflib.Graph().parse(data=data, format="turtle")
+
+def test_digest_is_stable_across_parses():
+    assert graph_digest(parse()) == graph_digest(parse())
+
+def test_digest_tells_blank_node_structure_apart():
+    # the damper command point moved from the damper to the AHU
+    moved = MODEL.replace("[ a brick:Damper ; brick:hasPoint [ a brick:Damper_Position_Command ] ]", "[ a brick:Damper ] ; brick:hasPoint [ a brick:Damper_Position_Command ]")
+    assert moved != MODEL
+    assert graph_digest(parse()) != graph_digest(parse(moved))
+
+def test_update_digest_matches_full_digest():
+    g = parse()
+    digest = graph_digest(g)
+
+    added = [(EX.AHU2, rdflib.RDFS.label, rdflib.Literal("AHU 2"))]
+    for t in added: g.add(t)
+    digest = update_digest(digest, added, [], graph=g)
+    assert digest == graph_digest(g)
+
+    damper = next(g.objects(EX.AHU2, rdflib.URIRef("https://brickschema.org/schema/Brick#hasPart")))
+    removed = [(damper, rdflib.RDF.type, rdflib.URIRef("https://brickschema.org/schema/Brick#Damper"))]
+    added = [(damper, rdflib.RDF.type, rdflib.URIRef("https://brickschema.org/schema/Brick#Exhaust_Damper"))]
+    for t in removed: g.remove(t)
+    for t in added: g.add(t)
+    digest = update_digest(digest, added, removed, graph=g)
+    assert digest == graph_digest(g)
+    assert digest != graph_digest(parse())
@@ -0,0 +1,47 @@
+import time
+
+from lib.synthetic_building import generate_building
+
+ECON = "3d5cae16-0fb0-4ae7-9edb-b7c44a8357f5"
+
+def finished(client, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/jobs/{job_id}').json['data']
+        if job['status'] in ('done', 'error'): return job
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+def test_match_job_events_carry_counts_and_result_comes_from_history(server, upload):
+    client = upload(server, generate_building(n_ahus=5, vavs_per_ahu=2, valves_per_ahu=1))
+    job_id = client.post('/jobs/match', json={'module_uuid': ECON, 'force_rematch': True}).json['data']['job_id']
+    job = finished(client, job_id)
+    assert job['status'] == 'done'
+
+    options = [e['data'] for e in job['events'] if e['event'] == 'option']
+    assert options
+    # the job itself only references the result
+    assert set(server.jobs.get(job_id).result) == {'module_uuid', 'counts', 'meta'}
+
+    full = client.post('/get-module-matches', json={'module_uuid': ECON}).json
+    assert job['result']['matches'] == full['data']['matches']
+    assert job['result']['counts']['matches'] == sum(o['count'] for o in options) == len(full['data']['matches'])
+    assert sorted(i for o in options for i in o['match_ids']) == sorted(r['_match_id'] for r in full['data']['matches'])
+    # each option's rows are its rows of the result, less the columns only other options bind
+    rows = {r['_match_id']: r for r in full['data']['matches']}
+    for r in (r for o in options for r in o['matches']):
+        assert r == {c: v for c, v in rows[r['_match_id']].items() if c in r}
+        assert all(rows[r['_match_id']][c] in ("", 0) for c in rows[r['_match_id']].keys() - r.keys())
+
+def test_match_job_result_expires_with_history(server, upload):
+    client = upload(server, generate_building(n_ahus=2, vavs_per_ahu=2, valves_per_ahu=1))
+    job_id = client.post('/jobs/match', json={'module_uuid': ECON, 'force_rematch': True}).json['data']['job_id']
+    finished(client, job_id)
+    # (consecutive sizes can give the same result, when the added unit has no econ points)
+    for n in range(3, 3 + 2 * server.history.keep):
+        upload(server, generate_building(n_ahus=n, vavs_per_ahu=2, valves_per_ahu=1))
+        client.post('/get-module-matches', json={'module_uuid': ECON})
+    job = client.get(f'/jobs/{job_id}').json['data']
+    assert job['result']['expired'] and 'matches' not in job['result']
+    # the option events still have every row
+    assert sum(len(e['data']['matches']) for e in job['events'] if e['event'] == 'option') == job['result']['counts']['matches']
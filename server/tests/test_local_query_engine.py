@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from lib.analytics_helper import AnalyticsHelper
+from lib.local_query_engine import LocalQueryEngine, SyntheticTelemetry
+
+NOW = "2024-01-08"
+COLUMNS = "project ObjectPropertyId, TimestampLocal, Value"
+
+def kql(*stages):
+    return " | ".join(("Timeseries",) + stages)
+
+def test_ago_is_relative_to_now():
+    q = LocalQueryEngine(now=NOW).parse(kql('where ObjectPropertyId in ("a", "b")', "where TimestampLocal > ago(2d)", COLUMNS))
+    assert q.sensors == ["a", "b"]
+    assert (q.start, q.end) == (pd.Timestamp("2024-01-06"), pd.Timestamp(NOW))
+
+def test_between():
+    q = LocalQueryEngine().parse(kql('where ObjectPropertyId in ("a")',
+                                     "where TimestampLocal between (datetime(2024-01-01T00:00:00) .. datetime(2024-01-01T06:00:00))"))
+    assert (q.start, q.end) == (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-01 06:00"))
+
+def test_project_selects_columns():
+    df = LocalQueryEngine(now=NOW).query("p", kql('where ObjectPropertyId in ("a")', "where TimestampLocal > ago(1h)", "project TimestampLocal, Value"))
+    assert list(df.columns) == ["TimestampLocal", "Value"]
+    assert len(df) == 61
+
+@pytest.mark.parametrize("query", [
+    "Events | where ObjectPropertyId in (\"a\") | where TimestampLocal > ago(1d)",
+    kql('where ObjectPropertyId in ("a")', "where TimestampLocal > ago(1d)", "summarize avg(Value) by ObjectPropertyId"),
+    kql('where ObjectPropertyId in ("a")'),
+])
+def test_rejects_unsupported_queries(query):
+    with pytest.raises(ValueError):
+        LocalQueryEngine(now=NOW).parse(query)
+
+def test_overlapping_windows_share_the_grid():
+    telemetry = SyntheticTelemetry(interval="5T", dropout=0.2)
+    first = telemetry.generate(["AHU0_OAT"], pd.Timestamp("2024-01-01 00:03"), pd.Timestamp("2024-01-01 12:00"))
+    second = telemetry.generate(["AHU0_OAT"], pd.Timestamp("2024-01-01 06:01"), pd.Timestamp("2024-01-01 18:00"))
+    assert (first['TimestampLocal'] % pd.Timedelta("5T").value == 0).all()
+    overlap = pd.merge(first, second, on=['ObjectPropertyId', 'TimestampLocal'])
+    assert len(overlap) > 0
+    assert (overlap['Value_x'] == overlap['Value_y']).all()
+    # the overlap is everything either window generated between 06:05 and 12:00
+    in_range = lambda df: df[(df['TimestampLocal'] >= pd.Timestamp("2024-01-01 06:05").value) & (df['TimestampLocal'] <= pd.Timestamp("2024-01-01 12:00").value)]
+    assert len(overlap) == len(in_range(first)) == len(in_range(second))
+
+def test_same_input_same_output():
+    query = kql('where ObjectPropertyId in ("AHU0_OAT", "AHU0_DAP", "VAV3_DMP")', "where TimestampLocal > ago(1d)", COLUMNS)
+    first = LocalQueryEngine(now=NOW, telemetry=SyntheticTelemetry(dropout=0.1, seed=7)).query("p", query)
+    second = LocalQueryEngine(now=NOW, telemetry=SyntheticTelemetry(dropout=0.1, seed=7)).query("p", query)
+    pd.testing.assert_frame_equal(first, second)
+    other_seed = LocalQueryEngine(now=NOW, telemetry=SyntheticTelemetry(dropout=0.1, seed=8)).query("p", query)
+    assert not first['Value'].equals(other_seed['Value'])
+
+def test_serves_the_queries_analytics_helper_emits():
+    engine = LocalQueryEngine(now=NOW)
+    ts = AnalyticsHelper.get_ts_data(["AHU0_OAT", "AHU0_DAP"], "p", engine, ago="1d", resample="15T")
+    assert list(ts['pivot'].columns) == ["AHU0_DAP", "AHU0_OAT"]
+    assert len(ts['pivot']) == 24 * 4 + 1
+    assert engine.stats == {'queries': 1, 'rows': 2 * (24 * 60 + 1)}
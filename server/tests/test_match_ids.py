@@ -0,0 +1,30 @@
+import uuid
+
+import pandas as pd
+import rdflib
+
+from lib.logic_master import match_ids
+
+EX = rdflib.Namespace("http://example.com/b#")
+
+class Option:
+    uuid = uuid.UUID("5b1f7c0e-8d2a-4c4e-9a57-0e6f3d1b2a90")
+
+def frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['?target', '?oat', '?label', '?row_id'])
+
+def test_ids_are_stable_across_row_order():
+    rows = [
+        (EX.ahu1, EX.oat1, rdflib.Literal("AHU 1"), "r1"),
+        (EX.ahu1, EX.oat1, rdflib.Literal("AHU-1"), "r2"),
+        (EX.ahu2, EX.oat2, rdflib.Literal("AHU 2"), "r3"),
+    ]
+    ids = dict(zip((r[2] for r in rows), match_ids(Option, frame(rows))))
+    reordered = rows[::-1]
+    assert dict(zip((r[2] for r in reordered), match_ids(Option, frame(reordered)))) == ids
+    assert len(set(ids.values())) == 3
+
+def test_ids_ignore_random_columns():
+    rows = [(EX.ahu1, EX.oat1, rdflib.Literal("AHU 1"), "r1")]
+    again = [(EX.ahu1, EX.oat1, rdflib.Literal("AHU 1"), "r2")]
+    assert match_ids(Option, frame(rows)) == match_ids(Option, frame(again))
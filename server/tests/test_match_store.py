@@ -0,0 +1,25 @@
+import pandas as pd
+
+from lib import match_store
+from lib.match_store import MatchStore
+from lib.modules.bmg_passing_valve import BMG_Passing_Valve_MATvsDAT
+
+def edited(option, **sparql_return):
+    """A subclass of option with some of its return clauses replaced"""
+    return type(option.__name__, (option,), {'_sparql_return': {**option._sparql_return, **sparql_return}})
+
+def test_edited_grouped_select_misses(tmp_path):
+    store = MatchStore(str(tmp_path))
+    option = BMG_Passing_Valve_MATvsDAT
+    store.set(store.key("model", "ontology", option), pd.DataFrame({'target': ["a"]}))
+    assert store.get(store.key("model", "ontology", option)) is not None
+
+    grouped = option._sparql_return["SELECT_GROUPED"].replace('separator=" "', 'separator=","')
+    assert store.get(store.key("model", "ontology", edited(option, SELECT_GROUPED=grouped))) is None
+    assert store.get(store.key("model", "ontology", edited(option, GROUP_BY="GROUP BY ?target"))) is None
+    assert store.counters['hits'] == 1 and store.counters['misses'] == 2
+
+def test_result_format_is_part_of_the_key(monkeypatch):
+    key = MatchStore.key("model", "ontology", BMG_Passing_Valve_MATvsDAT)
+    monkeypatch.setattr(match_store, "RESULT_FORMAT", match_store.RESULT_FORMAT + 1)
+    assert MatchStore.key("model", "ontology", BMG_Passing_Valve_MATvsDAT) != key
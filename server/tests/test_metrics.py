@@ -0,0 +1,46 @@
+from lib.instrumentation import Histogram, Metrics
+from lib.synthetic_building import generate_building
+
+PRESSURE = "2f1cae16-0fb0-4ae7-9edb-b7c44a8357f5"
+
+def entry(snapshot, kind, name, **labels):
+    """The histogram / counter snapshot entry with exactly these labels, or None"""
+    labels = {k: str(v) for k, v in labels.items()}
+    return next((e for e in snapshot[kind].get(name, []) if e['labels'] == labels), None)
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram(buckets=(1, 10))
+    for value in (0.5, 1, 5, 50): h.observe(value)
+    snap = h.snapshot()
+    assert snap['buckets'] == {'1': 2, '10': 3, '+Inf': 4}
+    assert (snap['count'], snap['sum'], snap['min'], snap['max'], snap['mean']) == (4, 56.5, 0.5, 50, 56.5 / 4)
+
+def test_labels_key_entries_and_none_is_dropped():
+    m = Metrics()
+    m.inc("requests", route="a")
+    m.inc("requests", 2, route="a", option=None)
+    m.inc("requests", route="b")
+    snap = m.snapshot()
+    assert entry(snap, 'counters', "requests", route="a")['value'] == 3
+    assert entry(snap, 'counters', "requests", route="b")['value'] == 1
+    m.reset()
+    assert m.snapshot() == {'histograms': {}, 'counters': {}}
+
+def test_metrics_route(server, upload):
+    client = upload(server, generate_building(n_ahus=2, vavs_per_ahu=2, valves_per_ahu=1))
+    before = client.get('/metrics').json['data']
+    requests = lambda snap: (entry(snap, 'counters', "requests", route="get_module_matches") or {'value': 0})['value']
+
+    res = client.post('/get-module-matches', json={'module_uuid': PRESSURE, 'force_rematch': True, 'timings': True}).json
+    assert 'data' in res, res
+    timings = res['meta']['timings']
+    assert timings['stages'] and timings['queries'] and timings['total_s'] > 0
+
+    after = client.get('/metrics').json['data']
+    assert requests(after) == requests(before) + 1
+    assert entry(after, 'histograms', "request_seconds", route="get_module_matches")['count'] >= 1
+    # every query the request ran is in the sparql histograms
+    ran = sum(1 for q in timings['queries'] if q['kind'] == "select")
+    selects = lambda snap: sum(e['count'] for e in snap['histograms'].get("sparql_seconds", []) if e['labels']['kind'] == "select")
+    assert selects(after) - selects(before) == ran
+    assert {'caches', 'match_store', 'target_modules'} <= after.keys()
@@ -0,0 +1,76 @@
+import math
+import time
+import pytest
+
+from lib.graph_model import load_building
+from lib.synthetic_building import generate_building
+from lib.instrumentation import request_stages
+from lib.query_helpers import select_rows
+from lib.query_budget import QueryBudget, OptionBudget, BudgetExceeded
+from lib.modules.ashrae_econ_module import MODULE, CAPABILITY_QUERY, ASHRAE_Econ_HL_Shutoff_Diff_DB
+from lib.modules.ashrae_pressure_reset_module import ASHRAE_Pressure_Trim_and_Respond
+
+@pytest.fixture(scope="module")
+def building(ontology_dataset, tmp_path_factory):
+    path = tmp_path_factory.mktemp("building") / "synth.ttl"
+    path.write_text(generate_building(n_ahus=4, vavs_per_ahu=2, valves_per_ahu=1))
+    load_building(ontology_dataset, str(path))
+    return ontology_dataset
+
+@pytest.mark.parametrize("option, kwargs", [(ASHRAE_Econ_HL_Shutoff_Diff_DB, {}), (ASHRAE_Pressure_Trim_and_Respond, {'aggregate': "store"})])
+def test_query_is_recorded_when_budget_runs_out(building, option, kwargs):
+    budget = QueryBudget(max_rows=0)
+    with request_stages("test") as req, pytest.raises(BudgetExceeded) as e:
+        with budget.option(option):
+            option.find_matches(building, **kwargs)
+    assert e.value.limit == "rows" and e.value.option == option.__name__
+    assert len(req.queries) == 1 and req.queries[0]['option'] == option.__name__
+
+def test_record_reports_once(capsys):
+    budget = QueryBudget()
+    e = BudgetExceeded("shared", "rows", 0.5, 11, max_rows=10, options=["a", "b"])
+    budget.record(e)
+    budget.record(e)
+    assert budget.exceeded == [e.record()] and e.record()['options'] == ["a", "b"]
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 1 and "the matches of a, b are left out" in out[0]
+
+def test_deadline_holds_while_no_row_arrives():
+    def stalled():
+        yield "first"
+        time.sleep(2)
+        yield "late"
+    budget = OptionBudget("stalled", seconds=0.2)
+    start = time.perf_counter()
+    with pytest.raises(BudgetExceeded) as e:
+        list(budget.rows_of(stalled()))
+    assert time.perf_counter() - start < 1 and e.value.limit == "time"
+
+def test_rows_and_errors_come_through_the_worker():
+    budget = OptionBudget("rows", seconds=10)
+    assert list(budget.rows_of(range(1000))) == list(range(1000)) and budget.rows == 1000
+    def failing():
+        yield 1
+        raise RuntimeError("store error")
+    with pytest.raises(RuntimeError, match="store error"):
+        list(OptionBudget("failing", seconds=10).rows_of(failing()))
+
+def test_shared_capability_query_has_its_own_budget(building):
+    (_, rows) = select_rows(building, CAPABILITY_QUERY)
+    total = len(list(rows))
+    options = len(MODULE.logic_modules)
+    assert total > options
+
+    # too many rows for any one option's budget, but within theirs together
+    budget = QueryBudget(max_rows=math.ceil(total / options))
+    (_, df) = MODULE.match(building, budget=budget)
+    assert budget.exceeded == [] and set(df['_logic_name']) == {o.__name__ for o in MODULE.logic_modules}
+
+    # over the sum: one overrun, the shared query's, naming the options it left without matches
+    budget = QueryBudget(max_rows=(total - 1) // options)
+    (_, df) = MODULE.match(building, budget=budget)
+    assert df.empty
+    (exceeded,) = budget.exceeded
+    assert exceeded['option'] == MODULE.__name__ and exceeded['limit'] == "rows"
+    assert exceeded['budget']['max_rows'] == (total - 1) // options * options
+    assert exceeded['options'] == [o.__name__ for o in MODULE.logic_modules]
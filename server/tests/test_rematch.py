@@ -0,0 +1,50 @@
+from lib.synthetic_building import generate_building
+
+MODULES = {
+    'econ': "3d5cae16-0fb0-4ae7-9edb-b7c44a8357f5",
+    'pressure': "2f1cae16-0fb0-4ae7-9edb-b7c44a8357f5",
+    'valve': "c6a3e65d-816f-475d-a0a0-9191d3ab556a",
+}
+
+S = "http://example.com/synthetic#"
+B = "https://brickschema.org/schema/Brick#"
+SW = "https://switchautomation.com/schemas/BrickExtension#"
+TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+# a terminal unit fed by AHU1; AHU0 loses its pressure sensor, AHU2 its econ mode point, AHU3 a valve position type
+ADD = f"""
+<{S}AHU1_VAVX> <{TYPE}> <{B}VAV> .
+<{S}AHU1> <{B}feeds> <{S}AHU1_VAVX> .
+<{S}AHU1_VAVX> <{B}hasPart> <{S}AHU1_VAVX_DMP> .
+<{S}AHU1_VAVX_DMP> <{TYPE}> <{SW}Discharge_Damper> .
+<{S}AHU1_VAVX_DMP> <{B}hasPoint> <{S}AHU1_VAVX_POS> .
+<{S}AHU1_VAVX_POS> <{TYPE}> <{B}Position_Sensor> .
+"""
+REMOVE = f"""
+<{S}AHU0> <{B}hasPoint> <{S}AHU0_DAP> .
+<{S}AHU2> <{B}hasPoint> <{S}AHU2_ECON> .
+<{S}AHU3_COIL0_VLV_POS> <{TYPE}> <{B}Position_Sensor> .
+"""
+
+# one target, matched by a single econ option: its rematch has none of the other options' columns
+ADD_ONE = f"""
+<{S}AHU0> <{B}hasPoint> <{S}AHU0_SAT> .
+<{S}AHU0_SAT> <{TYPE}> <{B}Supply_Air_Temperature_Sensor> .
+"""
+
+def test_incremental_rematch_equals_full_rematch(server, upload):
+    client = upload(server, generate_building(n_ahus=6, vavs_per_ahu=2, valves_per_ahu=2))
+
+    for add, remove in ((ADD, REMOVE), (ADD_ONE, "")):
+        before = {name: client.post('/get-module-matches', json={'module_uuid': m}).json for name, m in MODULES.items()}
+        res = client.post('/update-model', json={'add': add, 'remove': remove, 'format': 'nt'}).json
+        assert res['msg_type'] == "SUCCESS" and res['meta']['rematched'] == len(MODULES), res
+
+        for name, m in MODULES.items():
+            spliced = client.post('/get-module-matches', json={'module_uuid': m}).json
+            assert spliced['meta']['from_cache'], name
+            full = client.post('/get-module-matches', json={'module_uuid': m, 'force_rematch': True}).json
+            assert spliced['data'] == full['data'], name
+            # byte for byte: the result version hashes the serialised result
+            assert spliced['meta']['result_version'] == full['meta']['result_version'], name
+            if remove: assert spliced['meta']['result_version'] != before[name]['meta']['result_version'], name
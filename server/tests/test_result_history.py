@@ -0,0 +1,56 @@
+from lib.result_history import ResultHistory
+from lib.synthetic_building import generate_building
+
+VALVE = "c6a3e65d-816f-475d-a0a0-9191d3ab556a"
+S = "http://example.com/synthetic#"
+B = "https://brickschema.org/schema/Brick#"
+
+def records(*matches):
+    return ([{'_match_id': m, 'target': t, 'v': v} for m, t, v in matches], [{'target': t} for t in sorted({t for _, t, _ in matches})])
+
+def test_delta_between_held_versions():
+    history = ResultHistory()
+    v1 = history.record("m", *records(("a", "t1", 1), ("b", "t1", 1), ("c", "t2", 1)))
+    v2 = history.record("m", *records(("a", "t1", 1), ("b", "t1", 2), ("d", "t3", 1)))
+    delta = history.delta("m", v1, v2)
+    assert delta['matches'] == {'added': [{'_match_id': "d", 'target': "t3", 'v': 1}],
+                                'changed': [{'_match_id': "b", 'target': "t1", 'v': 2}], 'removed': ["c"]}
+    assert delta['targets'] == {'added': [{'target': "t3"}], 'changed': [], 'removed': ["t2"]}
+    assert history.delta("m", v2, v2) == {k: {'added': [], 'changed': [], 'removed': []} for k in ('matches', 'targets')}
+
+def test_version_is_content_hash():
+    history = ResultHistory()
+    v1 = history.record("m", *records(("a", "t1", 1)))
+    assert history.record("m", *records(("a", "t1", 1))) == v1
+    assert history.record("m", *records(("a", "t1", 2))) != v1
+
+def test_old_versions_age_out():
+    history = ResultHistory(keep=2)
+    versions = [history.record("m", *records(("a", "t1", i))) for i in range(3)]
+    assert history.get("m", versions[0]) is None
+    assert history.delta("m", versions[0], versions[2]) is None
+    assert history.delta("m", versions[1], versions[2]) is not None
+
+def test_module_matches_since_version(server, upload):
+    client = upload(server, generate_building(n_ahus=3, vavs_per_ahu=1, valves_per_ahu=1))
+    before = client.post('/get-module-matches', json={'module_uuid': VALVE}).json
+
+    unchanged = client.post('/get-module-matches', json={'module_uuid': VALVE, 'result_version': before['meta']['result_version']}).json
+    assert unchanged['meta']['delta_from'] == before['meta']['result_version']
+    assert not any(unchanged['data']['delta']['matches'].values())
+
+    # AHU0 loses its mixed air temperature sensor, so its valve matches go
+    edit = f"<{S}AHU0> <{B}hasPoint> <{S}AHU0_MAT> .\n"
+    assert client.post('/update-model', json={'remove': edit, 'format': 'nt'}).json['msg_type'] == "SUCCESS"
+    after = client.post('/get-module-matches', json={'module_uuid': VALVE}).json
+    delta = client.post('/get-module-matches', json={'module_uuid': VALVE, 'result_version': before['meta']['result_version']}).json
+    assert delta['meta']['result_version'] == after['meta']['result_version'] != before['meta']['result_version']
+
+    removed = {r['_match_id'] for r in before['data']['matches']} - {r['_match_id'] for r in after['data']['matches']}
+    assert removed and set(delta['data']['delta']['matches']['removed']) == removed
+    assert all(r['?target'] == f"{S}AHU0" for r in before['data']['matches'] if r['_match_id'] in removed)
+    assert delta['data']['delta']['targets']['removed'] == [f"{S}AHU0"]
+
+    # a version no longer held gets the full result
+    full = client.post('/get-module-matches', json={'module_uuid': VALVE, 'result_version': "0" * 16}).json
+    assert full['data']['matches'] == after['data']['matches'] and 'delta_from' not in full['meta']
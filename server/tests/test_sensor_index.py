@@ -0,0 +1,48 @@
+import pytest
+import rdflib
+
+from lib.sensor_index import SensorIdIndex, MissingSensorIdsError, HAS_OBJECT_PROPERTY_ID
+from lib.modules.ashrae_pressure_reset_module import ASHRAE_Pressure_Trim_and_Respond
+
+EX = rdflib.Namespace("http://example.com/b#")
+
+def id_triple(entity, sensor_id):
+    return (EX[entity], HAS_OBJECT_PROPERTY_ID, rdflib.Literal(sensor_id))
+
+def test_build_and_resolve():
+    g = rdflib.Graph()
+    g.add(id_triple("p1", "op-1"))
+    index = SensorIdIndex(g)
+    assert index.resolve([EX.p1, EX.p2]) == ({str(EX.p1): "op-1"}, [str(EX.p2)])
+
+def test_remove_falls_back_to_remaining_id():
+    index = SensorIdIndex()
+    index.add([id_triple("p1", "op-1"), id_triple("p1", "op-2")])
+    assert index.get(EX.p1) == "op-1"
+    index.remove([id_triple("p1", "op-1")])
+    assert index.get(EX.p1) == "op-2"
+    index.remove([id_triple("p1", "op-2")])
+    assert EX.p1 not in index and len(index) == 0
+
+def test_removing_other_id_keeps_current():
+    index = SensorIdIndex()
+    index.add([id_triple("p1", "op-1"), id_triple("p1", "op-2")])
+    index.remove([id_triple("p1", "op-2"), id_triple("p1", "op-3")])
+    assert index.get(EX.p1) == "op-1"
+
+def pressure_match():
+    return {'?m_b1': {EX.dap}, '?m_b2': {EX.dapsp}, '?m_b3': [{EX.dmp1}, {EX.dmp2}]}
+
+def test_pressure_prepare_match_uses_index():
+    index = SensorIdIndex()
+    index.add([id_triple(e, f"op-{e}") for e in ("dap", "dapsp", "dmp1", "dmp2")])
+    (id_map, slots) = ASHRAE_Pressure_Trim_and_Respond.prepare_match(pressure_match(), index=index)
+    assert slots == {'m_b1': "op-dap", 'm_b2': "op-dapsp", 'm_b3': ["op-dmp1", "op-dmp2"]}
+    assert len(id_map) == 4
+
+def test_pressure_prepare_match_reports_missing_together():
+    index = SensorIdIndex()
+    index.add([id_triple("dap", "op-dap")])
+    with pytest.raises(MissingSensorIdsError) as e:
+        ASHRAE_Pressure_Trim_and_Respond.prepare_match(pressure_match(), index=index)
+    assert sorted(e.value.missing) == sorted(str(EX[n]) for n in ("dapsp", "dmp1", "dmp2"))
@@ -0,0 +1,36 @@
+import pytest
+
+from lib.graph_model import load_building
+from lib.synthetic_building import generate_building
+from lib.sparql_profiler import profiling
+from lib.query_budget import QueryBudget, BudgetExceeded
+from lib.modules.ashrae_econ_module import ASHRAE_Econ_HL_Shutoff_Diff_DB
+
+@pytest.fixture(scope="module")
+def building(ontology_dataset, tmp_path_factory):
+    path = tmp_path_factory.mktemp("building") / "synth.ttl"
+    path.write_text(generate_building(n_ahus=2, vavs_per_ahu=2, valves_per_ahu=1))
+    load_building(ontology_dataset, str(path))
+    return ontology_dataset
+
+def test_profile_counts_rows(building):
+    with profiling(native=True) as session:
+        (_, df) = ASHRAE_Econ_HL_Shutoff_Diff_DB.find_matches(building)
+    (profile,) = session.profiles
+    assert profile.rows == len(df) > 0
+    assert profile.native_s is not None and "slowest" in profile.report()
+
+def test_profile_stops_at_deadline(building):
+    budget = QueryBudget(seconds=0)
+    with profiling(native=False) as session, pytest.raises(BudgetExceeded) as e:
+        with budget.option(ASHRAE_Econ_HL_Shutoff_Diff_DB):
+            ASHRAE_Econ_HL_Shutoff_Diff_DB.find_matches(building)
+    assert e.value.limit == "time" and not session.profiles
+
+def test_profile_route_reports_exceeded_options(main, server, upload, monkeypatch):
+    client = upload(server, generate_building(n_ahus=3, vavs_per_ahu=2, valves_per_ahu=1))
+    monkeypatch.setattr(main, "QUERY_BUDGET", dict(seconds=0, max_rows=None))
+    res = client.post('/profile-logic', json={'module_uuid': "3d5cae16-0fb0-4ae7-9edb-b7c44a8357f5", 'native': False}).json
+    assert res['data'] == []
+    assert {e['option'] for e in res['meta']['budget_exceeded']} == {
+        "ASHRAE_Econ_HL_Shutoff_Diff_Enthalpy", "ASHRAE_Econ_HL_Shutoff_Fixed_Enthalpy", "ASHRAE_Econ_HL_Shutoff_Diff_DB", "ASHRAE_Econ_HL_Shutoff_Fixed_DB"}
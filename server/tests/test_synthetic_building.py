@@ -0,0 +1,10 @@
+from lib.graph_model import load_building
+from lib.synthetic_building import generate_building
+import lib.modules as LogicModules
+
+def test_every_module_option_has_targets(ontology_dataset, tmp_path):
+    (tmp_path / "synth.ttl").write_text(generate_building(n_ahus=10, vavs_per_ahu=3, valves_per_ahu=2))
+    load_building(ontology_dataset, str(tmp_path / "synth.ttl"))
+    for m in (LogicModules.ashrae_econ_module.MODULE, LogicModules.ashrae_pressure_reset_module.MODULE, LogicModules.bmg_passing_valve.MODULE):
+        (_, df) = m.match(ontology_dataset)
+        assert set(df['_logic_name']) == {o.__name__ for o in m.logic_modules}, m.name
@@ -0,0 +1,64 @@
+from lib.synthetic_building import generate_building
+from lib.target_index import group_by_target, TargetModuleIndex
+
+ECON = "3d5cae16-0fb0-4ae7-9edb-b7c44a8357f5"
+S = "http://example.com/synthetic#"
+
+def test_group_by_target_keeps_order():
+    matches = [{'?target': "a", 'n': 0}, {'?target': "b", 'n': 1}, {'?target': "a", 'n': 2}]
+    assert group_by_target(matches) == {'a': [matches[0], matches[2]], 'b': [matches[1]]}
+
+def test_target_matches_paging(server, upload):
+    client = upload(server, generate_building(n_ahus=3, vavs_per_ahu=1, valves_per_ahu=1))
+    full = client.post('/get-module-matches', json={'module_uuid': ECON}).json
+    rows = [r for r in full['data']['matches'] if r['?target'] == f"{S}AHU1"]
+    assert len(rows) > 1
+
+    page = lambda **body: client.post('/get-target-matches', json={'module_uuid': ECON, 'target': f"{S}AHU1", **body}).json
+    first = page()
+    assert first['data']['matches'] == rows and first['data']['total'] == len(rows)
+    assert first['meta']['result_version'] == full['meta']['result_version']
+
+    paged = [r for offset in range(len(rows)) for r in page(offset=offset, limit=1)['data']['matches']]
+    assert paged == rows
+    assert page(offset=len(rows))['data']['matches'] == []
+    # limits are clamped to 1..1000, with 100 when not given
+    assert [page(limit=limit)['data']['limit'] for limit in (None, -5, 5000)] == [100, 1, 1000]
+    assert page(limit=1, offset=-3)['data']['offset'] == 0
+
+    unknown = client.post('/get-target-matches', json={'module_uuid': ECON, 'target': f"{S}NOPE"}).json
+    assert (unknown['data']['matches'], unknown['data']['total']) == ([], 0)
+    assert client.post('/get-target-matches', json={'module_uuid': ECON}).json['msg_type'] == "ERROR"
+    assert client.post('/get-target-matches', json={'module_uuid': "nope", 'target': f"{S}AHU1"}).json['msg_type'] == "ERROR"
+
+def test_target_module_index_replaces_a_modules_entries():
+    index = TargetModuleIndex()
+    index.update("m1", [{'?target': "a", '_match_id': "1"}, {'?target': "b", '_match_id': "2"}], "v1")
+    index.update("m2", [{'?target': "a", '_match_id': "3"}], "v1")
+    assert set(index.lookup("a")) == {"m1", "m2"}
+
+    index.update("m1", [{'?target': "b", '_match_id': "4"}], "v2")
+    assert set(index.lookup("a")) == {"m2"}
+    assert [e['_match_id'] for e in index.lookup("b")["m1"]] == ["4"]
+
+    index.discard("m2")
+    assert index.lookup("a") == {} and index.modules() == {"m1"}
+    assert index.stats() == {'targets': 1, 'modules': 1}
+
+def test_target_modules(server, upload):
+    client = upload(server, generate_building(n_ahus=3, vavs_per_ahu=1, valves_per_ahu=1))
+    target = f"{S}AHU1"
+
+    # nothing matched on a freshly uploaded model
+    res = client.post('/get-target-modules', json={'target': target}).json['data']
+    assert res['modules'] == [] and set(res['unmatched']) == set(server.db['modules'])
+
+    res = client.post('/get-target-modules', json={'target': target, 'match_missing': True}).json['data']
+    assert res['unmatched'] == [] and res['modules']
+    for module in res['modules']:
+        matches = client.post('/get-module-matches', json={'module_uuid': module['uuid']}).json['data']['matches']
+        assert [e['_match_id'] for e in module['matches']] == [r['_match_id'] for r in matches if r['?target'] == target]
+    assert ECON in {m['uuid'] for m in res['modules']}
+
+    assert client.post('/get-target-modules', json={'target': f"{S}NOPE"}).json['data']['modules'] == []
+    assert client.post('/get-target-modules', json={}).json['msg_type'] == "ERROR"
@@ -0,0 +1,122 @@
+import pytest
+import threading
+import pandas as pd
+
+from lib.telemetry_cache import TelemetryCache
+
+NOW = pd.Timestamp("2024-01-10 12:00")
+
+def remote(rows):
+    """fetch function over a fixed long frame, recording each call"""
+    calls = []
+    def fetch(ids, start, end):
+        calls.append((tuple(ids), start, end))
+        return rows.loc[rows['ObjectPropertyId'].isin(ids) & rows['TimestampLocal'].between(start, end)]
+    return fetch, calls
+
+def telemetry(sensor, start, end, freq="15T"):
+    ts = pd.date_range(start, end, freq=freq)
+    return pd.DataFrame({'ObjectPropertyId': sensor, 'TimestampLocal': ts, 'Value': range(len(ts))})
+
+def test_held_window_is_not_refetched(tmp_path):
+    fetch, calls = remote(telemetry("a", "2024-01-01", "2024-01-05"))
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    first = cache.get(["a"], "2024-01-02", "2024-01-03", fetch)
+    second = cache.get(["a"], "2024-01-02", "2024-01-03", fetch)
+    assert len(calls) == 1
+    assert len(first) == len(second) == 97
+
+def test_only_missing_part_is_fetched(tmp_path):
+    fetch, calls = remote(telemetry("a", "2024-01-01", "2024-01-05"))
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    cache.get(["a"], "2024-01-02", "2024-01-03", fetch)
+    out = cache.get(["a"], "2024-01-01", "2024-01-03", fetch)
+    assert calls[1][1:] == (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-02"))
+    assert len(out) == 193
+
+def test_unsettled_tail_is_refetched(tmp_path):
+    rows = telemetry("a", "2024-01-10 10:00", "2024-01-10 11:30")
+    fetch, calls = remote(rows.iloc[0:0])
+    cache = TelemetryCache(str(tmp_path), settle="1h", now=lambda: NOW)
+    assert cache.get(["a"], "2024-01-10", NOW, fetch).empty
+
+    # telemetry for the last hour lands late; the settled part stays held, the tail is asked for again
+    fetch, calls = remote(rows)
+    out = cache.get(["a"], "2024-01-10", NOW, fetch)
+    assert calls == [(("a",), pd.Timestamp("2024-01-10 11:00"), NOW)]
+    assert out['TimestampLocal'].min() == pd.Timestamp("2024-01-10 11:00")
+
+def test_sensor_ids_are_per_project(tmp_path):
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    p1, _ = remote(telemetry("a", "2024-01-01", "2024-01-02").assign(Value=1))
+    p2, calls = remote(telemetry("a", "2024-01-01", "2024-01-02").assign(Value=2))
+    cache.get(["a"], "2024-01-01", "2024-01-02", p1, project="p1")
+    out = cache.get(["a"], "2024-01-01", "2024-01-02", p2, project="p2")
+    assert len(calls) == 1
+    assert set(out['Value']) == {2}
+    assert set(cache.get(["a"], "2024-01-01", "2024-01-02", p1, project="p1")['Value']) == {1}
+
+def test_concurrent_gets_keep_index_consistent(tmp_path):
+    rows = pd.concat([telemetry(s, "2024-01-01", "2024-01-03") for s in "abcdefgh"])
+    fetch, calls = remote(rows)
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    errors = []
+    def worker(sensor):
+        try: cache.get([sensor], "2024-01-01", "2024-01-03", fetch)
+        except Exception as e: errors.append(e)
+    threads = [threading.Thread(target=worker, args=(s,)) for s in "abcdefgh" * 4]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert not errors
+    assert len(calls) == 8
+    assert sorted(TelemetryCache(str(tmp_path), now=lambda: NOW).index) == [f"/{s}" for s in "abcdefgh"]
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    rows = pd.concat([telemetry(s, "2024-01-01", "2024-01-03") for s in "ab"])
+    fetch, _ = remote(rows)
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    cache.get(["a"], "2024-01-01", "2024-01-03", fetch)
+    cache.max_bytes = cache.size()
+    cache.get(["b"], "2024-01-01", "2024-01-03", fetch)
+    assert list(cache.index) == ["/b"]
+    assert cache.stats['evictions'] == 1
+
+def test_fetch_runs_without_the_lock(tmp_path):
+    rows = pd.concat([telemetry(s, "2024-01-01", "2024-01-02") for s in "ab"])
+    fetch, calls = remote(rows)
+    # each fetch waits for the other to start; with the cache locked across fetch() the second could never start
+    both = threading.Barrier(2, timeout=5)
+    def slow_fetch(ids, start, end):
+        both.wait()
+        return fetch(ids, start, end)
+    cache = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    errors = []
+    def worker(sensor):
+        try: cache.get([sensor], "2024-01-01", "2024-01-02", slow_fetch)
+        except Exception as e: errors.append(e)
+    threads = [threading.Thread(target=worker, args=(s,)) for s in "ab"]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert not errors and len(calls) == 2
+
+def test_processes_sharing_the_directory_see_each_others_ranges(tmp_path):
+    rows = pd.concat([telemetry(s, "2024-01-01", "2024-01-02") for s in "ab"])
+    fetch, calls = remote(rows)
+    # two caches on one directory stand in for two server workers
+    worker1 = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    worker2 = TelemetryCache(str(tmp_path), now=lambda: NOW)
+    worker1.get(["a"], "2024-01-01", "2024-01-02", fetch)
+    worker2.get(["b"], "2024-01-01", "2024-01-02", fetch)
+    worker1.get(["a"], "2024-01-01", "2024-01-02", fetch)
+    assert len(worker2.get(["a", "b"], "2024-01-01", "2024-01-02", fetch)) == 2 * 97
+    assert len(calls) == 2
+    assert sorted(TelemetryCache(str(tmp_path), now=lambda: NOW).index) == ["/a", "/b"]
+
+def test_settle_needs_the_site_clock(tmp_path):
+    with pytest.raises(ValueError, match="local clock"):
+        TelemetryCache(str(tmp_path))
+    fetch, calls = remote(telemetry("a", "2024-01-01", "2024-01-02"))
+    cache = TelemetryCache(str(tmp_path), settle=None)
+    cache.get(["a"], "2024-01-01", "2024-01-02", fetch)
+    cache.get(["a"], "2024-01-01", "2024-01-02", fetch)
+    assert len(calls) == 1
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.local_query_engine import SyntheticTelemetry
+from lib.telemetry_ingest import ingest, to_wide
+
+def long_rows():
+    """Long format rows with gaps, a sensor that starts late, duplicate readings and an unparseable value"""
+    df = SyntheticTelemetry(interval="1T", dropout=0.3).generate(["AHU0_OAT", "AHU0_DAP", "VAV3_DMP"], pd.Timestamp("2024-01-01 05:07"), pd.Timestamp("2024-01-01 09:00"))
+    df = df[(df['ObjectPropertyId'] != "VAV3_DMP") | (df['TimestampLocal'] >= pd.Timestamp("2024-01-01 06:00").value)]
+    dupes = df.iloc[::17].assign(Value=lambda x: x['Value'] + 1)
+    df = pd.concat([df, dupes], ignore_index=True).sample(frac=1, random_state=0)
+    df['TimestampLocal'] = pd.to_datetime(df['TimestampLocal']).dt.strftime("%Y-%m-%dT%H:%M:%S")
+    df['Value'] = df['Value'].round(3).astype(str)
+    df.iloc[5, df.columns.get_loc('Value')] = "bad"
+    return df.reset_index(drop=True)
+
+def legacy_pivot(raw_df, resample=None):
+    # the pivot_table + resample get_ts_data used before the ingest pipeline
+    raw_df = raw_df.copy()
+    raw_df.index = pd.to_datetime(raw_df['TimestampLocal'])
+    raw_df['Value'] = pd.to_numeric(raw_df['Value'], errors='coerce')
+    df_pivot = raw_df.drop(['TimestampLocal'], axis=1).pivot_table(columns=['ObjectPropertyId'], values=['Value'], index=raw_df.index, aggfunc='mean')
+    df_pivot.columns = df_pivot.columns.get_level_values(1)
+    return df_pivot.resample(resample).last() if resample else df_pivot
+
+@pytest.mark.parametrize("resample", [None, "1T", "15T", "1H"])
+def test_to_wide_matches_legacy_pivot(resample):
+    raw = long_rows()
+    expected = legacy_pivot(raw, resample)
+    wide = to_wide(ingest(raw), resample)
+    pd.testing.assert_frame_equal(wide, expected, check_names=False, check_freq=False)
+
+def test_ingest_from_parsed_index():
+    raw = long_rows()
+    parsed = raw.set_index(pd.to_datetime(raw['TimestampLocal'])).drop(columns=['TimestampLocal'])
+    a, b = ingest(raw), ingest(parsed, use_index=True)
+    for field in ("ts", "values", "codes"):
+        np.testing.assert_array_equal(getattr(a, field), getattr(b, field))
+    assert a.sensors.equals(b.sensors)
+
+def test_to_wide_empty():
+    raw = pd.DataFrame({'ObjectPropertyId': ["a"], 'TimestampLocal': ["2024-01-01T00:00:00"], 'Value': ["bad"]})
+    wide = to_wide(ingest(raw), "15T")
+    assert wide.empty and list(wide.columns) == ["a"]
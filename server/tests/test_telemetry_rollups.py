@@ -0,0 +1,39 @@
+import pandas as pd
+
+from lib.telemetry_rollups import TelemetryRollups
+
+def telemetry(sensor, start, end, freq="15T"):
+    ts = pd.date_range(start, end, freq=freq)
+    # value is a function of the timestamp, so overlapping windows agree on every reading
+    return pd.DataFrame({'ObjectPropertyId': sensor, 'TimestampLocal': ts.astype(str), 'Value': ts.day * 1000.0 + ts.hour * 60 + ts.minute})
+
+def rolled(*windows, **kwargs):
+    rollups = TelemetryRollups(**kwargs)
+    for window in windows: rollups.update(telemetry(*window))
+    return rollups
+
+def test_backfill_folds_older_history():
+    r = rolled(("a", "2024-01-03", "2024-01-04"), ("a", "2024-01-01", "2024-01-04"))
+    full = rolled(("a", "2024-01-01", "2024-01-04"))
+    assert r.get("1H")["a"].notna().sum() == 73
+    for agg in TelemetryRollups.AGGREGATIONS:
+        pd.testing.assert_frame_equal(r.get("1H", agg=agg), full.get("1H", agg=agg))
+
+def test_overlapping_windows_count_once():
+    r = rolled(("a", "2024-01-01", "2024-01-02 12:00"), ("a", "2024-01-02", "2024-01-03"), ("a", "2024-01-01", "2024-01-03"))
+    full = rolled(("a", "2024-01-01", "2024-01-03"))
+    pd.testing.assert_frame_equal(r.get("1D", agg="mean"), full.get("1D", agg="mean"))
+    assert r.rollups["15T"]["count"].max() == 1
+
+def test_sensors_are_covered_separately():
+    r = rolled(("a", "2024-01-01", "2024-01-02"), ("b", "2024-01-01", "2024-01-02"))
+    assert list(r.get("1H").columns) == ["a", "b"]
+    assert r.get("1H").notna().sum().tolist() == [25, 25]
+
+def test_fine_buckets_are_evicted_behind_newest():
+    r = rolled(("a", "2024-01-01", "2024-01-10"), retain={"15T": "1D"})
+    buckets = r.rollups["15T"].index.get_level_values(1)
+    assert buckets.min() == pd.Timestamp("2024-01-09")
+    # coarser rollups keep the whole span
+    assert r.rollups["1H"].index.get_level_values(1).min() == pd.Timestamp("2024-01-01")
+    assert r.size() == sum(len(f) for f in r.rollups.values())